@@ -1,13 +1,22 @@
+import asyncio
+import threading
 from datetime import datetime
+from typing import Optional
 from app.logger import logger
 from app.emotion_scoring import emotion_classification
 from app.script_generator import generate_prompt, generate_meditation_script
 from app.tts_generator import generate_tts, align_audio_text
 from app.sound_engineer import sound_engineer_pipeline
-from app.cloud_utils import (
-    resolve_asset,
-    generate_signed_url,
-)
+from app.cloud_utils import resolve_asset
+from app.hls import signed_output_url
+from app.progress import progress
+from app.checkpoints import checkpoint_store
+
+
+class RenderCancelled(Exception):
+    """
+    The caller asked the pipeline to stop; raised at the next stage boundary.
+    """
 
 
 # The main function exposed to API
@@ -17,53 +26,102 @@ async def meditation_engine(
     meditation_type: str,
     mode: str = "tts",
     tmp_root: str = "/tmp",
+    emotion_summary: dict = None,
+    checkpoint_key: str = None,
+    cancel: Optional[threading.Event] = None,
 ) -> dict:
+    """
+    With a checkpoint_key, each finished stage is checkpointed and a retry
+    with the same key resumes after the last good stage.
+
+    Blocking stages run in worker threads (which inherit the progress job),
+    so the event loop keeps serving other requests and callers can time out.
+    Setting `cancel` stops the pipeline before its next stage; the stage in
+    flight is never interrupted, so its working files stay consistent.
+    """
     logger.info(
         f"Received inputs - duration: {duration_minutes} min, type: {meditation_type}, mode: {mode}"
     )
     logger.debug(f"Journal entry: {journal_entry}")
+    resumed = checkpoint_store.resume(checkpoint_key) if checkpoint_key else {}
+    if resumed:
+        progress.emit("resume", stages=list(resumed))
+
+    def checkpoint(stage: str, value):
+        if checkpoint_key:
+            checkpoint_store.record(checkpoint_key, stage, value)
+
+    def check_cancelled():
+        if cancel is not None and cancel.is_set():
+            raise RenderCancelled("Meditation render cancelled")
+
     try:
-        logger.info("Scoring emotions...")
-        emotion_summary = emotion_classification(journal_entry)
+        if emotion_summary is None:
+            emotion_summary = resumed.get("emotion")
+        if emotion_summary is None:
+            logger.info("Scoring emotions...")
+            emotion_summary = await asyncio.to_thread(
+                emotion_classification, journal_entry
+            )
         logger.info(f"Emotion summary: {emotion_summary}")
+        progress.emit("emotion", emotion_summary=emotion_summary)
+        checkpoint("emotion", emotion_summary)
 
-        logger.info("Building meditation prompt...")
-        prompt = generate_prompt(
-            journal_entry=journal_entry,
-            emotion_scores=emotion_summary,
-            duration_minutes=duration_minutes,
-            spiritual_path="Buddhist",  # TODO: Need more audio assets for other paths
-            meditation_type=meditation_type,
-            mode=mode,
-        )
-        logger.debug(f"Prompt: {prompt}")
-
-        try:
-            logger.info("Generating meditation script...")
-            script_path = await generate_meditation_script(
-                prompt=prompt, time=duration_minutes, tmp_root=tmp_root
+        check_cancelled()
+        script_path = resumed.get("script")
+        if script_path is None:
+            logger.info("Building meditation prompt...")
+            prompt = generate_prompt(
+                journal_entry=journal_entry,
+                emotion_scores=emotion_summary,
+                duration_minutes=duration_minutes,
+                spiritual_path="Buddhist",  # TODO: Need more audio assets for other paths
+                meditation_type=meditation_type,
+                mode=mode,
             )
-            logger.info(f"Script saved at: {script_path}")
-        except Exception as e:
-            logger.error(f"Script generation failed: {e}")
-            raise
+            logger.debug(f"Prompt: {prompt}")
+
+            try:
+                logger.info("Generating meditation script...")
+                script_path = await generate_meditation_script(
+                    prompt=prompt, time=duration_minutes, tmp_root=tmp_root
+                )
+                logger.info(f"Script saved at: {script_path}")
+            except Exception as e:
+                logger.error(f"Script generation failed: {e}")
+                raise
+            checkpoint("script", script_path)
 
         script_local = resolve_asset(script_path, tmp_root)
 
-        logger.info("Generating TTS audio...")
-        tts_path = generate_tts(script_local, tmp_root=tmp_root)
-        logger.info(f"TTS audio saved at: {tts_path}")
+        check_cancelled()
+        tts_path = resumed.get("tts")
+        if tts_path is None:
+            logger.info("Generating TTS audio...")
+            tts_path = await asyncio.to_thread(
+                generate_tts, script_local, tmp_root=tmp_root
+            )
+            logger.info(f"TTS audio saved at: {tts_path}")
+            checkpoint("tts", tts_path)
 
         tts_local = resolve_asset(tts_path, tmp_root)
 
-        logger.info("Aligning audio and text...")
-        alignment_path = align_audio_text(tts_local, script_local, tmp_root=tmp_root)
-        logger.info(f"Alignment JSON saved at: {alignment_path}")
-        alignment_local = resolve_asset(alignment_path)
+        check_cancelled()
+        alignment_path = resumed.get("alignment")
+        if alignment_path is None:
+            logger.info("Aligning audio and text...")
+            alignment_path = await asyncio.to_thread(
+                align_audio_text, tts_local, script_local, tmp_root=tmp_root
+            )
+            logger.info(f"Alignment JSON saved at: {alignment_path}")
+            checkpoint("alignment", alignment_path)
+        alignment_local = resolve_asset(alignment_path, tmp_root)
 
+        check_cancelled()
         logger.info("Sound engineering final meditation...")
         output_filename = f"final_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp3"
-        final_mix_path = sound_engineer_pipeline(
+        final_mix_path = await asyncio.to_thread(
+            sound_engineer_pipeline,
             tts_path=tts_local,
             alignment_json_path=alignment_local,
             emotion_summary=emotion_summary,
@@ -72,9 +130,11 @@ async def meditation_engine(
         )
         final_signed_url = None
         if final_mix_path.startswith("gs://"):
-            final_signed_url = generate_signed_url(final_mix_path)
+            final_signed_url = signed_output_url(final_mix_path)
             logger.info(f"Final mix saved at: {final_mix_path}")
         logger.info("Medition generation pipeline finished successfully.")
+        if checkpoint_key:
+            checkpoint_store.clear(checkpoint_key)
         # Clean Up local files
         return {
             "final_signed_url": final_signed_url
@@ -88,6 +148,11 @@ async def meditation_engine(
             "alignment_path": alignment_path,
         }
 
+    except RenderCancelled:
+        logger.info("Meditation pipeline cancelled before its next stage")
+        raise
     except Exception as e:
         logger.error(f"Error generating meditation: {e}", exc_info=True)
+        if checkpoint_key:
+            checkpoint_store.failed(checkpoint_key)
         raise
@@ -1,9 +1,13 @@
 import uuid
+import asyncio
+import threading
 import tempfile
 import os
+from typing import Optional
 from app.logger import logger
 from api.engine import meditation_engine
-from fastapi import FastAPI, HTTPException, Header
+from fastapi import FastAPI, HTTPException, Header, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from api.schemas import (
     MeditationRequest,
     MeditationResponse,
@@ -11,14 +15,49 @@ from api.schemas import (
     FeedbackResponse,
 )
 from app.cache_utils import (
+    cacheable,
     generate_cache_key,
     save_to_cache,
     load_from_cache,
+    build_remote_key_filter,
+    find_similar_cached,
+    index_for_similarity,
+    similarity_index,
+    cache_index,
+    sweep_cache,
 )
+from app.emotion_scoring import emotion_classification
 from app.cloud_utils import clean_up_tmp_folder
+from app.upload_manager import upload_manager
+from app.parallel_render import parallel_renderer
+from app.hls import render_pending, wait_for_render
+from app.progress import progress
+from app.library import meditation_library
+from app.checkpoints import checkpoint_store
+from app.janitor import tmp_janitor
+from app.storage import get_storage
+from app.asset_cache import asset_cache
+from app.bed_cache import bed_cache
+from app.chime_bank import chime_bank
+from app.asset_compiler import ensure_pcm_store
+from app.asset_index import load_asset_index
 
 from fastapi.middleware.cors import CORSMiddleware
-from config.params import API_KEY
+from config.params import (
+    API_KEY,
+    ASSET_PRELOAD,
+    BED_PRELOAD,
+    PCM_STORE_ENABLED,
+    CACHE_FILTER_ENABLED,
+    CACHE_FILTER_REFRESH_SECONDS,
+    CACHE_SIMILARITY_ENABLED,
+    CACHE_SWEEP_INTERVAL_SECONDS,
+    IS_PROD,
+    LIBRARY_ENABLED,
+    LIBRARY_LATENCY_BUDGET_SECONDS,
+    SIMILARITY_FLUSH_SECONDS,
+    TMP_JANITOR_INTERVAL_SECONDS,
+)
 
 app = FastAPI()
 
@@ -31,14 +70,165 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+async def preload_audio_assets():
+    # Load storage credentials (and the URL signing key) before the first request
+    await asyncio.to_thread(get_storage().warm)
+    if PCM_STORE_ENABLED:
+        try:
+            await asyncio.to_thread(ensure_pcm_store)
+        except Exception as e:
+            logger.warning(f"PCM asset store unavailable, decoding per worker: {e}")
+    await asyncio.to_thread(load_asset_index)
+    if ASSET_PRELOAD:
+        await asyncio.to_thread(asset_cache.preload)
+        await asyncio.to_thread(chime_bank.preload)
+    unconverted = await asyncio.to_thread(asset_cache.unconverted)
+    if unconverted:
+        logger.warning(
+            f"{len(unconverted)} assets are not held in the canonical format and "
+            f"will be converted while mixing: {unconverted}"
+        )
+    if BED_PRELOAD:
+        # Render (or map) each emotion profile's background bed up front
+        await asyncio.to_thread(bed_cache.prebuild)
+    if CACHE_SIMILARITY_ENABLED:
+        await asyncio.to_thread(similarity_index.load)
+    if LIBRARY_ENABLED:
+        await asyncio.to_thread(meditation_library.load)
+
+
+async def refresh_cache_key_filter():
+    """
+    Rebuild the remote cache key filter periodically, so entries written by
+    other workers or instances become visible.
+    """
+    while True:
+        try:
+            await asyncio.to_thread(build_remote_key_filter)
+        except Exception as e:
+            logger.warning(f"Could not build cache key filter: {e}")
+        await asyncio.sleep(CACHE_FILTER_REFRESH_SECONDS)
+
+
+@app.on_event("startup")
+async def start_cache_key_filter():
+    if CACHE_FILTER_ENABLED:
+        app.state.cache_filter_task = asyncio.create_task(refresh_cache_key_filter())
+
+
+async def run_cache_sweeper():
+    """
+    Background sweeper: TTL, size budget and orphaned artifacts.
+    """
+    try:
+        await asyncio.to_thread(cache_index.load)
+    except Exception as e:
+        logger.warning(f"Could not load cache index: {e}")
+    while True:
+        await asyncio.sleep(CACHE_SWEEP_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(sweep_cache)
+        except Exception as e:
+            logger.warning(f"Cache sweep failed: {e}")
+
+
+@app.on_event("startup")
+async def start_cache_sweeper():
+    if IS_PROD:
+        app.state.cache_sweeper_task = asyncio.create_task(run_cache_sweeper())
+
+
+async def flush_similarity_index():
+    """
+    Persist entries indexed since the last flush, off the request path.
+    """
+    while True:
+        await asyncio.sleep(SIMILARITY_FLUSH_SECONDS)
+        try:
+            await asyncio.to_thread(similarity_index.flush)
+        except Exception as e:
+            logger.warning(f"Could not flush similarity index: {e}")
+
+
+@app.on_event("startup")
+async def start_similarity_flush():
+    if CACHE_SIMILARITY_ENABLED:
+        app.state.similarity_flush_task = asyncio.create_task(flush_similarity_index())
+
+
+async def run_tmp_janitor():
+    """
+    Reclaim temp dirs of requests that died without cleaning up, and expired
+    stage checkpoints.
+    """
+    while True:
+        try:
+            await asyncio.to_thread(tmp_janitor.sweep)
+            await asyncio.to_thread(checkpoint_store.prune)
+        except Exception as e:
+            logger.warning(f"Temp janitor failed: {e}")
+        await asyncio.sleep(TMP_JANITOR_INTERVAL_SECONDS)
+
+
+@app.on_event("startup")
+async def start_tmp_janitor():
+    app.state.tmp_janitor_task = asyncio.create_task(run_tmp_janitor())
+
+
+@app.on_event("shutdown")
+async def flush_uploads():
+    await asyncio.to_thread(upload_manager.shutdown)
+
+
+@app.on_event("shutdown")
+async def save_similarity_index():
+    if CACHE_SIMILARITY_ENABLED:
+        await asyncio.to_thread(similarity_index.flush)
+
+
+@app.on_event("shutdown")
+async def stop_render_workers():
+    await asyncio.to_thread(parallel_renderer.shutdown)
+
+
+def clean_up_after_uploads(tmp_root: str) -> bool:
+    """
+    Runs after the response is sent: wait for this request's queued uploads, then drop tmp_root.
+    Returns False if any upload failed.
+    """
+    uploaded = upload_manager.wait_for_dir(tmp_root)
+    clean_up_tmp_folder(tmp_root)
+    tmp_janitor.release(tmp_root)
+    return uploaded
+
+
 @app.post("/meditate", response_model=MeditationResponse)
 async def meditate(
     body: MeditationRequest,
+    background_tasks: BackgroundTasks,
     api_key: str = Header(None, alias="x-api-key"),
 ):
     if api_key != API_KEY:
         raise HTTPException(status_code=403, detail="Unauthorized")
 
+    request_id = str(uuid.uuid4())
+    job_id = body.job_id or request_id
+    with progress.job_scope(job_id):
+        try:
+            return await run_meditation(body, background_tasks, job_id, request_id)
+        except BaseException:
+            # No-op if the job already reported how it ended
+            progress.finish(job_id, error="Failed to generate meditation")
+            raise
+
+
+async def run_meditation(
+    body: MeditationRequest,
+    background_tasks: BackgroundTasks,
+    job_id: str,
+    request_id: str,
+) -> dict:
     cache_key = generate_cache_key(
         body.journal_entry, body.duration_minutes, body.meditation_type
     )
@@ -46,39 +236,243 @@ async def meditate(
     cached = load_from_cache(cache_key)
     if cached:
         logger.info("Serving meditation from cache")
-        return cached
+        progress.finish(
+            job_id, cached=True, final_signed_url=cached.get("final_signed_url")
+        )
+        return {**cached, "job_id": job_id}
+
+    # The library needs the emotions up front to pick a fallback
+    use_library = LIBRARY_ENABLED and len(meditation_library) > 0
+    emotion_summary = None
+    if CACHE_SIMILARITY_ENABLED or use_library:
+        emotion_summary = await asyncio.to_thread(
+            emotion_classification, body.journal_entry
+        )
+    if CACHE_SIMILARITY_ENABLED:
+        similar = find_similar_cached(
+            body.journal_entry,
+            body.duration_minutes,
+            body.meditation_type,
+            emotion_summary,
+        )
+        if similar:
+            logger.info("Serving near-duplicate meditation from cache")
+            progress.emit("emotion", emotion_summary=emotion_summary)
+            progress.finish(
+                job_id, cached=True, final_signed_url=similar.get("final_signed_url")
+            )
+            return {**similar, "job_id": job_id}
 
-    request_id = str(uuid.uuid4())
     tmp_root = os.path.join(tempfile.gettempdir(), f"minday-{request_id}")
     os.makedirs(tmp_root, exist_ok=True)
+    tmp_janitor.track(tmp_root)
 
-    try:
-        result = await meditation_engine(
+    cancel = threading.Event()
+    engine = asyncio.ensure_future(
+        meditation_engine(
             journal_entry=body.journal_entry,
             duration_minutes=body.duration_minutes,
             meditation_type=body.meditation_type,
             mode=body.mode,
             tmp_root=tmp_root,
+            emotion_summary=emotion_summary,
+            # A retry of the same request resumes after the last good stage
+            checkpoint_key=f"{cache_key}_{body.mode}",
+            cancel=cancel,
         )
-    except ValueError as e:
-        if str(e) == "threshold_unmet":
-            return MeditationResponse(status="error", reason="threshold_unmet")
-        raise HTTPException(status_code=500, detail="Failed to generate script")
+    )
+    if use_library and LIBRARY_LATENCY_BUDGET_SECONDS > 0:
+        # Every pipeline stage runs off the event loop, so the budget can
+        # fire at any point of the render
+        done, _ = await asyncio.wait({engine}, timeout=LIBRARY_LATENCY_BUDGET_SECONDS)
+        if not done:
+            fallback = library_fallback(body, emotion_summary, job_id)
+            if fallback is not None:
+                logger.info(
+                    f"Personalized meditation exceeded its {LIBRARY_LATENCY_BUDGET_SECONDS}s "
+                    f"budget; serving {fallback['library_key']} from the library"
+                )
+                if body.upgrade:
+                    background_tasks.add_task(
+                        upgrade_when_rendered, engine, cache_key, body, job_id, tmp_root
+                    )
+                else:
+                    progress.finish(job_id, **fallback_progress(fallback))
+                    background_tasks.add_task(discard_render, engine, cancel, tmp_root)
+                return fallback
+
+    try:
+        result = await engine
     except Exception as e:
+        fallback = (
+            library_fallback(body, emotion_summary, job_id) if use_library else None
+        )
+        if fallback is not None:
+            logger.warning(
+                f"Meditation pipeline failed ({e}); serving {fallback['library_key']} "
+                "from the library"
+            )
+            progress.finish(job_id, **fallback_progress(fallback))
+            background_tasks.add_task(clean_up_after_uploads, tmp_root)
+            return fallback
+        # Error responses skip background tasks; clean up independently
+        asyncio.get_running_loop().run_in_executor(
+            None, clean_up_after_uploads, tmp_root
+        )
+        if isinstance(e, ValueError):
+            progress.finish(job_id, error=str(e))
+            if str(e) == "threshold_unmet":
+                return MeditationResponse(status="error", reason="threshold_unmet")
+            raise HTTPException(status_code=500, detail="Failed to generate script")
         logger.error(f"API error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to generate meditation")
 
-    # Cache only raw GCS paths and emotion summary, omitting final_signed_url
-    to_cache = {
-        "final_audio_path": result["final_audio_path"],
-        "emotion_summary": result["emotion_summary"],
-        "script_path": result["script_path"],
-        "tts_path": result["tts_path"],
-        "alignment_path": result["alignment_path"],
+    cache_args = (cache_key, cacheable(result), body)
+    if render_pending(result["final_audio_path"]):
+        # HLS output: the rest of the session is still rendering; cache it
+        # (and keep tmp_root) only once it is complete
+        progress.emit("ready", final_signed_url=result["final_signed_url"])
+        background_tasks.add_task(cache_when_rendered, *cache_args, job_id, tmp_root)
+    else:
+        progress.finish(job_id, final_signed_url=result["final_signed_url"])
+        background_tasks.add_task(cache_after_uploads, *cache_args, tmp_root)
+    return {**result, "job_id": job_id}
+
+
+def library_fallback(
+    body: MeditationRequest, emotion_summary: Optional[dict], job_id: str
+) -> Optional[dict]:
+    """
+    Closest pre-generated meditation for the request, as a response, or None.
+    """
+    match = meditation_library.closest(
+        body.meditation_type, body.duration_minutes, emotion_summary
+    )
+    if match is None:
+        return None
+    progress.emit("fallback", **fallback_progress(match))
+    return {**match, "job_id": job_id}
+
+
+def fallback_progress(fallback: dict) -> dict:
+    return {
+        "fallback": True,
+        "library_key": fallback["library_key"],
+        "final_signed_url": fallback["final_signed_url"],
     }
+
+
+async def upgrade_when_rendered(
+    engine: asyncio.Future,
+    cache_key: str,
+    body: MeditationRequest,
+    job_id: str,
+    tmp_root: str,
+):
+    """
+    After a library fallback: let the personalized render finish, cache it and
+    announce it as an "upgrade" progress event.
+    """
+    try:
+        result = await engine
+    except Exception as e:
+        logger.warning(f"Personalized meditation failed after library fallback: {e}")
+        progress.finish(job_id, error="Failed to generate meditation")
+        await asyncio.to_thread(clean_up_after_uploads, tmp_root)
+        return
+
+    # Runs after meditate() left the job scope: name the job explicitly
+    progress.emit(
+        "upgrade",
+        job_id,
+        final_signed_url=result["final_signed_url"],
+        final_audio_path=result["final_audio_path"],
+    )
+    cache_args = (cache_key, cacheable(result), body)
+    if render_pending(result["final_audio_path"]):
+        await asyncio.to_thread(cache_when_rendered, *cache_args, job_id, tmp_root)
+    else:
+        progress.finish(job_id, final_signed_url=result["final_signed_url"])
+        await asyncio.to_thread(cache_after_uploads, *cache_args, tmp_root)
+
+
+async def discard_render(
+    engine: asyncio.Future, cancel: threading.Event, tmp_root: str
+):
+    """
+    Stop a render nobody will use at its next stage. Cancelling the task would
+    leave its stage threads running, so wait for the stage in flight (and a
+    background HLS render it started) before removing tmp_root.
+    """
+    cancel.set()
+    result = (await asyncio.gather(engine, return_exceptions=True))[0]
+    if isinstance(result, dict) and render_pending(result["final_audio_path"]):
+        await asyncio.to_thread(wait_for_render, result["final_audio_path"])
+    await asyncio.to_thread(clean_up_after_uploads, tmp_root)
+
+
+def cache_result(cache_key: str, to_cache: dict, body: MeditationRequest):
     save_to_cache(cache_key, to_cache)
-    clean_up_tmp_folder(tmp_root)
-    return result
+    index_for_similarity(
+        cache_key,
+        body.journal_entry,
+        body.duration_minutes,
+        body.meditation_type,
+        to_cache["emotion_summary"],
+    )
+
+
+def cache_after_uploads(
+    cache_key: str, to_cache: dict, body: MeditationRequest, tmp_root: str
+):
+    """
+    Cache the result only once every artifact it references has been
+    uploaded, so an entry never points at a missing object.
+    """
+    if clean_up_after_uploads(tmp_root):
+        cache_result(cache_key, to_cache, body)
+    else:
+        logger.warning(f"Artifact uploads for {cache_key} failed; not cached")
+
+
+def cache_when_rendered(
+    cache_key: str,
+    to_cache: dict,
+    body: MeditationRequest,
+    job_id: str,
+    tmp_root: str,
+):
+    if wait_for_render(to_cache["final_audio_path"]):
+        progress.finish(job_id)
+        cache_after_uploads(cache_key, to_cache, body, tmp_root)
+    else:
+        logger.warning(f"Render of {to_cache['final_audio_path']} failed; not cached")
+        progress.finish(job_id, error="Render failed")
+        clean_up_after_uploads(tmp_root)
+
+
+@app.get("/meditate/{job_id}/events")
+async def meditation_events(
+    job_id: str, api_key: str = Header(None, alias="x-api-key")
+):
+    """
+    Server-sent progress events for a meditation job, history first. The
+    stream ends after a "done" or "error" event.
+    """
+    if api_key != API_KEY:
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    return StreamingResponse(
+        progress.sse(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/cache/stats")
+async def cache_stats(api_key: str = Header(None, alias="x-api-key")):
+    if api_key != API_KEY:
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    return {"similarity": similarity_index.report()}
 
 
 @app.post("/feedback", response_model=FeedbackResponse)
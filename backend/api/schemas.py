@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Literal
+from typing import Literal, Optional
 
 
 class MeditationRequest(BaseModel):
@@ -15,6 +15,11 @@ class MeditationRequest(BaseModel):
         "focus reset",
     ]
     mode: Literal["tts", "dev"] = "tts"
+    # Client-chosen id to follow progress at GET /meditate/{job_id}/events
+    job_id: Optional[str] = None
+    # After a library fallback, keep rendering the personalized meditation
+    # and announce it on the job's progress events
+    upgrade: bool = True
 
 
 class MeditationResponse(BaseModel):
@@ -24,6 +29,10 @@ class MeditationResponse(BaseModel):
     script_path: str
     tts_path: str
     alignment_path: str
+    job_id: Optional[str] = None
+    # Set when a pre-generated library meditation was served instead
+    fallback: bool = False
+    library_key: Optional[str] = None
 
 
 class FeedbackRequest(BaseModel):
@@ -0,0 +1,331 @@
+import os
+import json
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Optional
+from pydub import AudioSegment
+from app.logger import logger
+from app.cloud_utils import fetch_from_gcs, get_gcs_generation
+from app.pcm_store import get_pcm_store
+from app.mixer import is_canonical, to_array, to_canonical
+from config.emotion_to_audio import EMOTION_TO_AUDIO
+from config.params import (
+    AUDIO_ROOT,
+    IS_PROD,
+    GCP_AUDIO_BUCKET,
+    ASSET_CACHE_DIR,
+    ASSET_CACHE_MAX_BYTES,
+    ASSET_REVALIDATE_SECONDS,
+)
+
+
+class AssetCache:
+    """
+    Process-wide cache of decoded audio assets.
+
+    Tier 1 is a size-bounded LRU of decoded AudioSegments in memory, converted
+    to the canonical PCM format when they are decoded.
+    Tier 2 (prod only) is a local disk copy under ASSET_CACHE_DIR that outlives requests.
+    Both tiers are revalidated against the GCS object generation every
+    ASSET_REVALIDATE_SECONDS; in dev the file mtime plays the same role.
+    When the compiled PCM store is mapped, assets it contains are served
+    from it directly and skip both tiers, as long as the source version the
+    store was compiled from is still current (checked on the same schedule);
+    a changed source is served through the tiers until the store is recompiled.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = ASSET_CACHE_MAX_BYTES,
+        revalidate_seconds: int = ASSET_REVALIDATE_SECONDS,
+    ):
+        self.max_bytes = max_bytes
+        self.revalidate_seconds = revalidate_seconds
+        self._entries = OrderedDict()  # rel_path -> [audio, version, checked_at]
+        self._manifests = {}  # folder -> [files, version, checked_at]
+        self._store_checks = {}  # rel_path -> [store data_file, fresh, checked_at]
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+    # --- public API ---
+
+    def get(self, rel_path: str) -> AudioSegment:
+        rel_path = _normalize_rel_path(rel_path)
+        store = get_pcm_store()
+        if self._store_serves(store, rel_path):
+            return store.get_segment(rel_path)
+
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(rel_path)
+            if entry is not None and now - entry[2] < self.revalidate_seconds:
+                self._entries.move_to_end(rel_path)
+                return entry[0]
+
+        version = self._current_version(rel_path, stale=entry)
+        with self._lock:
+            entry = self._entries.get(rel_path)
+            if entry is not None and entry[1] == version:
+                entry[2] = now
+                self._entries.move_to_end(rel_path)
+                return entry[0]
+
+        local_path = self._materialize(rel_path, version)
+        # Converted once on the way in, so mixing never resamples
+        audio = to_canonical(AudioSegment.from_file(local_path))
+        self._store(rel_path, audio, version, now)
+        return audio
+
+    def get_array(self, rel_path: str) -> np.ndarray:
+        """
+        Float32 (frames, channels) copy of an asset in the canonical format,
+        safe for the mixer to modify in place.
+        """
+        rel_path = _normalize_rel_path(rel_path)
+        store = get_pcm_store()
+        if self._store_serves(store, rel_path):
+            return store.get_array(rel_path).astype(np.float32)
+        return to_array(self.get(rel_path))
+
+    def version(self, rel_path: str) -> Optional[str]:
+        """
+        Version token of the asset as currently served (the PCM store build, or
+        the source generation/mtime), for keying data derived from it.
+        None if the asset is too large to stay in the memory tier.
+        """
+        rel_path = _normalize_rel_path(rel_path)
+        store = get_pcm_store()
+        if self._store_serves(store, rel_path):
+            return store.data_file
+        self.get(rel_path)
+        with self._lock:
+            entry = self._entries.get(rel_path)
+        return str(entry[1]) if entry is not None else None
+
+    def load_source(self, rel_path: str) -> AudioSegment:
+        """
+        Decode an asset straight from its source, bypassing the PCM store and
+        the memory tier. Used by the asset compiler.
+        """
+        rel_path = _normalize_rel_path(rel_path)
+        version = self._current_version(rel_path)
+        return AudioSegment.from_file(self._materialize(rel_path, version))
+
+    def source_version(self, rel_path: str):
+        """
+        Current version of an asset's source: GCS generation in prod, mtime in dev.
+        """
+        return self._current_version(_normalize_rel_path(rel_path))
+
+    def get_manifest(self, folder: str) -> list:
+        """
+        Return the list of chime filenames for an interchime folder.
+        """
+        rel_path = _normalize_rel_path(f"chimes/{folder}/manifest.json")
+        store = get_pcm_store()
+        if (
+            store is not None
+            and folder in store.manifests
+            and self._store_current(
+                store, rel_path, store.manifest_versions.get(folder)
+            )
+        ):
+            return list(store.manifests[folder])
+
+        now = time.time()
+
+        with self._lock:
+            entry = self._manifests.get(folder)
+            if entry is not None and now - entry[2] < self.revalidate_seconds:
+                return list(entry[0])
+
+        version = self._current_version(rel_path, stale=entry)
+        if entry is not None and entry[1] == version:
+            entry[2] = now
+            return list(entry[0])
+
+        with open(self._materialize(rel_path, version), "r") as mf:
+            files = json.load(mf)
+        with self._lock:
+            self._manifests[folder] = [files, version, now]
+        return list(files)
+
+    def preload(self) -> int:
+        """
+        Warm the cache with every asset referenced by EMOTION_TO_AUDIO.
+        Returns the number of assets loaded.
+        """
+        loaded = 0
+        store = get_pcm_store()
+        for rel_path in emotion_asset_paths(self):
+            if self._store_serves(store, _normalize_rel_path(rel_path)):
+                continue
+            try:
+                self.get(rel_path)
+                loaded += 1
+            except Exception as e:
+                logger.warning(f"Could not preload asset {rel_path}: {e}")
+        logger.info(
+            f"Preloaded {loaded} audio assets ({self._bytes / (1024 * 1024):.1f} MB in memory)"
+        )
+        return loaded
+
+    def unconverted(self) -> list:
+        """
+        Assets referenced by EMOTION_TO_AUDIO that would be decoded and converted
+        on the mixing path: neither in the PCM store nor held canonical in memory.
+        """
+        store = get_pcm_store()
+        missing = []
+        for rel_path in emotion_asset_paths(self):
+            rel_path = _normalize_rel_path(rel_path)
+            if self._store_serves(store, rel_path):
+                continue
+            with self._lock:
+                entry = self._entries.get(rel_path)
+            if entry is None or not is_canonical(entry[0]):
+                missing.append(rel_path)
+        return missing
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._manifests.clear()
+            self._store_checks.clear()
+            self._bytes = 0
+
+    # --- internals ---
+
+    def _store_serves(self, store, rel_path: str) -> bool:
+        return (
+            store is not None
+            and rel_path in store
+            and self._store_current(store, rel_path, store.versions.get(rel_path))
+        )
+
+    def _store_current(self, store, rel_path: str, compiled) -> bool:
+        """
+        True if the source of rel_path is still at the version the PCM store
+        compiled. Rechecked every revalidate_seconds; if the lookup fails the
+        store copy keeps being served, like a stale tier entry.
+        """
+        now = time.time()
+        with self._lock:
+            check = self._store_checks.get(rel_path)
+            if (
+                check is not None
+                and check[0] == store.data_file
+                and now - check[2] < self.revalidate_seconds
+            ):
+                return check[1]
+
+        try:
+            current = compiled is not None and (
+                self._current_version(rel_path, stale=[None, compiled]) == compiled
+            )
+        except FileNotFoundError:
+            current = False
+        if not current and (check is None or check[1]):
+            logger.warning(
+                f"PCM store copy of {rel_path} is outdated; serving it from source"
+            )
+        with self._lock:
+            self._store_checks[rel_path] = [store.data_file, current, now]
+        return current
+
+    def _current_version(self, rel_path: str, stale: Optional[list] = None):
+        """
+        Return the source version of an asset: GCS generation in prod, mtime in dev.
+        If the lookup fails and a stale copy exists, keep serving the stale version.
+        """
+        try:
+            if IS_PROD:
+                generation = get_gcs_generation(_gcs_uri(rel_path))
+                if generation is None:
+                    raise FileNotFoundError(f"GCS asset does not exist: {rel_path}")
+                return generation
+            return os.path.getmtime(os.path.join(AUDIO_ROOT, rel_path))
+        except FileNotFoundError:
+            raise
+        except Exception as e:
+            if stale is None:
+                raise
+            logger.warning(f"Revalidation failed for {rel_path}, serving cached: {e}")
+            return stale[1]
+
+    def _materialize(self, rel_path: str, version) -> str:
+        """
+        Return a local file for the asset at the given version, downloading
+        into the disk tier if it is missing or outdated.
+        """
+        if not IS_PROD:
+            return os.path.join(AUDIO_ROOT, rel_path)
+
+        disk_path = os.path.join(ASSET_CACHE_DIR, rel_path)
+        meta_path = f"{disk_path}.meta.json"
+        try:
+            with open(meta_path, "r") as f:
+                if json.load(f).get("generation") == version and os.path.exists(
+                    disk_path
+                ):
+                    return disk_path
+        except (OSError, ValueError):
+            pass
+
+        os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+        # Download beside the target and rename, so concurrent workers never read a partial file
+        tmp_path = f"{disk_path}.{os.getpid()}.{threading.get_ident()}.part"
+        fetch_from_gcs(_gcs_uri(rel_path), tmp_path)
+        os.replace(tmp_path, disk_path)
+        with open(meta_path, "w") as f:
+            json.dump({"generation": version}, f)
+        return disk_path
+
+    def _store(self, rel_path: str, audio: AudioSegment, version, now: float):
+        size = len(audio.raw_data)
+        with self._lock:
+            old = self._entries.pop(rel_path, None)
+            if old is not None:
+                self._bytes -= len(old[0].raw_data)
+            if size > self.max_bytes:
+                logger.warning(
+                    f"Asset {rel_path} ({size} bytes) exceeds cache budget; not cached"
+                )
+                return
+            self._entries[rel_path] = [audio, version, now]
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                evicted, (evicted_audio, _, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted_audio.raw_data)
+                logger.debug(f"Evicted asset from memory cache: {evicted}")
+
+
+def _normalize_rel_path(rel_path: str) -> str:
+    full_path = os.path.normpath(os.path.join(AUDIO_ROOT, rel_path))
+    return os.path.relpath(full_path, AUDIO_ROOT)
+
+
+def _gcs_uri(rel_path: str) -> str:
+    return f"gs://{GCP_AUDIO_BUCKET}/{rel_path.replace(os.sep, '/')}"
+
+
+def emotion_asset_paths(cache: AssetCache) -> list:
+    paths = []
+    for entry in EMOTION_TO_AUDIO.values():
+        paths.append(os.path.join("soundscapes", entry["ambient"]))
+        paths.append(os.path.join("tones", entry["tone"]))
+        paths.append(os.path.join("chimes", entry["start_chime"]))
+        paths.append(os.path.join("chimes", entry["end_chime"]))
+        folder = entry["interchimes"]
+        try:
+            for filename in cache.get_manifest(folder):
+                paths.append(os.path.join("chimes", folder, filename))
+        except Exception as e:
+            logger.warning(f"Could not read chime manifest for {folder}: {e}")
+    return list(dict.fromkeys(paths))
+
+
+asset_cache = AssetCache()
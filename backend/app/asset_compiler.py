@@ -0,0 +1,191 @@
+import os
+import sys
+import json
+import time
+import fcntl
+from app.logger import logger
+from app.asset_cache import asset_cache
+from app.cloud_utils import list_gcs
+from app.mixer import to_canonical
+from app.pcm_store import (
+    PCM_DATA_FILENAME,
+    PCM_INDEX_FILENAME,
+    get_pcm_store,
+    reset_pcm_store,
+)
+from config.params import (
+    IS_PROD,
+    AUDIO_ROOT,
+    PCM_STORE_DIR,
+    PCM_SAMPLE_RATE,
+    PCM_CHANNELS,
+    PCM_SAMPLE_WIDTH,
+)
+
+ASSET_FOLDERS = ["soundscapes", "tones", "chimes"]
+
+
+def list_library_assets() -> tuple:
+    """
+    Return (audio_paths, manifest_folders) for every soundscape, tone, chime
+    and interchime folder in the library, relative to AUDIO_ROOT.
+    """
+    if IS_PROD:
+        names = []
+        for folder in ASSET_FOLDERS:
+            names.extend(list_gcs(f"{folder}/"))
+    else:
+        names = []
+        for folder in ASSET_FOLDERS:
+            for dirpath, _, filenames in os.walk(os.path.join(AUDIO_ROOT, folder)):
+                for filename in filenames:
+                    rel = os.path.relpath(os.path.join(dirpath, filename), AUDIO_ROOT)
+                    names.append(rel.replace(os.sep, "/"))
+
+    audio_paths = sorted(n for n in names if n.lower().endswith(".wav"))
+    manifest_folders = sorted(
+        n.split("/")[1]
+        for n in names
+        if n.startswith("chimes/") and n.endswith("/manifest.json") and n.count("/") == 2
+    )
+    return audio_paths, manifest_folders
+
+
+def compile_pcm_store(store_dir: str = PCM_STORE_DIR) -> dict:
+    """
+    Convert every library asset to the canonical PCM format and write the
+    flat data file plus index.json into store_dir. Returns the index.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    audio_paths, manifest_folders = list_library_assets()
+
+    build_id = time.strftime("%Y%m%d_%H%M%S")
+    data_filename = PCM_DATA_FILENAME.replace(".pcm", f"_{build_id}.pcm")
+    data_path = os.path.join(store_dir, data_filename)
+    frame_width = PCM_CHANNELS * PCM_SAMPLE_WIDTH
+
+    assets = {}
+    versions = {}
+    offset = 0
+    with open(f"{data_path}.part", "wb") as out:
+        for rel_path in audio_paths:
+            try:
+                # Read before decoding: a source replaced meanwhile shows up as outdated
+                versions[os.path.normpath(rel_path)] = asset_cache.source_version(
+                    rel_path
+                )
+                audio = asset_cache.load_source(rel_path)
+            except Exception as e:
+                logger.warning(f"Skipping asset {rel_path}: {e}")
+                continue
+            data = to_canonical(audio).raw_data
+            out.write(data)
+            frames = len(data) // frame_width
+            assets[os.path.normpath(rel_path)] = {"offset": offset, "frames": frames}
+            offset += frames
+
+    manifests = {}
+    manifest_versions = {}
+    for folder in manifest_folders:
+        try:
+            manifest_versions[folder] = asset_cache.source_version(
+                f"chimes/{folder}/manifest.json"
+            )
+            manifests[folder] = asset_cache.get_manifest(folder)
+        except Exception as e:
+            logger.warning(f"Skipping chime manifest {folder}: {e}")
+
+    index = {
+        "format": {
+            "sample_rate": PCM_SAMPLE_RATE,
+            "channels": PCM_CHANNELS,
+            "sample_width": PCM_SAMPLE_WIDTH,
+        },
+        "data_file": data_filename,
+        "assets": assets,
+        "manifests": manifests,
+        "versions": versions,
+        "manifest_versions": manifest_versions,
+    }
+
+    os.replace(f"{data_path}.part", data_path)
+    index_path = os.path.join(store_dir, PCM_INDEX_FILENAME)
+    with open(f"{index_path}.part", "w") as f:
+        json.dump(index, f)
+    os.replace(f"{index_path}.part", index_path)
+
+    # Old data files can go: workers that still map them keep the inode alive
+    for name in os.listdir(store_dir):
+        if name.endswith(".pcm") and name != data_filename:
+            try:
+                os.remove(os.path.join(store_dir, name))
+            except OSError:
+                pass
+
+    reset_pcm_store()
+    logger.info(
+        f"Compiled {len(assets)} assets ({offset * frame_width / (1024 * 1024):.1f} MB) into {store_dir}"
+    )
+    return index
+
+
+def outdated_sources(index: dict) -> list:
+    """
+    Library assets and chime manifests that were added, removed or changed
+    since the store described by index was compiled.
+    """
+    audio_paths, manifest_folders = list_library_assets()
+    compiled = index.get("versions", {})
+    current = {os.path.normpath(p) for p in audio_paths}
+    outdated = sorted(set(compiled) - current)
+    for rel_path in sorted(current):
+        if compiled.get(rel_path) != asset_cache.source_version(rel_path):
+            outdated.append(rel_path)
+
+    compiled = index.get("manifest_versions", {})
+    outdated.extend(
+        f"chimes/{folder}/manifest.json"
+        for folder in set(compiled) - set(manifest_folders)
+    )
+    for folder in manifest_folders:
+        rel_path = f"chimes/{folder}/manifest.json"
+        if compiled.get(folder) != asset_cache.source_version(rel_path):
+            outdated.append(rel_path)
+    return outdated
+
+
+def ensure_pcm_store(store_dir: str = PCM_STORE_DIR, rebuild: bool = False):
+    """
+    Compile the store once per host, and recompile it when library sources
+    changed since. Concurrent workers wait on a file lock and map the store
+    the first one produced.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    with open(os.path.join(store_dir, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            index_path = os.path.join(store_dir, PCM_INDEX_FILENAME)
+            if not rebuild and os.path.exists(index_path):
+                try:
+                    with open(index_path, "r") as f:
+                        outdated = outdated_sources(json.load(f))
+                except Exception as e:
+                    # Keep the store; requests still revalidate each asset
+                    logger.warning(f"Could not check PCM store for changes: {e}")
+                    outdated = []
+                if outdated:
+                    logger.info(
+                        f"Recompiling PCM store: {len(outdated)} sources changed, "
+                        f"e.g. {outdated[:3]}"
+                    )
+                    rebuild = True
+            if rebuild or not os.path.exists(index_path):
+                compile_pcm_store(store_dir)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    return get_pcm_store()
+
+
+if __name__ == "__main__":
+    # python -m app.asset_compiler [store_dir]
+    compile_pcm_store(sys.argv[1] if len(sys.argv) > 1 else PCM_STORE_DIR)
@@ -0,0 +1,159 @@
+import os
+import sys
+import json
+import math
+import threading
+from typing import Optional
+from app.logger import logger
+from app.asset_cache import asset_cache
+from app.cloud_utils import fetch_from_gcs, upload_to_gcs
+from config.emotion_to_audio import EMOTION_TO_AUDIO
+from config.params import (
+    IS_PROD,
+    GCP_AUDIO_BUCKET,
+    ASSET_CACHE_DIR,
+    ASSET_INDEX_FILENAME,
+    ASSET_INDEX_PATH,
+    INTERCHIME_VOLUME_DBFS,
+)
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _finite(value: float) -> Optional[float]:
+    return value if math.isfinite(value) else None
+
+
+def _gain_key(target_dBFS: float) -> str:
+    return f"{float(target_dBFS):.1f}"
+
+
+def _asset_targets() -> dict:
+    """
+    Map each configured asset to the dBFS targets the mix normalizes it to.
+    """
+    targets = {}
+    for entry in EMOTION_TO_AUDIO.values():
+        ambient = os.path.join("soundscapes", entry["ambient"])
+        tone = os.path.join("tones", entry["tone"])
+        targets.setdefault(ambient, set()).add(entry.get("ambient_volume_dBFS", -32.0))
+        targets.setdefault(tone, set()).add(entry.get("tone_volume_dBFS", -36.0))
+    return targets
+
+
+def build_asset_index() -> dict:
+    """
+    Offline pass over the library: length, loudness, peak, chime tail offset and
+    precomputed gains for every asset, plus the interchime folder listings.
+    """
+    # Imported here to keep the request-time import graph free of the compiler
+    from app.asset_compiler import list_library_assets
+    from app.audio_utils import detect_chime_tail
+    from app.mixer import to_array
+
+    audio_paths, manifest_folders = list_library_assets()
+    targets = _asset_targets()
+    manifests = {}
+    for folder in manifest_folders:
+        manifests[folder] = asset_cache.get_manifest(folder)
+        for filename in manifests[folder]:
+            path = os.path.join("chimes", folder, filename)
+            targets.setdefault(path, set()).add(INTERCHIME_VOLUME_DBFS)
+
+    assets = {}
+    for rel_path in audio_paths:
+        rel_path = os.path.normpath(rel_path)
+        try:
+            audio = asset_cache.load_source(rel_path)
+        except Exception as e:
+            logger.warning(f"Skipping asset {rel_path}: {e}")
+            continue
+
+        dBFS = _finite(audio.dBFS)
+        meta = {
+            "length_ms": len(audio),
+            "dBFS": dBFS,
+            "peak_dBFS": _finite(audio.max_dBFS),
+            "gains": {
+                _gain_key(t): (t - dBFS if dBFS is not None else 0.0)
+                for t in sorted(targets.get(rel_path, ()))
+            },
+        }
+        # Top-level chimes are start/end chimes; their tail sets the voice offset
+        if os.path.dirname(rel_path) == "chimes":
+            meta["chime_tail_ms"] = detect_chime_tail(to_array(audio))
+        assets[rel_path] = meta
+
+    return {"assets": assets, "manifests": manifests}
+
+
+def write_asset_index(index: dict, path: str = ASSET_INDEX_PATH) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.part", "w") as f:
+        json.dump(index, f, indent=2)
+    os.replace(f"{path}.part", path)
+    logger.info(f"Wrote asset index with {len(index['assets'])} assets to {path}")
+    if IS_PROD:
+        return upload_to_gcs(path, dest_path=ASSET_INDEX_FILENAME)
+    return path
+
+
+def load_asset_index() -> dict:
+    """
+    Load the asset index once per process. Returns an empty index if none was built,
+    in which case callers fall back to analysing audio at request time.
+    """
+    global _index
+    if _index is not None:
+        return _index
+    with _index_lock:
+        if _index is not None:
+            return _index
+        path = ASSET_INDEX_PATH
+        try:
+            if IS_PROD:
+                path = os.path.join(ASSET_CACHE_DIR, ASSET_INDEX_FILENAME)
+                os.makedirs(ASSET_CACHE_DIR, exist_ok=True)
+                fetch_from_gcs(f"gs://{GCP_AUDIO_BUCKET}/{ASSET_INDEX_FILENAME}", path)
+            with open(path, "r") as f:
+                _index = json.load(f)
+            logger.info(f"Loaded asset index with {len(_index['assets'])} assets")
+        except Exception as e:
+            logger.warning(f"No asset index available, analysing at request time: {e}")
+            _index = {"assets": {}, "manifests": {}}
+    return _index
+
+
+def get_asset_meta(rel_path: str) -> Optional[dict]:
+    return load_asset_index()["assets"].get(os.path.normpath(rel_path))
+
+
+def get_asset_gain(rel_path: str, target_dBFS: float) -> Optional[float]:
+    """
+    Gain in dB that brings an asset to target_dBFS, or None if not indexed.
+    """
+    meta = get_asset_meta(rel_path)
+    if meta is None:
+        return None
+    gain = meta["gains"].get(_gain_key(target_dBFS))
+    if gain is None and meta.get("dBFS") is not None:
+        gain = target_dBFS - meta["dBFS"]
+    return gain
+
+
+def get_chime_tail(rel_path: str) -> Optional[int]:
+    meta = get_asset_meta(rel_path)
+    return meta.get("chime_tail_ms") if meta else None
+
+
+def get_indexed_manifest(folder: str) -> Optional[list]:
+    files = load_asset_index()["manifests"].get(folder)
+    return list(files) if files is not None else None
+
+
+if __name__ == "__main__":
+    # python -m app.asset_index [output_path]
+    write_asset_index(
+        build_asset_index(), sys.argv[1] if len(sys.argv) > 1 else ASSET_INDEX_PATH
+    )
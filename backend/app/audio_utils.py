@@ -1,29 +1,35 @@
 import os
-import random
-import json
+import numpy as np
 from pydub import AudioSegment
-from app.cloud_utils import fetch_from_gcs
-from pydub.effects import low_pass_filter, normalize
-from config.params import CHIMES_DIR, AUDIO_ROOT, IS_PROD, GCP_AUDIO_BUCKET
+from app.asset_cache import asset_cache
+from app.envelopes import fade_in
+from app.dsp import LowPass, normalize_gain, peak
+from app.mixer import apply_gain, dbfs, ms_to_frames, tile, to_canonical, to_pcm16
+from app.asset_index import get_asset_gain, get_chime_tail
+from config.params import CHIMES_DIR, PCM_CHANNELS, RENDER_BLOCK_FRAMES
 
 
 def build_intro_layer(
-    audio: AudioSegment, target_duration: int, fade_in_duration: int = 2000
-) -> AudioSegment:
+    audio: np.ndarray, target_frames: int, fade_in_frames: int = ms_to_frames(2000)
+) -> np.ndarray:
     """
     Loop and slice ambient/tone to ensure a full-duration intro layer,
     and apply a fade-in to the beginning.
     """
-    if len(audio) < target_duration:
-        repeats = (target_duration // len(audio)) + 1
-        audio = audio * repeats
-    intro = audio[:target_duration]
-    return intro.fade_in(fade_in_duration)
+    return fade_in(tile(audio, target_frames), fade_in_frames)
 
 
-def normalize_volume(audio: AudioSegment, target_dBFS=-18.0) -> AudioSegment:
-    change_in_dBFS = target_dBFS - audio.dBFS
-    return audio.apply_gain(change_in_dBFS)
+def normalize_volume(
+    audio: np.ndarray, target_dBFS=-18.0, rel_path: str = None
+) -> np.ndarray:
+    """
+    Apply (in place) the gain that brings audio to target_dBFS. When rel_path is
+    an indexed library asset, the precomputed gain is used instead of measuring loudness.
+    """
+    change_in_dBFS = get_asset_gain(rel_path, target_dBFS) if rel_path else None
+    if change_in_dBFS is None:
+        change_in_dBFS = target_dBFS - dbfs(audio)
+    return apply_gain(audio, change_in_dBFS)
 
 
 def choose_chime(filename: str, max_duration_ms: int = None) -> AudioSegment:
@@ -35,22 +41,53 @@ def choose_chime(filename: str, max_duration_ms: int = None) -> AudioSegment:
 
 
 def detect_chime_tail(
-    chime_audio: AudioSegment, silence_threshold_dBFS=-40.0, min_tail_ms=2000
+    chime_audio: np.ndarray,
+    silence_threshold_dBFS=-40.0,
+    min_tail_ms=2000,
+    rel_path: str = None,
 ):
+    if rel_path and silence_threshold_dBFS == -40.0 and min_tail_ms == 2000:
+        indexed = get_chime_tail(rel_path)
+        if indexed is not None:
+            return indexed
+
     chunk_size = 100  # ms
+    chunk_frames = ms_to_frames(chunk_size)
     last_loud_ms = min_tail_ms
-    for i in range(min_tail_ms, len(chime_audio), chunk_size):
-        chunk = chime_audio[i : i + chunk_size]
-        if chunk.dBFS > silence_threshold_dBFS:
-            last_loud_ms = i
+    for i in range(ms_to_frames(min_tail_ms), len(chime_audio), chunk_frames):
+        if dbfs(chime_audio[i : i + chunk_frames]) > silence_threshold_dBFS:
+            last_loud_ms = round(i * chunk_size / chunk_frames)
     return last_loud_ms + 500
 
 
-def soften_voice(voice_audio: AudioSegment) -> AudioSegment:
-    voice = voice_audio - 2
-    voice = low_pass_filter(voice, cutoff=4000)
-    voice = normalize(voice)
-    return voice
+def soften_voice(voice_audio: AudioSegment, path: str) -> np.ndarray:
+    """
+    -2 dB, 4 kHz low-pass and peak normalization, written block by block as
+    canonical PCM to `path` and returned as a read-only int16 memmap.
+    The normalization gain is applied in a second pass over the file.
+    """
+    src = np.frombuffer(to_canonical(voice_audio).raw_data, dtype=np.int16)
+    src = src.reshape(-1, PCM_CHANNELS)
+    if len(src) == 0:
+        open(path, "wb").close()
+        return np.zeros((0, PCM_CHANNELS), dtype=np.int16)
+
+    out = np.memmap(path, dtype=np.int16, mode="w+", shape=src.shape)
+    low_pass = LowPass(cutoff=4000)
+    voice_peak = 0.0
+    for pos in range(0, len(src), RENDER_BLOCK_FRAMES):
+        block = apply_gain(src[pos : pos + RENDER_BLOCK_FRAMES].astype(np.float32), -2)
+        low_pass.process(block)
+        voice_peak = max(voice_peak, peak(block))
+        out[pos : pos + len(block)] = to_pcm16(block)
+
+    gain = normalize_gain(voice_peak)
+    for pos in range(0, len(out), RENDER_BLOCK_FRAMES):
+        block = out[pos : pos + RENDER_BLOCK_FRAMES]
+        block[:] = to_pcm16(apply_gain(block.astype(np.float32), gain))
+    out.flush()
+    del out
+    return np.memmap(path, dtype=np.int16, mode="r").reshape(-1, PCM_CHANNELS)
 
 
 def extract_word_timings_from_fragments(fragments, offset_ms=0):
@@ -82,100 +119,12 @@ def extract_word_timings_from_fragments(fragments, offset_ms=0):
     return word_timings
 
 
-def build_seamless_loop(
-    base_loop: AudioSegment, repeats: int, crossfade_ms: int = 300
-) -> AudioSegment:
-    """
-    Build a seamless ambient loop with tiny crossfade between repeats.
-    """
-    output = base_loop
-    for _ in range(repeats - 1):
-        output = output.append(base_loop, crossfade=crossfade_ms)
-    return output
-
-
-def build_outro_segment(
-    chime: AudioSegment, background: AudioSegment, start_ms: int
-) -> AudioSegment:
-    fade_out_duration = len(chime)
-
-    # Slice background from start_ms to end of fade
-    bg_tail = background[start_ms : start_ms + fade_out_duration]
-    if len(bg_tail) < fade_out_duration:
-        bg_tail += AudioSegment.silent(duration=fade_out_duration - len(bg_tail))
-
-    bg_tail_faded = bg_tail.fade_out(fade_out_duration)
-    return bg_tail_faded.overlay(chime)
-
-
-def load_and_clean_audio_asset(rel_path: str, tmp_root: str = "/tmp") -> AudioSegment:
+def load_and_clean_audio_asset(rel_path: str, tmp_root: str = "/tmp") -> np.ndarray:
     """
-    Loads an audio file from local or GCS, deletes the file and cleans up its empty parent dirs in prod.
+    Loads an audio asset through the process-wide asset cache, as a float32
+    array in the canonical format that the caller owns.
+    In prod the GCS object is downloaded once into the disk tier and revalidated
+    by generation; the decoded audio stays in memory across requests.
+    tmp_root is kept for call-site compatibility and is no longer written to.
     """
-    full_path = os.path.normpath(os.path.join(AUDIO_ROOT, rel_path))
-    rel_path = os.path.relpath(full_path, AUDIO_ROOT)
-
-    if IS_PROD:
-        bucket_subpath = rel_path.replace(os.sep, "/")
-        gcs_path = f"gs://{GCP_AUDIO_BUCKET}/{bucket_subpath}"
-        tmp_path = os.path.join(tmp_root, rel_path)
-        os.makedirs(os.path.dirname(tmp_path), exist_ok=True)
-        fetch_from_gcs(gcs_path, tmp_path)
-        audio = AudioSegment.from_file(tmp_path)
-        try:
-            os.remove(tmp_path)
-            # Recursively remove empty parent dirs up to tmp_root
-            dir_path = os.path.dirname(tmp_path)
-            while dir_path != tmp_root:
-                try:
-                    os.rmdir(dir_path)
-                    dir_path = os.path.dirname(dir_path)
-                except OSError:
-                    break
-        except Exception:
-            pass
-        return audio
-
-    local_path = os.path.join(AUDIO_ROOT, rel_path)
-    return AudioSegment.from_file(local_path)
-
-
-_chime_rotation = []
-_last_interchime_folder = None
-
-
-def next_bar_chime(
-    chosen_interchime_folder: str, tmp_root: str = "/tmp"
-) -> AudioSegment:
-    global _chime_rotation, _last_interchime_folder
-
-    if _last_interchime_folder != chosen_interchime_folder:
-        _chime_rotation = []
-        _last_interchime_folder = chosen_interchime_folder
-
-    if not _chime_rotation:
-        # Load manifest
-        manifest_rel = f"chimes/{chosen_interchime_folder}/manifest.json"
-        if IS_PROD:
-            # Download manifest from GCS
-            local_manifest = os.path.join(
-                tmp_root, "chimes", chosen_interchime_folder, "manifest.json"
-            )
-            os.makedirs(os.path.dirname(local_manifest), exist_ok=True)
-            fetch_from_gcs(f"gs://{GCP_AUDIO_BUCKET}/{manifest_rel}", local_manifest)
-        else:
-            # Read local manifest
-            local_manifest = os.path.join(
-                CHIMES_DIR, chosen_interchime_folder, "manifest.json"
-            )
-
-        with open(local_manifest, "r") as mf:
-            files = json.load(mf)
-
-        _chime_rotation = files.copy()
-        random.shuffle(_chime_rotation)
-
-    # Pop the next chime filename and load
-    filename = _chime_rotation.pop(0)
-    rel_audio = f"chimes/{chosen_interchime_folder}/{filename}"
-    return load_and_clean_audio_asset(rel_audio, tmp_root=tmp_root)
+    return asset_cache.get_array(rel_path)
@@ -0,0 +1,254 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+import threading
+import numpy as np
+from typing import Optional
+from app.logger import logger
+from app.asset_cache import asset_cache
+from app.envelopes import fade_in
+from app.loop_tiler import LoopTile
+from app.mixer import add_at, ms_to_frames, tile
+from app.audio_utils import (
+    build_intro_layer,
+    detect_chime_tail,
+    load_and_clean_audio_asset,
+    normalize_volume,
+)
+from config.emotion_to_audio import EMOTION_TO_AUDIO
+from config.params import (
+    BED_CACHE_DIR,
+    LOOP_CROSSFADE_MS,
+    PCM_SAMPLE_RATE,
+    PCM_CHANNELS,
+)
+
+# Bump when the way beds are rendered changes, to invalidate stored beds
+BED_FORMAT_VERSION = 1
+BED_PARTS = ("intro", "head", "cell", "tail", "end_chime")
+# Stored bed dirs are named by fingerprint(); nothing else in the dir is ours to prune
+FINGERPRINT_RE = re.compile(r"[0-9a-f]{24}")
+# Profile name -> fingerprint of its bed as of the last prebuild
+PROFILES_FILENAME = "profiles.json"
+
+
+def profile_asset_paths(profile: dict) -> dict:
+    return {
+        "ambient": os.path.join("soundscapes", profile["ambient"]),
+        "tone": os.path.join("tones", profile["tone"]),
+        "start_chime": os.path.join(
+            "chimes", profile.get("start_chime", "start_chime_paiste_gong.wav")
+        ),
+        "end_chime": os.path.join(
+            "chimes", profile.get("end_chime", "end_chime_singing_bowl.wav")
+        ),
+    }
+
+
+class Bed:
+    """
+    Everything in a session that does not depend on the voice: the intro mix
+    (start chime over faded-in ambient and tone), the crossfaded background
+    loop, the end chime and the voice offset under the start chime.
+    """
+
+    def __init__(
+        self,
+        fingerprint: str,
+        intro: np.ndarray,
+        loop: LoopTile,
+        end_chime: np.ndarray,
+        tts_offset_ms: int,
+    ):
+        self.fingerprint = fingerprint
+        self.intro = intro
+        self.loop = loop
+        self.end_chime = end_chime
+        self.tts_offset_ms = tts_offset_ms
+
+
+class BedCache:
+    """
+    Pre-rendered beds per emotion profile, as float32 PCM (.npy) under
+    BED_CACHE_DIR, memory-mapped so every worker shares the same pages.
+
+    Beds are keyed by a fingerprint of the profile entry (assets, volumes,
+    chimes), the versions of the assets it uses and the render parameters, so
+    editing config/emotion_to_audio.py or replacing an asset builds a new bed.
+
+    Full-length beds are not stored: reading any stretch of a bed is already a
+    few slice copies out of the loop cell.
+    """
+
+    def __init__(self, cache_dir: str = BED_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._beds = {}
+        self._lock = threading.Lock()
+
+    def fingerprint(self, profile: dict) -> Optional[str]:
+        """
+        None when an asset version is unknown; such beds are built but not kept.
+        """
+        versions = {}
+        for role, rel_path in profile_asset_paths(profile).items():
+            versions[role] = asset_cache.version(rel_path)
+            if versions[role] is None:
+                return None
+        key = {
+            "profile": profile,
+            "versions": versions,
+            "crossfade_ms": LOOP_CROSSFADE_MS,
+            "format": [PCM_SAMPLE_RATE, PCM_CHANNELS],
+            "bed_format": BED_FORMAT_VERSION,
+        }
+        blob = json.dumps(key, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha256(blob).hexdigest()[:24]
+
+    def get(self, profile: dict) -> Bed:
+        fingerprint = self.fingerprint(profile)
+        if fingerprint is None:
+            return self._render(profile, None)
+
+        with self._lock:
+            bed = self._beds.get(fingerprint)
+        if bed is not None:
+            return bed
+
+        bed = self._load(fingerprint)
+        if bed is None:
+            bed = self._render(profile, fingerprint)
+            self._write(bed)
+            bed = self._load(fingerprint) or bed
+        with self._lock:
+            self._beds[fingerprint] = bed
+        return bed
+
+    def prebuild(self) -> int:
+        """
+        Build every profile's bed and drop stored beds no profile uses anymore.
+        A profile whose bed fails to build keeps the bed it had before.
+        """
+        previous = self._read_profiles()
+        profiles, built = {}, 0
+        for name, profile in EMOTION_TO_AUDIO.items():
+            try:
+                profiles[name] = self.get(profile).fingerprint
+                built += 1
+            except Exception as e:
+                logger.warning(f"Could not build background bed for {name}: {e}")
+                if previous.get(name):
+                    profiles[name] = previous[name]
+        current = {fp for fp in profiles.values() if fp is not None}
+        if os.path.isdir(self.cache_dir):
+            for entry in os.listdir(self.cache_dir):
+                if FINGERPRINT_RE.fullmatch(entry) and entry not in current:
+                    shutil.rmtree(
+                        os.path.join(self.cache_dir, entry), ignore_errors=True
+                    )
+        with self._lock:
+            for fingerprint in list(self._beds):
+                if fingerprint not in current:
+                    del self._beds[fingerprint]
+        self._write_profiles(profiles)
+        logger.info(f"Background beds ready for {built} profiles")
+        return built
+
+    # --- internals ---
+
+    def _render(self, profile: dict, fingerprint: Optional[str]) -> Bed:
+        paths = profile_asset_paths(profile)
+        amb = normalize_volume(
+            load_and_clean_audio_asset(paths["ambient"]),
+            target_dBFS=profile.get("ambient_volume_dBFS", -32.0),
+            rel_path=paths["ambient"],
+        )
+        tone = normalize_volume(
+            load_and_clean_audio_asset(paths["tone"]),
+            target_dBFS=profile.get("tone_volume_dBFS", -36.0),
+            rel_path=paths["tone"],
+        )
+        start_chime = load_and_clean_audio_asset(paths["start_chime"])
+        end_chime = load_and_clean_audio_asset(paths["end_chime"])
+
+        # Intro: start chime over ambient and tone faded in across its length
+        fade_len = len(start_chime)
+        intro = start_chime.copy()
+        add_at(intro, fade_in(build_intro_layer(amb, fade_len), fade_len), 0)
+        add_at(intro, fade_in(build_intro_layer(tone, fade_len), fade_len), 0)
+
+        # Loop: the rest of the ambient with the tone tiled underneath
+        amb_rest = amb[fade_len:] if len(amb) > fade_len else amb
+        tone_rest = tone[fade_len:] if len(tone) > fade_len else tone
+        bg_loop = amb_rest.copy()
+        add_at(bg_loop, tile(tone_rest, len(bg_loop)), 0)
+        loop = LoopTile(bg_loop, ms_to_frames(LOOP_CROSSFADE_MS))
+
+        tts_offset_ms = detect_chime_tail(start_chime, rel_path=paths["start_chime"])
+        return Bed(fingerprint, intro, loop, end_chime, tts_offset_ms)
+
+    def _read_profiles(self) -> dict:
+        try:
+            with open(os.path.join(self.cache_dir, PROFILES_FILENAME), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_profiles(self, profiles: dict):
+        path = os.path.join(self.cache_dir, PROFILES_FILENAME)
+        part = f"{path}.{os.getpid()}.part"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(part, "w") as f:
+                json.dump(profiles, f)
+            os.replace(part, path)
+        except OSError as e:
+            logger.debug(f"Background bed profiles not stored: {e}")
+
+    def _bed_dir(self, fingerprint: str) -> str:
+        return os.path.join(self.cache_dir, fingerprint)
+
+    def _load(self, fingerprint: str) -> Optional[Bed]:
+        bed_dir = self._bed_dir(fingerprint)
+        try:
+            with open(os.path.join(bed_dir, "meta.json"), "r") as f:
+                meta = json.load(f)
+            parts = {
+                name: np.load(os.path.join(bed_dir, f"{name}.npy"), mmap_mode="r")
+                for name in BED_PARTS
+            }
+        except (OSError, ValueError):
+            return None
+        loop = LoopTile.from_parts(parts["head"], parts["cell"], parts["tail"])
+        return Bed(
+            fingerprint, parts["intro"], loop, parts["end_chime"], meta["tts_offset_ms"]
+        )
+
+    def _write(self, bed: Bed):
+        bed_dir = self._bed_dir(bed.fingerprint)
+        # Written beside the target and renamed, so workers never map a partial bed
+        part_dir = f"{bed_dir}.{os.getpid()}.{threading.get_ident()}.part"
+        try:
+            os.makedirs(part_dir, exist_ok=True)
+            arrays = {
+                "intro": bed.intro,
+                "head": bed.loop.head,
+                "cell": bed.loop.cell,
+                "tail": bed.loop.tail,
+                "end_chime": bed.end_chime,
+            }
+            for name, array in arrays.items():
+                np.save(os.path.join(part_dir, f"{name}.npy"), array)
+            with open(os.path.join(part_dir, "meta.json"), "w") as f:
+                json.dump({"tts_offset_ms": bed.tts_offset_ms}, f)
+            os.rename(part_dir, bed_dir)
+            logger.info(f"Stored background bed {bed.fingerprint}")
+        except OSError as e:
+            # Another worker got there first, or the disk is unavailable
+            logger.debug(f"Background bed {bed.fingerprint} not stored: {e}")
+        finally:
+            shutil.rmtree(part_dir, ignore_errors=True)
+
+
+bed_cache = BedCache()
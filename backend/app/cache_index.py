@@ -0,0 +1,303 @@
+import os
+import json
+import time
+import fcntl
+import threading
+from typing import Callable, Optional
+from app.logger import logger
+from app.cloud_utils import (
+    fetch_from_gcs,
+    upload_to_gcs,
+    list_gcs_details,
+    delete_many_from_gcs,
+    split_gcs_uri,
+)
+from config.params import (
+    CACHE_DIR,
+    GCP_AUDIO_BUCKET,
+    CACHE_MAX_TOTAL_BYTES,
+    CACHE_ORPHAN_GRACE_SECONDS,
+)
+
+INDEX_BLOB_PATH = "cache_index/manifest.json"
+# Prefixes holding artifacts that cache entries point to
+ARTIFACT_PREFIXES = ["tts/", "output/"]
+
+
+def _artifact_blobs(result) -> list:
+    """
+    Object paths (in our bucket) referenced by a cached result.
+    """
+    values = result.values() if isinstance(result, dict) else [result]
+    blobs = []
+    for value in values:
+        if isinstance(value, str) and value.startswith(f"gs://{GCP_AUDIO_BUCKET}/"):
+            blobs.append(split_gcs_uri(value)[1])
+    return blobs
+
+
+def _covered_blobs(artifacts: list, listed_dirs: dict) -> list:
+    """
+    The artifacts plus, for an HLS playlist, every listed object in its
+    directory (segments and the signed-URL playlist), which the cached
+    result does not name one by one.
+    """
+    covered = list(artifacts)
+    for blob in artifacts:
+        if blob.endswith(".m3u8"):
+            covered.extend(listed_dirs.get(os.path.dirname(blob), ()))
+    return list(dict.fromkeys(covered))
+
+
+class CacheIndex:
+    """
+    Manifest of result-cache entries: key -> created_at, last_access, size and
+    the artifacts (tts/, output/) each entry references.
+
+    Lookups consult it to skip downloading entries already known to be expired.
+    sweep() merges this process's view with the shared manifest in GCS, then
+    enforces the TTL and the total size budget (LRU by last access), and deletes
+    evicted entries and orphaned artifacts in batches.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float,
+        max_bytes: int = CACHE_MAX_TOTAL_BYTES,
+        orphan_grace_seconds: float = CACHE_ORPHAN_GRACE_SECONDS,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.orphan_grace_seconds = orphan_grace_seconds
+        self.local_path = os.path.join(CACHE_DIR, "cache_index.json")
+        self._entries = {}
+        self._removed = set()
+        self._lock = threading.Lock()
+
+    # --- request-time API ---
+
+    def record(self, cache_key: str, created_at: float, result):
+        with self._lock:
+            self._entries[cache_key] = {
+                "created_at": created_at,
+                "last_access": created_at,
+                "size": 0,
+                "artifacts": _artifact_blobs(result),
+            }
+            self._removed.discard(cache_key)
+
+    def touch(self, cache_key: str):
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                entry["last_access"] = time.time()
+
+    def is_expired(self, cache_key: str) -> bool:
+        """
+        True if the index knows the entry and it is past its TTL (or was evicted).
+        Unknown keys are not expired: the caller still has to look them up.
+        """
+        with self._lock:
+            if cache_key in self._removed:
+                return True
+            entry = self._entries.get(cache_key)
+        return (
+            entry is not None and time.time() - entry["created_at"] > self.ttl_seconds
+        )
+
+    def load(self) -> int:
+        """
+        Pull the shared manifest from GCS (falling back to the local copy).
+        """
+        remote = self._read_remote()
+        with self._lock:
+            self._merge(remote)
+            return len(self._entries)
+
+    # --- sweeper ---
+
+    def sweep(self, on_evict: Optional[Callable[[str], None]] = None) -> dict:
+        now = time.time()
+        listed = {}
+        for prefix in ["cache/"] + ARTIFACT_PREFIXES:
+            for obj in list_gcs_details(prefix):
+                listed[obj["name"]] = obj
+
+        remote = self._read_remote()
+        with self._lock:
+            self._merge(remote)
+            entries = self._entries
+
+            # Adopt cache entries that predate the index
+            for name, obj in listed.items():
+                if not name.startswith("cache/") or not name.endswith(".json"):
+                    continue
+                key = os.path.basename(name)[: -len(".json")]
+                if key not in entries and key not in self._removed:
+                    entries[key] = {
+                        "created_at": obj["updated"],
+                        "last_access": obj["updated"],
+                        "size": 0,
+                        "artifacts": None,
+                    }
+
+            # Forget entries whose payload is gone (past the upload grace window)
+            for key in list(entries):
+                if f"cache/{key}.json" not in listed and (
+                    now - entries[key]["created_at"] > self.orphan_grace_seconds
+                ):
+                    del entries[key]
+            adopted = [k for k, e in entries.items() if e["artifacts"] is None]
+
+        for key in adopted:
+            artifacts = self._read_artifacts(key)
+            with self._lock:
+                if key in self._entries:
+                    self._entries[key]["artifacts"] = artifacts
+
+        listed_dirs = {}
+        for name in listed:
+            listed_dirs.setdefault(os.path.dirname(name), []).append(name)
+
+        with self._lock:
+            entries = self._entries
+            covered = {
+                key: _covered_blobs(entry["artifacts"] or [], listed_dirs)
+                for key, entry in entries.items()
+            }
+            for key, entry in entries.items():
+                entry["size"] = listed.get(f"cache/{key}.json", {}).get(
+                    "size", 0
+                ) + sum(listed.get(blob, {}).get("size", 0) for blob in covered[key])
+
+            evict = {
+                k
+                for k, e in entries.items()
+                if now - e["created_at"] > self.ttl_seconds
+            }
+            total = sum(e["size"] for k, e in entries.items() if k not in evict)
+            if total > self.max_bytes:
+                by_lru = sorted(
+                    (k for k in entries if k not in evict),
+                    key=lambda k: entries[k]["last_access"],
+                )
+                for key in by_lru:
+                    if total <= self.max_bytes:
+                        break
+                    evict.add(key)
+                    total -= entries[key]["size"]
+
+            doomed = []
+            for key in evict:
+                doomed.append(f"cache/{key}.json")
+                doomed.extend(covered[key])
+                del entries[key]
+                self._removed.add(key)
+
+            # Orphans are only safe to judge when every entry's references are known
+            orphans = []
+            if all(e["artifacts"] is not None for e in entries.values()):
+                referenced = set()
+                for key in entries:
+                    referenced.update(covered[key])
+                orphans = [
+                    name
+                    for name, obj in listed.items()
+                    if any(name.startswith(p) for p in ARTIFACT_PREFIXES)
+                    and name not in referenced
+                    and now - obj["updated"] > self.orphan_grace_seconds
+                ]
+            live = len(entries)
+
+        delete_many_from_gcs(sorted(set(doomed + orphans)))
+        if on_evict is not None:
+            for key in evict:
+                on_evict(key)
+
+        self._write()
+        stats = {
+            "entries": live,
+            "evicted": len(evict),
+            "orphans_deleted": len(orphans),
+            "total_bytes": total,
+        }
+        logger.info(f"Cache sweep finished: {stats}")
+        return stats
+
+    def sweep_exclusive(self, on_evict: Optional[Callable[[str], None]] = None):
+        """
+        Run sweep() unless another worker on this host is already sweeping.
+        """
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(os.path.join(CACHE_DIR, ".sweep.lock"), "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.debug("Cache sweep already running in another worker")
+                return None
+            try:
+                return self.sweep(on_evict)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    # --- internals ---
+
+    def _merge(self, remote: dict):
+        """
+        Fold the shared manifest into this process's view. Caller holds the lock.
+        """
+        for key, theirs in remote.items():
+            if key in self._removed:
+                continue
+            ours = self._entries.get(key)
+            if ours is None or theirs["created_at"] > ours["created_at"]:
+                merged = dict(theirs)
+                if ours is not None:
+                    merged["last_access"] = max(
+                        ours["last_access"], theirs["last_access"]
+                    )
+                self._entries[key] = merged
+            else:
+                ours["last_access"] = max(ours["last_access"], theirs["last_access"])
+
+    def _read_remote(self) -> dict:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        part = f"{self.local_path}.{os.getpid()}.part"
+        try:
+            fetch_from_gcs(f"gs://{GCP_AUDIO_BUCKET}/{INDEX_BLOB_PATH}", part)
+            os.replace(part, self.local_path)
+        except Exception as e:
+            logger.debug(f"Could not fetch cache index manifest: {e}")
+            if os.path.exists(part):
+                os.remove(part)
+        try:
+            with open(self.local_path, "r") as f:
+                return json.load(f).get("entries", {})
+        except (OSError, ValueError):
+            return {}
+
+    def _read_artifacts(self, cache_key: str) -> Optional[list]:
+        part = os.path.join(CACHE_DIR, f"{cache_key}.{os.getpid()}.index.part")
+        try:
+            fetch_from_gcs(f"gs://{GCP_AUDIO_BUCKET}/cache/{cache_key}.json", part)
+            with open(part, "r") as f:
+                return _artifact_blobs(json.load(f).get("result"))
+        except Exception as e:
+            logger.warning(f"Could not read cache entry {cache_key} for indexing: {e}")
+            return None
+        finally:
+            if os.path.exists(part):
+                os.remove(part)
+
+    def _write(self):
+        with self._lock:
+            data = {"updated_at": time.time(), "entries": dict(self._entries)}
+            self._removed.clear()
+        part = f"{self.local_path}.{os.getpid()}.part"
+        with open(part, "w") as f:
+            json.dump(data, f)
+        os.replace(part, self.local_path)
+        try:
+            upload_to_gcs(self.local_path, dest_path=INDEX_BLOB_PATH)
+        except Exception as e:
+            logger.warning(f"Could not upload cache index manifest: {e}")
@@ -1,15 +1,46 @@
 import os
 import json
 import time
+import uuid
 import hashlib
+import threading
+from collections import OrderedDict
 from typing import Any, Optional
 from app.logger import logger
-from app.cloud_utils import upload_to_gcs, fetch_from_gcs, generate_signed_url
-from config.params import GCP_AUDIO_BUCKET, CACHE_DIR
+from app.bloom_filter import BloomFilter
+from app.cache_index import CacheIndex
+from app.similarity import SimilarityIndex, canonicalize_journal
+from app.cloud_utils import fetch_from_gcs, generate_signed_url, list_gcs
+from app.upload_manager import upload_manager
+from app.hls import signed_output_url
+from config.params import (
+    GCP_AUDIO_BUCKET,
+    CACHE_DIR,
+    RESULT_CACHE_MEMORY_ENTRIES,
+    CACHE_FILTER_ENABLED,
+    CACHE_FILTER_ERROR_RATE,
+    CACHE_SIMILARITY_ENABLED,
+    OUTPUT_FORMAT,
+)
 
 # how long a cache entry stays fresh
 CACHE_TTL_SECONDS = 24 * 3600
 
+# Tier 1: in-process hot tier, key -> payload ({"created_at", "result"})
+_memory = OrderedDict()
+_memory_lock = threading.Lock()
+
+# Membership filter over remote cache/ keys; None until built, which means "maybe"
+_remote_keys = None
+_recent_saves = set()  # keys saved since the last filter build
+_remote_keys_lock = threading.Lock()
+
+# Manifest of entries, sizes and artifacts; drives TTL/size sweeps
+cache_index = CacheIndex(ttl_seconds=CACHE_TTL_SECONDS)
+
+# Near-duplicate index over cached entries (only used when CACHE_SIMILARITY_ENABLED)
+similarity_index = SimilarityIndex(ttl_seconds=CACHE_TTL_SECONDS)
+
 
 def _local_path(cache_key: str) -> str:
     return os.path.join(CACHE_DIR, f"{cache_key}.json")
@@ -19,72 +50,263 @@ def _remote_path(cache_key: str) -> str:
     return f"gs://{GCP_AUDIO_BUCKET}/cache/{cache_key}.json"
 
 
+def _is_fresh(payload: dict) -> bool:
+    return time.time() - payload.get("created_at", 0) <= CACHE_TTL_SECONDS
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
 def generate_cache_key(journal_entry: str, duration: int, meditation_type: str) -> str:
-    base = f"{journal_entry.strip()}::{duration}::{meditation_type}"
+    text = journal_entry.strip()
+    if CACHE_SIMILARITY_ENABLED:
+        text = canonicalize_journal(text)
+    base = f"{text}::{duration}::{meditation_type}"
+    if OUTPUT_FORMAT != "mp3":
+        # Keep existing mp3 keys valid; other formats are cached separately
+        base += f"::{OUTPUT_FORMAT}"
     return hashlib.md5(base.encode("utf-8")).hexdigest()
 
 
-def save_to_cache(cache_key: str, result: Any) -> None:
+def cacheable(result: dict) -> dict:
     """
-    Wrap the result in a dict with created_at, write locally,
-    upload to GCS under cache/, then delete the local copy.
+    Cache only raw GCS paths and emotion summary, omitting final_signed_url.
     """
-    payload = {
-        "created_at": time.time(),
-        "result": result,
+    return {
+        "final_audio_path": result["final_audio_path"],
+        "emotion_summary": result["emotion_summary"],
+        "script_path": result["script_path"],
+        "tts_path": result["tts_path"],
+        "alignment_path": result["alignment_path"],
     }
+
+
+def find_similar_cached(
+    journal_entry: str, duration: int, meditation_type: str, emotion_summary: dict
+) -> Optional[Any]:
+    """
+    Return a cached result for a near-identical entry with the same type,
+    duration and dominant emotion, or None.
+    """
+    if not CACHE_SIMILARITY_ENABLED or not emotion_summary:
+        return None
+    dominant = max(emotion_summary, key=emotion_summary.get)
+    match = similarity_index.find(journal_entry, duration, meditation_type, dominant)
+    if match is None:
+        return None
+    cached = load_from_cache(match)
+    if cached is None:
+        similarity_index.remove(match)
+    return cached
+
+
+def index_for_similarity(
+    cache_key: str,
+    journal_entry: str,
+    duration: int,
+    meditation_type: str,
+    emotion_summary: dict,
+):
+    if not CACHE_SIMILARITY_ENABLED or not emotion_summary:
+        return
+    dominant = max(emotion_summary, key=emotion_summary.get)
+    similarity_index.add(cache_key, journal_entry, duration, meditation_type, dominant)
+
+
+# --- tier 1: memory ---
+
+
+def _memory_get(cache_key: str) -> Optional[dict]:
+    with _memory_lock:
+        payload = _memory.get(cache_key)
+        if payload is None:
+            return None
+        if not _is_fresh(payload):
+            del _memory[cache_key]
+            return None
+        _memory.move_to_end(cache_key)
+        return payload
+
+
+def _memory_put(cache_key: str, payload: dict):
+    with _memory_lock:
+        _memory[cache_key] = payload
+        _memory.move_to_end(cache_key)
+        while len(_memory) > RESULT_CACHE_MEMORY_ENTRIES:
+            _memory.popitem(last=False)
+
+
+# --- tier 2: local disk ---
+
+
+def _disk_get(cache_key: str) -> Optional[dict]:
+    local = _local_path(cache_key)
+    try:
+        with open(local, "r") as f:
+            payload = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        _remove_quietly(local)
+        return None
+
+    if not _is_fresh(payload):
+        _remove_quietly(local)
+        return None
+    return payload
+
+
+def _disk_put(cache_key: str, payload: dict) -> str:
+    """
+    Atomically write the payload into the disk tier and return a private
+    staging copy of it for the GCS upload.
+    """
     local = _local_path(cache_key)
-    # ensure parent dir exists
     os.makedirs(os.path.dirname(local), exist_ok=True)
+    staging = f"{local}.{uuid.uuid4().hex}.upload"
+    with open(staging, "w") as f:
+        json.dump(payload, f)
 
-    # write locally
-    with open(local, "w") as f:
+    part = f"{local}.{uuid.uuid4().hex}.part"
+    with open(part, "w") as f:
         json.dump(payload, f)
+    os.replace(part, local)
+    return staging
 
-    # upload into gs://<bucket>/cache/<key>.json
-    blob_path = f"cache/{cache_key}.json"
-    try:
-        upload_to_gcs(local, dest_path=blob_path)
-    except Exception as e:
-        logger.warning(f"Could not upload cache to GCS: {e}")
 
-    # immediately delete local copy
-    try:
-        os.remove(local)
-    except OSError:
-        pass
+# --- tier 3: GCS ---
 
 
-def load_from_cache(cache_key: str) -> Optional[Any]:
-    local = _local_path(cache_key)
-    remote = _remote_path(cache_key)
+def build_remote_key_filter() -> int:
+    """
+    (Re)build the membership filter from a listing of gs://<bucket>/cache/.
+    Returns the number of keys indexed.
+    """
+    global _remote_keys
+    if not CACHE_FILTER_ENABLED:
+        return 0
 
-    os.makedirs(os.path.dirname(local), exist_ok=True)
+    keys = [
+        os.path.basename(name)[: -len(".json")]
+        for name in list_gcs("cache/")
+        if name.endswith(".json")
+    ]
+    bloom = BloomFilter(
+        capacity=max(10000, 2 * len(keys)), error_rate=CACHE_FILTER_ERROR_RATE
+    )
+    for key in keys:
+        bloom.add(key)
+    with _remote_keys_lock:
+        # Keys saved here may still be uploading and missing from the listing
+        for key in _recent_saves:
+            bloom.add(key)
+        _recent_saves.clear()
+        _remote_keys = bloom
+    logger.info(f"Cache key filter built over {len(keys)} remote entries")
+    return len(keys)
 
-    if not os.path.exists(local):
-        try:
-            fetch_from_gcs(remote, local)
-        except Exception:
-            return None
 
+def _maybe_remote(cache_key: str) -> bool:
+    bloom = _remote_keys
+    return bloom is None or cache_key in bloom
+
+
+def _remote_get(cache_key: str) -> Optional[dict]:
+    """
+    Download the entry from GCS into the disk tier. Returns None on a miss.
+    """
+    local = _local_path(cache_key)
+    os.makedirs(os.path.dirname(local), exist_ok=True)
+    part = f"{local}.{uuid.uuid4().hex}.part"
     try:
-        with open(local, "r") as f:
+        fetch_from_gcs(_remote_path(cache_key), part)
+        with open(part, "r") as f:
             payload = json.load(f)
     except Exception:
-        try:
-            os.remove(local)
-        except OSError:
-            pass
+        _remove_quietly(part)
         return None
 
+    if not _is_fresh(payload):
+        _remove_quietly(part)
+        return None
+    os.replace(part, local)
+    return payload
+
+
+def _load_payload(cache_key: str) -> Optional[dict]:
+    """
+    Look the key up tier by tier, promoting hits into the faster tiers.
+    """
+    payload = _memory_get(cache_key)
+    if payload is not None:
+        return payload
+
+    payload = _disk_get(cache_key)
+    if (
+        payload is None
+        and _maybe_remote(cache_key)
+        and not cache_index.is_expired(cache_key)
+    ):
+        payload = _remote_get(cache_key)
+    if payload is not None:
+        _memory_put(cache_key, payload)
+    return payload
+
+
+def _evict_local(cache_key: str):
+    with _memory_lock:
+        _memory.pop(cache_key, None)
+    _remove_quietly(_local_path(cache_key))
+    similarity_index.remove(cache_key)
+
+
+def sweep_cache() -> Optional[dict]:
+    """
+    Enforce TTL and the size budget across the shared cache (see CacheIndex.sweep).
+    """
+    return cache_index.sweep_exclusive(on_evict=_evict_local)
+
+
+def save_to_cache(cache_key: str, result: Any) -> None:
+    """
+    Wrap the result in a dict with created_at and write it through all tiers:
+    memory, the local disk tier, and a background upload to GCS under cache/.
+    """
+    payload = {
+        "created_at": time.time(),
+        "result": result,
+    }
+    _memory_put(cache_key, payload)
+    cache_index.record(cache_key, payload["created_at"], result)
+    with _remote_keys_lock:
+        _recent_saves.add(cache_key)
+        if _remote_keys is not None:
+            _remote_keys.add(cache_key)
+
     try:
-        os.remove(local)
-    except OSError:
-        pass
+        staging = _disk_put(cache_key, payload)
+    except OSError as e:
+        logger.warning(f"Could not write cache entry to disk: {e}")
+        return
 
-    created = payload.get("created_at", 0)
-    if time.time() - created > CACHE_TTL_SECONDS:
+    # upload into gs://<bucket>/cache/<key>.json off the request path
+    blob_path = f"cache/{cache_key}.json"
+    try:
+        upload_manager.enqueue(staging, dest_path=blob_path, delete_after=True)
+    except Exception as e:
+        logger.warning(f"Could not queue cache upload to GCS: {e}")
+        _remove_quietly(staging)
+
+
+def load_from_cache(cache_key: str) -> Optional[Any]:
+    payload = _load_payload(cache_key)
+    if payload is None:
         return None
+    cache_index.touch(cache_key)
 
     raw_result = payload.get("result")
 
@@ -98,7 +320,7 @@ def load_from_cache(cache_key: str) -> Optional[Any]:
         for k, v in raw_result.items():
             if k == "final_audio_path" and isinstance(v, str) and v.startswith("gs://"):
                 new_result[k] = v
-                new_result["final_signed_url"] = generate_signed_url(v)
+                new_result["final_signed_url"] = signed_output_url(v)
             else:
                 new_result[k] = v
         return new_result
@@ -116,6 +338,6 @@ def load_from_cache(cache_key: str) -> Optional[Any]:
 
 def cache_exists(cache_key: str) -> bool:
     """
-    True only if a *valid* cache entry is available (locally or on GCS).
+    True only if a *valid* cache entry is available in any tier.
     """
-    return load_from_cache(cache_key) is not None
+    return _load_payload(cache_key) is not None
@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import shutil
+import threading
+from typing import Optional
+from app.logger import logger
+from app.cloud_utils import (
+    delete_many_from_gcs,
+    fetch_from_gcs,
+    get_gcs_generation,
+    list_gcs_details,
+)
+from app.upload_manager import upload_manager
+from config.params import (
+    CHECKPOINT_DIR,
+    CHECKPOINT_TTL_SECONDS,
+    GCP_AUDIO_BUCKET,
+    IS_PROD,
+)
+
+# Pipeline stages in order; each one's output feeds the next
+STAGES = ("emotion", "script", "tts", "alignment")
+# Stages whose value is an artifact path or URI
+ARTIFACT_STAGES = ("script", "tts", "alignment")
+REMOTE_PREFIX = "checkpoints/"
+
+
+class CheckpointStore:
+    """
+    Per-request record of finished pipeline stages, so a retry of the same
+    request resumes after the last good stage instead of starting over.
+
+    Each stage is written to local disk as it finishes. When a run fails, the
+    checkpoint is also uploaded, so a retry on another instance can use it.
+    In production the artifacts are the stage's GCS objects. Locally they are
+    copied next to the checkpoint, since the request's tmp_root is removed.
+    Checkpoints expire before the cache sweeper may collect the artifacts as
+    orphans.
+    """
+
+    def __init__(
+        self,
+        directory: str = CHECKPOINT_DIR,
+        ttl_seconds: int = CHECKPOINT_TTL_SECONDS,
+    ):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._remote_keys = set()  # keys with a copy in the bucket
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _remote_uri(self, key: str) -> str:
+        return f"gs://{GCP_AUDIO_BUCKET}/{REMOTE_PREFIX}{key}.json"
+
+    def resume(self, key: str) -> dict:
+        """
+        The stages a retry can skip: the longest run of recorded stages, from
+        the first, whose artifacts still exist.
+        """
+        payload = self._read(key)
+        if payload is None:
+            return {}
+        resumed = {}
+        for stage in STAGES:
+            value = payload["stages"].get(stage)
+            if value is None or (stage in ARTIFACT_STAGES and not _available(value)):
+                break
+            resumed[stage] = value
+        if resumed:
+            logger.info(f"Resuming {key} after stages: {', '.join(resumed)}")
+        return resumed
+
+    def record(self, key: str, stage: str, value):
+        if stage in ARTIFACT_STAGES and not IS_PROD:
+            value = self._keep_local(key, value)
+        with self._lock:
+            payload = self._read_local(key) or {"stages": {}}
+            payload["stages"][stage] = value
+            payload["updated_at"] = time.time()
+            self._write_local(key, payload)
+
+    def failed(self, key: str):
+        """
+        Publish the checkpoint of a failed run for retries on other instances.
+        """
+        if not IS_PROD or not os.path.exists(self._path(key)):
+            return
+        try:
+            upload_manager.enqueue(
+                self._path(key), dest_path=f"{REMOTE_PREFIX}{key}.json"
+            )
+            self._remote_keys.add(key)
+        except Exception as e:
+            logger.warning(f"Could not upload checkpoint {key}: {e}")
+
+    def clear(self, key: str):
+        """
+        Forget a checkpoint once its request has succeeded.
+        """
+        with self._lock:
+            _remove_quietly(self._path(key))
+            shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+            remote = key in self._remote_keys
+            self._remote_keys.discard(key)
+        if remote:
+            try:
+                delete_many_from_gcs([f"{REMOTE_PREFIX}{key}.json"])
+            except Exception as e:
+                logger.warning(f"Could not delete checkpoint {key}: {e}")
+
+    def prune(self) -> int:
+        """
+        Delete expired checkpoints, locally and (in production) in the bucket.
+        """
+        now = time.time()
+        removed = 0
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if not name.endswith(".json"):
+                    continue
+                key = name[: -len(".json")]
+                payload = self._read_local(key)
+                if payload is None or now - payload["updated_at"] > self.ttl_seconds:
+                    with self._lock:
+                        _remove_quietly(self._path(key))
+                        shutil.rmtree(
+                            os.path.join(self.directory, key), ignore_errors=True
+                        )
+                    removed += 1
+        if IS_PROD:
+            expired = [
+                obj["name"]
+                for obj in list_gcs_details(REMOTE_PREFIX)
+                if now - obj["updated"] > self.ttl_seconds
+            ]
+            delete_many_from_gcs(expired)
+            removed += len(expired)
+        return removed
+
+    # --- internals ---
+
+    def _read(self, key: str) -> Optional[dict]:
+        payload = self._read_local(key)
+        if payload is None and IS_PROD:
+            payload = self._read_remote(key)
+        if payload is None or time.time() - payload["updated_at"] > self.ttl_seconds:
+            return None
+        return payload
+
+    def _read_local(self, key: str) -> Optional[dict]:
+        try:
+            with open(self._path(key), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _read_remote(self, key: str) -> Optional[dict]:
+        local_path = None
+        try:
+            local_path = fetch_from_gcs(self._remote_uri(key))
+            with open(local_path, "r") as f:
+                payload = json.load(f)
+            self._remote_keys.add(key)
+            return payload
+        except Exception:
+            return None
+        finally:
+            if local_path is not None:
+                _remove_quietly(local_path)
+
+    def _write_local(self, key: str, payload: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        part = f"{self._path(key)}.{os.getpid()}.part"
+        with open(part, "w") as f:
+            json.dump(payload, f)
+        os.replace(part, self._path(key))
+
+    def _keep_local(self, key: str, path: str) -> str:
+        folder = os.path.join(self.directory, key)
+        os.makedirs(folder, exist_ok=True)
+        kept = os.path.join(folder, os.path.basename(path))
+        if os.path.abspath(path) != kept:
+            shutil.copyfile(path, kept)
+        return kept
+
+
+def _available(path: str) -> bool:
+    if not path.startswith("gs://"):
+        return os.path.exists(path)
+    if upload_manager.local_copy(path) is not None:
+        return True
+    try:
+        return get_gcs_generation(path) is not None
+    except Exception:
+        return False
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+checkpoint_store = CheckpointStore()
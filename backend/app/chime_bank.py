@@ -0,0 +1,85 @@
+import random
+import threading
+import numpy as np
+from typing import Iterator, Optional
+from app.logger import logger
+from app.asset_cache import asset_cache
+from app.asset_index import get_indexed_manifest
+from app.audio_utils import load_and_clean_audio_asset, normalize_volume
+from config.emotion_to_audio import EMOTION_TO_AUDIO
+from config.params import INTERCHIME_VOLUME_DBFS
+
+
+class ChimeBank:
+    """
+    Interchime variants per folder, loaded and normalized once and shared by
+    every request as read-only arrays. A folder is reloaded when its manifest
+    or the version of one of its chimes changes.
+    """
+
+    def __init__(self):
+        # (folder, target_dBFS) -> (versions, [(filename, array)])
+        self._folders = {}
+        self._lock = threading.Lock()
+
+    def variants(
+        self, folder: str, target_dBFS: Optional[float] = INTERCHIME_VOLUME_DBFS
+    ) -> list:
+        """
+        [(filename, array)] for every chime in the folder, in manifest order.
+        """
+        filenames = get_indexed_manifest(folder) or asset_cache.get_manifest(folder)
+        rel_paths = [f"chimes/{folder}/{filename}" for filename in filenames]
+        versions = tuple(asset_cache.version(rel_path) for rel_path in rel_paths)
+        key = (folder, target_dBFS)
+
+        with self._lock:
+            entry = self._folders.get(key)
+        if entry is not None and entry[0] == versions and None not in versions:
+            return entry[1]
+
+        chimes = []
+        for filename, rel_path in zip(filenames, rel_paths):
+            chime = load_and_clean_audio_asset(rel_path)
+            if target_dBFS is not None:
+                chime = normalize_volume(chime, target_dBFS, rel_path=rel_path)
+            chime.flags.writeable = False
+            chimes.append((filename, chime))
+        if None not in versions:
+            with self._lock:
+                self._folders[key] = (versions, chimes)
+        logger.debug(f"Loaded {len(chimes)} interchimes from {folder}")
+        return chimes
+
+    def rotation(
+        self,
+        folder: str,
+        target_dBFS: Optional[float] = INTERCHIME_VOLUME_DBFS,
+        rng: Optional[random.Random] = None,
+    ) -> Iterator[np.ndarray]:
+        """
+        Endless per-request sequence of chimes: each pass plays every variant
+        once in a fresh shuffled order.
+        """
+        chimes = [chime for _, chime in self.variants(folder, target_dBFS)]
+        if not chimes:
+            raise FileNotFoundError(f"No interchimes found in chimes/{folder}")
+        rng = rng or random.Random()
+        while True:
+            order = list(range(len(chimes)))
+            rng.shuffle(order)
+            for i in order:
+                yield chimes[i]
+
+    def preload(self):
+        """
+        Load the interchime folder of every emotion profile.
+        """
+        for folder in sorted({p["interchimes"] for p in EMOTION_TO_AUDIO.values()}):
+            try:
+                self.variants(folder)
+            except Exception as e:
+                logger.warning(f"Could not preload interchimes from {folder}: {e}")
+
+
+chime_bank = ChimeBank()
@@ -1,33 +1,54 @@
 import os
-import json
+import time
 import shutil
 import tempfile
+import threading
+from collections import OrderedDict
 from typing import Optional
 from app.logger import logger
 from urllib.parse import quote
-from google.cloud import storage
-from google.oauth2 import service_account
+from app.storage import get_storage
 from config.params import (
     GCP_AUDIO_BUCKET,
     IS_PROD,
-    IS_LOCAL_TEST,
     AUDIO_ROOT,
+    UPLOAD_CHUNK_SIZE_BYTES,
+    UPLOAD_RESUMABLE_THRESHOLD_BYTES,
+    SIGNED_URL_MIN_REMAINING_SECONDS,
+    SIGNED_URL_CACHE_ENTRIES,
 )
 
-if IS_PROD and not IS_LOCAL_TEST:
-    credentials = service_account.Credentials.from_service_account_info(
-        json.loads(os.getenv("GOOGLE_APPLICATION_CREDENTIALS"))
-    )
+# (bucket, object, disposition, expiration_minutes) -> (url, expires_at)
+_signed_urls = OrderedDict()
+_signed_urls_lock = threading.Lock()
+
+
+def split_gcs_uri(gcs_path: str) -> tuple:
+    """
+    Split gs://bucket/object into (bucket, object).
+    """
+    if not gcs_path.startswith("gs://"):
+        raise ValueError("GCS path must start with 'gs://'")
+
+    parts = gcs_path[5:].split("/", 1)
+    if len(parts) != 2:
+        raise ValueError("Invalid GCS path format")
+    return parts[0], parts[1]
 
-    client = storage.Client(credentials=credentials)
-elif IS_PROD and IS_LOCAL_TEST:
-    credentials = service_account.Credentials.from_service_account_file(
-        os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-    )
 
-    client = storage.Client(credentials=credentials)
-else:
-    client = storage.Client()
+def blob_path_for(local_path: str, dest_path: str = None) -> str:
+    """
+    Object path an upload of local_path lands on when no dest_path is given.
+    """
+    if dest_path:
+        return dest_path
+    if local_path.startswith(AUDIO_ROOT):
+        # Preserve subfolder structure for project audio assets
+        rel_path = os.path.relpath(local_path, AUDIO_ROOT)
+        return rel_path.replace(os.sep, "/")
+    # For files outside AUDIO_ROOT (e.g., /tmp), bucket folder = parent directory
+    folder = os.path.basename(os.path.dirname(local_path))
+    return f"{folder}/{os.path.basename(local_path)}"
 
 
 def upload_to_gcs(
@@ -36,36 +57,29 @@ def upload_to_gcs(
     if not os.path.exists(local_path):
         raise FileNotFoundError(f"Local file not found: {local_path}")
 
-    bucket = client.bucket(bucket_name)
-    if dest_path:
-        blob_path = dest_path
-    else:
-        if local_path.startswith(AUDIO_ROOT):
-            # Preserve subfolder structure for project audio assets
-            rel_path = os.path.relpath(local_path, AUDIO_ROOT)
-            blob_path = rel_path.replace(os.sep, "/")
-        else:
-            # For files outside AUDIO_ROOT (e.g., /tmp), bucket folder = parent directory
-            folder = os.path.basename(os.path.dirname(local_path))
-            blob_path = f"{folder}/{os.path.basename(local_path)}"
-    blob = bucket.blob(blob_path)
-
-    blob.upload_from_filename(local_path)
+    blob_path = blob_path_for(local_path, dest_path)
+    # Large files (final mixes) go up as a chunked, resumable upload
+    chunk_size = None
+    if os.path.getsize(local_path) > UPLOAD_RESUMABLE_THRESHOLD_BYTES:
+        chunk_size = UPLOAD_CHUNK_SIZE_BYTES
+    get_storage().upload(local_path, bucket_name, blob_path, chunk_size=chunk_size)
     logger.info(f"Uploaded {local_path} to gs://{bucket_name}/{blob_path}")
     return f"gs://{bucket_name}/{blob_path}"
 
 
-def fetch_from_gcs(gcs_path: str, dest_path: Optional[str] = None) -> str:
-    if not gcs_path.startswith("gs://"):
-        raise ValueError("GCS path must start with 'gs://'")
+def open_gcs_writer(
+    dest_path: str, bucket_name: str = GCP_AUDIO_BUCKET, content_type: str = None
+) -> tuple:
+    """
+    Start a streaming upload to gs://bucket_name/dest_path.
+    Returns (gcs_uri, writer); the object appears when the writer is closed.
+    """
+    writer = get_storage().open_write(bucket_name, dest_path, content_type)
+    return f"gs://{bucket_name}/{dest_path}", writer
 
-    parts = gcs_path.replace("gs://", "").split("/", 1)
-    if len(parts) != 2:
-        raise ValueError("Invalid GCS path format")
 
-    bucket_name, blob_path = parts
-    bucket = client.bucket(bucket_name)
-    blob = bucket.blob(blob_path)
+def fetch_from_gcs(gcs_path: str, dest_path: Optional[str] = None) -> str:
+    bucket_name, blob_path = split_gcs_uri(gcs_path)
 
     if dest_path is None:
         _, ext = os.path.splitext(blob_path)
@@ -74,21 +88,64 @@ def fetch_from_gcs(gcs_path: str, dest_path: Optional[str] = None) -> str:
     else:
         tmp_path = dest_path
 
-    blob.download_to_filename(tmp_path)
+    get_storage().download(bucket_name, blob_path, tmp_path)
     logger.info(f"Downloaded {gcs_path} to temp file: {tmp_path}")
     return tmp_path
 
 
+def get_gcs_generation(gcs_path: str) -> Optional[int]:
+    """
+    Return the current generation of a GCS object, or None if it does not exist.
+    Only fetches object metadata, never the payload.
+    """
+    bucket_name, blob_path = split_gcs_uri(gcs_path)
+    return get_storage().generation(bucket_name, blob_path)
+
+
+def list_gcs(prefix: str, bucket_name: str = GCP_AUDIO_BUCKET) -> list:
+    """
+    Return the object names under a prefix of the bucket.
+    """
+    return get_storage().list(bucket_name, prefix)
+
+
+def list_gcs_details(prefix: str, bucket_name: str = GCP_AUDIO_BUCKET) -> list:
+    """
+    Return {name, size, updated} for the objects under a prefix of the bucket.
+    """
+    return get_storage().list_details(bucket_name, prefix)
+
+
+def delete_many_from_gcs(blob_paths: list, bucket_name: str = GCP_AUDIO_BUCKET):
+    if blob_paths:
+        get_storage().delete_many(bucket_name, blob_paths)
+        logger.info(f"Deleted {len(blob_paths)} objects from gs://{bucket_name}")
+
+
+def delete_from_gcs(gcs_path: str) -> None:
+    bucket_name, blob_path = split_gcs_uri(gcs_path)
+    get_storage().delete(bucket_name, blob_path)
+    logger.debug(f"Deleted {gcs_path}")
+
+
 def resolve_asset(path: str, tmp_root: str = "/tmp") -> str:
     """
     Resolves a path to a local file.
     - In dev (IS_PROD=False), returns the original path.
     - In prod, if path starts with "gs://", downloads into tmp_root and returns that local path.
+    The download is a single request; a missing object raises FileNotFoundError.
+    Artifacts queued for background upload by this process resolve to their local file.
     """
     # If not in production or this isn't a GCS URI, just return as-is
     if not IS_PROD or not path.startswith("gs://"):
         return path
 
+    from app.upload_manager import upload_manager
+
+    local_copy = upload_manager.local_copy(path)
+    if local_copy is not None:
+        return local_copy
+
     # Split off "gs://bucket/..."
     _, bucket_path = path.split("gs://", 1)
     parts = bucket_path.split("/", 1)
@@ -99,13 +156,7 @@ def resolve_asset(path: str, tmp_root: str = "/tmp") -> str:
     local_dest = os.path.join(tmp_root, blob_path)
     os.makedirs(os.path.dirname(local_dest), exist_ok=True)
 
-    bucket = client.bucket(bucket_name)
-    blob = bucket.blob(blob_path)
-
-    if not blob.exists():
-        raise FileNotFoundError(f"GCS blob does not exist: {path}")
-
-    blob.download_to_filename(local_dest)
+    get_storage().download(bucket_name, blob_path, local_dest)
     logger.info(f"Downloaded {path} to {local_dest}")
     return local_dest
 
@@ -114,6 +165,8 @@ def generate_signed_url(gcs_uri: str, expiration_minutes: int = 60) -> str:
     """
     Convert a gs://bucket/object URI into a signed HTTPS URL.
     Only used in production to allow public access to private GCS objects.
+    URLs are memoized and reissued only once less than
+    SIGNED_URL_MIN_REMAINING_SECONDS of their lifetime is left.
     """
     if not gcs_uri.startswith("gs://"):
         return gcs_uri
@@ -127,15 +180,24 @@ def generate_signed_url(gcs_uri: str, expiration_minutes: int = 60) -> str:
         raise ValueError("Invalid GCS URI format")
 
     bucket_name, blob_name = parts
-    bucket = client.bucket(bucket_name)
-    blob = bucket.blob(blob_name)
-
-    url = blob.generate_signed_url(
-        version="v4",
-        expiration=expiration_minutes * 60,
-        method="GET",
-        response_disposition=f'inline; filename="{quote(blob_name)}"',
+    disposition = f'inline; filename="{quote(blob_name)}"'
+    key = (bucket_name, blob_name, disposition, expiration_minutes)
+    now = time.time()
+
+    with _signed_urls_lock:
+        cached = _signed_urls.get(key)
+        if cached is not None and cached[1] - now > SIGNED_URL_MIN_REMAINING_SECONDS:
+            _signed_urls.move_to_end(key)
+            return cached[0]
+
+    url = get_storage().signed_url(
+        bucket_name, blob_name, expiration_minutes, disposition
     )
+    with _signed_urls_lock:
+        _signed_urls[key] = (url, now + expiration_minutes * 60)
+        _signed_urls.move_to_end(key)
+        while len(_signed_urls) > SIGNED_URL_CACHE_ENTRIES:
+            _signed_urls.popitem(last=False)
     return url
 
 
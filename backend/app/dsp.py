@@ -0,0 +1,81 @@
+import math
+import numpy as np
+from app.mixer import INT16_MIN
+from config.params import PCM_SAMPLE_RATE
+
+# Filters run on float32 (frames, channels) arrays in int16 scale, like the
+# mixer, and carry their state between calls so long tracks can be processed
+# block by block.
+
+# Terms of a recurrence weighted below this are dropped from the scan
+SCAN_EPSILON = 1e-9
+
+
+def one_pole_alpha(cutoff: float, sample_rate: int = PCM_SAMPLE_RATE) -> float:
+    """
+    Smoothing factor of the RC low-pass pydub's low_pass_filter implements.
+    """
+    rc = 1.0 / (cutoff * 2 * math.pi)
+    dt = 1.0 / sample_rate
+    return dt / (rc + dt)
+
+
+def _recurrence(u: np.ndarray, decay: float) -> np.ndarray:
+    """
+    Solve y[n] = decay * y[n-1] + u[n] (y[-1] = 0) in place along axis 0.
+
+    A log-step prefix scan: after the pass with stride s every y[n] holds the
+    terms u[n-k] for k < 2s. The weights decay ** k fall off geometrically, so
+    the scan stops once the remaining ones are negligible instead of running
+    log2(len(u)) passes.
+    """
+    stride, weight = 1, decay
+    while stride < len(u) and weight > SCAN_EPSILON:
+        u[stride:] += np.float32(weight) * u[:-stride]
+        stride *= 2
+        weight *= weight
+    return u
+
+
+class LowPass:
+    """
+    One-pole low-pass, y[n] = y[n-1] + alpha * (x[n] - y[n-1]), starting from
+    the first sample, which is pydub's low_pass_filter without the per-sample
+    Python loop. Output is float; pydub truncated each sample to int.
+    """
+
+    def __init__(self, cutoff: float, sample_rate: int = PCM_SAMPLE_RATE):
+        self.alpha = one_pole_alpha(cutoff, sample_rate)
+        self.last = None  # last output per channel
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """
+        Filter `block` in place, continuing from the previous block.
+        """
+        if len(block) == 0:
+            return block
+        decay = 1.0 - self.alpha
+        first = block[0].copy()
+        block *= np.float32(self.alpha)
+        if self.last is None:
+            block[0] = first
+        else:
+            block[0] += np.float32(decay) * self.last
+        _recurrence(block, decay)
+        self.last = block[-1].copy()
+        return block
+
+
+def peak(buf: np.ndarray) -> float:
+    return float(np.abs(buf).max()) if buf.size else 0.0
+
+
+def normalize_gain(peak_value: float, headroom: float = 0.1) -> float:
+    """
+    Gain in dB that brings a peak to `headroom` dB below full scale, as
+    pydub.effects.normalize computes it; 0 for silence.
+    """
+    if peak_value <= 0:
+        return 0.0
+    target = -INT16_MIN * 10 ** (-headroom / 20.0)
+    return 20 * math.log10(target / peak_value)
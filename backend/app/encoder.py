@@ -0,0 +1,147 @@
+import threading
+import subprocess
+import numpy as np
+from pydub import AudioSegment
+from app.logger import logger
+from config.params import (
+    PCM_SAMPLE_RATE,
+    PCM_CHANNELS,
+    OUTPUT_FORMAT,
+    OUTPUT_BITRATE,
+)
+
+OUTPUT_FORMATS = {
+    "mp3": {
+        "codec": "libmp3lame",
+        "container": "mp3",
+        "extension": ".mp3",
+        "content_type": "audio/mpeg",
+        "bitrate": "128k",
+    },
+    "opus": {
+        "codec": "libopus",
+        "container": "ogg",
+        "extension": ".opus",
+        "content_type": "audio/ogg",
+        "bitrate": "64k",
+        "sample_rate": 48000,  # the only full-band rate Opus encodes at
+    },
+    "aac": {
+        "codec": "aac",
+        "container": "adts",  # streamable, unlike mp4, which seeks back to write its index
+        "extension": ".aac",
+        "content_type": "audio/aac",
+        "bitrate": "96k",
+    },
+}
+
+READ_CHUNK_BYTES = 64 * 1024
+
+
+def output_spec(fmt: str = OUTPUT_FORMAT) -> dict:
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(
+            f"Unknown output format '{fmt}', expected one of {list(OUTPUT_FORMATS)}"
+        )
+    return OUTPUT_FORMATS[fmt]
+
+
+def pcm_input_args() -> list:
+    """
+    ffmpeg command up to its input: canonical raw PCM on stdin.
+    """
+    return [
+        AudioSegment.converter,
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-f",
+        "s16le",
+        "-ar",
+        str(PCM_SAMPLE_RATE),
+        "-ac",
+        str(PCM_CHANNELS),
+        "-i",
+        "pipe:0",
+    ]
+
+
+class EncoderSink:
+    """
+    Timeline sink that pipes canonical PCM blocks into an ffmpeg process over
+    stdin and streams the encoded bytes to `dest` (an ObjectWriter) as they come
+    out. Nothing touches disk; dest is closed on success and aborted on failure.
+    """
+
+    def __init__(self, dest, fmt: str = OUTPUT_FORMAT, bitrate: str = OUTPUT_BITRATE):
+        spec = output_spec(fmt)
+        self.dest = dest
+        self.bytes_out = 0
+        cmd = pcm_input_args() + [
+            "-c:a",
+            spec["codec"],
+            "-b:a",
+            bitrate or spec["bitrate"],
+        ]
+        if "sample_rate" in spec:
+            cmd += ["-ar", str(spec["sample_rate"])]
+        cmd += ["-f", spec["container"], "pipe:1"]
+
+        self._proc = subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        self._stderr = b""
+        self._error = None
+        self._pump = threading.Thread(target=self._pump_output, daemon=True)
+        self._stderr_reader = threading.Thread(target=self._read_stderr, daemon=True)
+        self._pump.start()
+        self._stderr_reader.start()
+
+    def _pump_output(self):
+        try:
+            while True:
+                chunk = self._proc.stdout.read(READ_CHUNK_BYTES)
+                if not chunk:
+                    break
+                self.dest.write(chunk)
+                self.bytes_out += len(chunk)
+        except Exception as e:
+            self._error = e
+            self._proc.kill()
+
+    def _read_stderr(self):
+        self._stderr = self._proc.stderr.read()
+
+    def write(self, block: np.ndarray):
+        try:
+            self._proc.stdin.write(block.tobytes())
+        except BrokenPipeError:
+            raise RuntimeError(self._failure())
+
+    def _finish(self) -> int:
+        try:
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        self._pump.join()
+        self._stderr_reader.join()
+        return self._proc.wait()
+
+    def _failure(self) -> str:
+        self._finish()
+        if self._error is not None:
+            return f"Writing encoded audio failed: {self._error}"
+        return f"ffmpeg encoder failed: {self._stderr.decode(errors='replace').strip()}"
+
+    def close(self):
+        returncode = self._finish()
+        if returncode != 0 or self._error is not None:
+            self.dest.abort()
+            raise RuntimeError(self._failure())
+        self.dest.close()
+        logger.debug(f"Encoded {self.bytes_out} bytes")
+
+    def abort(self):
+        self._proc.kill()
+        self._finish()
+        self.dest.abort()
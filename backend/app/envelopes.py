@@ -0,0 +1,78 @@
+import numpy as np
+
+# Fade shapes:
+#   linear       gain ramps linearly in amplitude (what pydub's fades do)
+#   exponential  gain ramps linearly in dB between floor_db and 0 dB;
+#                `power` bends the dB ramp (t ** power), e.g. 2.5 for a slow start
+#   equal_power  sine/cosine quarter wave, for crossfades that hold loudness
+SHAPES = ("linear", "exponential", "equal_power")
+
+
+def fade_curve(
+    frames: int,
+    shape: str = "linear",
+    fade_out: bool = False,
+    floor_db: float = -60.0,
+    power: float = 1.0,
+    start: int = 0,
+    count: int = None,
+) -> np.ndarray:
+    """
+    Per-frame gain curve, float32, starting at silence (or floor_db) and ending at
+    unity gain; reversed when fade_out is True. `start` and `count` select a
+    stretch of the curve, so block renderers never build the whole thing.
+    """
+    if shape not in SHAPES:
+        raise ValueError(f"Unknown fade shape '{shape}', expected one of {SHAPES}")
+    if count is None:
+        count = frames - start
+    if frames <= 0 or count <= 0:
+        return np.ones(0, dtype=np.float32)
+
+    t = np.arange(start, start + count, dtype=np.float64) / max(frames - 1, 1)
+    if fade_out:
+        t = 1.0 - t
+
+    if shape == "linear":
+        gain = t
+    elif shape == "exponential":
+        gain = 10 ** (floor_db * (1.0 - t) ** power / 20.0)
+    else:
+        gain = np.sin(t * (np.pi / 2))
+    return gain.astype(np.float32)
+
+
+def fade_in(
+    buf: np.ndarray, frames: int, shape: str = "linear", **kwargs
+) -> np.ndarray:
+    """
+    Fade in the first `frames` frames of buf, in place.
+    """
+    frames = min(frames, len(buf))
+    buf[:frames] *= fade_curve(frames, shape, **kwargs)[:, None]
+    return buf
+
+
+def fade_out(
+    buf: np.ndarray, frames: int, shape: str = "linear", **kwargs
+) -> np.ndarray:
+    """
+    Fade out the last `frames` frames of buf, in place.
+    """
+    frames = min(frames, len(buf))
+    buf[len(buf) - frames :] *= fade_curve(frames, shape, fade_out=True, **kwargs)[
+        :, None
+    ]
+    return buf
+
+
+def crossfade(
+    outgoing: np.ndarray, incoming: np.ndarray, shape: str = "linear"
+) -> np.ndarray:
+    """
+    Mix two equally long buffers, fading the first out while the second fades in.
+    """
+    frames = min(len(outgoing), len(incoming))
+    mixed = outgoing[:frames] * fade_curve(frames, shape, fade_out=True)[:, None]
+    mixed += incoming[:frames] * fade_curve(frames, shape)[:, None]
+    return mixed
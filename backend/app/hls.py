@@ -0,0 +1,300 @@
+import os
+import threading
+import contextvars
+import subprocess
+import numpy as np
+from concurrent.futures import Future
+from typing import Callable, Optional
+from app.logger import logger
+from app.progress import progress
+from app.encoder import output_spec, pcm_input_args
+from app.storage import get_storage
+from app.cloud_utils import fetch_from_gcs, generate_signed_url, split_gcs_uri
+from config.params import (
+    HLS_READY_SEGMENTS,
+    HLS_SEGMENT_SECONDS,
+    OUTPUT_BITRATE,
+)
+
+PLAYLIST_NAME = "index.m3u8"
+# Copy of the playlist with signed segment URLs, for private buckets
+SIGNED_PLAYLIST_NAME = "playlist.m3u8"
+PLAYLIST_CONTENT_TYPE = "application/vnd.apple.mpegurl"
+SEGMENT_CONTENT_TYPE = "video/mp2t"
+POLL_SECONDS = 0.25
+
+
+def playlist_segments(text: str) -> list:
+    return [
+        line.strip()
+        for line in text.splitlines()
+        if line.strip() and not line.startswith("#")
+    ]
+
+
+def sign_playlist_text(text: str, prefix_uri: str) -> str:
+    """
+    Replace each segment name with a signed URL for prefix_uri/<segment>.
+    """
+    lines = []
+    for line in text.splitlines():
+        if line.strip() and not line.startswith("#"):
+            line = generate_signed_url(f"{prefix_uri}/{line.strip()}")
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+def _put(uri: str, data: bytes, content_type: str):
+    bucket_name, blob_path = split_gcs_uri(uri)
+    writer = get_storage().open_write(bucket_name, blob_path, content_type)
+    writer.write(data)
+    writer.close()
+
+
+def signed_playlist_url(playlist_uri: str) -> str:
+    """
+    Re-sign a stored playlist: write playlist.m3u8 beside it with fresh
+    segment URLs and return a signed URL for that copy.
+    """
+    prefix_uri = playlist_uri.rsplit("/", 1)[0]
+    local_path = fetch_from_gcs(playlist_uri)
+    try:
+        with open(local_path, "r") as f:
+            text = f.read()
+    finally:
+        os.remove(local_path)
+    signed_uri = f"{prefix_uri}/{SIGNED_PLAYLIST_NAME}"
+    _put(
+        signed_uri,
+        sign_playlist_text(text, prefix_uri).encode(),
+        PLAYLIST_CONTENT_TYPE,
+    )
+    return generate_signed_url(signed_uri)
+
+
+def signed_output_url(gcs_uri: str) -> str:
+    """
+    Signed URL for a final output: the file itself, or a signed playlist.
+    """
+    if gcs_uri.endswith(".m3u8"):
+        if render_pending(gcs_uri):
+            # Still being published, signed copy included; don't race the publisher
+            prefix_uri = gcs_uri.rsplit("/", 1)[0]
+            return generate_signed_url(f"{prefix_uri}/{SIGNED_PLAYLIST_NAME}")
+        return signed_playlist_url(gcs_uri)
+    return generate_signed_url(gcs_uri)
+
+
+class HLSSink:
+    """
+    Timeline sink that encodes canonical PCM into AAC MPEG-TS segments with
+    ffmpeg's HLS muxer, writing them to local_dir. When a prefix_uri is given,
+    a publisher thread uploads each segment as soon as ffmpeg lists it in the
+    playlist, then republishes the playlist (plus a signed copy), so playback
+    can start long before the render ends. Without one, local_dir is the
+    published location.
+    """
+
+    def __init__(
+        self,
+        local_dir: str,
+        prefix_uri: Optional[str] = None,
+        bitrate: str = OUTPUT_BITRATE,
+        segment_seconds: int = HLS_SEGMENT_SECONDS,
+        ready_segments: int = HLS_READY_SEGMENTS,
+    ):
+        os.makedirs(local_dir, exist_ok=True)
+        self.local_dir = local_dir
+        self.prefix_uri = prefix_uri
+        self.ready_segments = ready_segments
+        self.published = []
+        self.error = None
+        self._ready = threading.Event()
+        self._done = threading.Event()
+        self._playlist_text = None
+        self._playlist_path = os.path.join(local_dir, PLAYLIST_NAME)
+        self._job_id = progress.current_job()
+
+        cmd = pcm_input_args() + [
+            "-c:a",
+            "aac",
+            "-b:a",
+            bitrate or output_spec("aac")["bitrate"],
+            "-f",
+            "hls",
+            "-hls_time",
+            str(segment_seconds),
+            "-hls_playlist_type",
+            "event",
+            "-hls_flags",
+            "temp_file",
+            "-hls_segment_filename",
+            os.path.join(local_dir, "seg_%05d.ts"),
+            self._playlist_path,
+        ]
+        self._proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        self._stderr = b""
+        self._stderr_reader = threading.Thread(target=self._read_stderr, daemon=True)
+        self._publisher = threading.Thread(target=self._publish_loop, daemon=True)
+        self._stderr_reader.start()
+        self._publisher.start()
+
+    @property
+    def playlist_uri(self) -> str:
+        if self.prefix_uri is None:
+            return self._playlist_path
+        return f"{self.prefix_uri}/{PLAYLIST_NAME}"
+
+    def wait_ready(self, timeout: Optional[float] = None):
+        """
+        Block until the first ready_segments segments are published (or the
+        whole, shorter, session is). Raises if the render failed before that.
+        """
+        self._ready.wait(timeout)
+        if self.error is not None and len(self.published) < self.ready_segments:
+            raise RuntimeError(self.error)
+
+    def write(self, block: np.ndarray):
+        if self.error is not None:
+            raise RuntimeError(self.error)
+        try:
+            self._proc.stdin.write(block.tobytes())
+        except BrokenPipeError:
+            self._finish()
+            self._fail(f"ffmpeg HLS encoder failed: {self._stderr_text()}")
+            raise RuntimeError(self.error)
+
+    def close(self):
+        returncode = self._finish()
+        if returncode != 0:
+            self._fail(f"ffmpeg HLS encoder failed: {self._stderr_text()}")
+            raise RuntimeError(self.error)
+        self._done.set()
+        self._publisher.join()
+        if self.error is not None:
+            raise RuntimeError(self.error)
+        logger.debug(f"Published {len(self.published)} HLS segments")
+
+    def abort(self):
+        self._proc.kill()
+        self._finish()
+        self._fail("Render aborted")
+
+    # --- internals ---
+
+    def _read_stderr(self):
+        self._stderr = self._proc.stderr.read()
+
+    def _stderr_text(self) -> str:
+        return self._stderr.decode(errors="replace").strip()
+
+    def _finish(self) -> int:
+        try:
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        self._stderr_reader.join()
+        return self._proc.wait()
+
+    def _fail(self, message: str):
+        if self.error is None:
+            self.error = message
+        self._done.set()
+        self._ready.set()
+
+    def _publish_loop(self):
+        try:
+            while not self._done.wait(POLL_SECONDS):
+                self._publish()
+            if self.error is None:
+                self._publish()
+        except Exception as e:
+            self._fail(f"Publishing HLS segments failed: {e}")
+        finally:
+            self._ready.set()
+
+    def _publish(self):
+        try:
+            with open(self._playlist_path, "r") as f:
+                text = f.read()
+        except FileNotFoundError:
+            return
+        if text == self._playlist_text:
+            return
+
+        segments = playlist_segments(text)
+        new_segments = segments[len(self.published) :]
+        for name in new_segments:
+            if self.prefix_uri is not None:
+                with open(os.path.join(self.local_dir, name), "rb") as f:
+                    _put(f"{self.prefix_uri}/{name}", f.read(), SEGMENT_CONTENT_TYPE)
+            self.published.append(name)
+        if self.prefix_uri is not None:
+            _put(self.playlist_uri, text.encode(), PLAYLIST_CONTENT_TYPE)
+            _put(
+                f"{self.prefix_uri}/{SIGNED_PLAYLIST_NAME}",
+                sign_playlist_text(text, self.prefix_uri).encode(),
+                PLAYLIST_CONTENT_TYPE,
+            )
+        self._playlist_text = text
+        if new_segments:
+            progress.emit(
+                "upload",
+                self._job_id,
+                segments=len(self.published),
+                complete="#EXT-X-ENDLIST" in text,
+            )
+
+        if len(self.published) >= self.ready_segments or "#EXT-X-ENDLIST" in text:
+            self._ready.set()
+
+
+# Renders that outlive their request, by output path, until someone waits on them
+_renders = {}
+_renders_lock = threading.Lock()
+
+
+def render_in_background(key: str, render: Callable[[], None]) -> Future:
+    future = Future()
+
+    def run():
+        try:
+            render()
+            future.set_result(key)
+        except BaseException as e:
+            logger.error(f"Background render of {key} failed: {e}", exc_info=True)
+            future.set_exception(e)
+
+    with _renders_lock:
+        _renders[key] = future
+    # Carry the request's context (progress job) into the render thread
+    context = contextvars.copy_context()
+    threading.Thread(
+        target=context.run, args=(run,), name="render", daemon=True
+    ).start()
+    return future
+
+
+def wait_for_render(key: str, timeout: Optional[float] = None) -> bool:
+    """
+    Wait for a background render and forget it; True if it finished (or none
+    was running), False if it failed.
+    """
+    with _renders_lock:
+        future = _renders.get(key)
+    if future is None:
+        return True
+    failed = future.exception(timeout) is not None
+    with _renders_lock:
+        _renders.pop(key, None)
+    return not failed
+
+
+def render_pending(key: str) -> bool:
+    with _renders_lock:
+        return key in _renders
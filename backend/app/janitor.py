@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import socket
+import shutil
+import tempfile
+import threading
+from app.logger import logger
+from config.params import (
+    TMP_DISK_QUOTA_BYTES,
+    TMP_IDLE_SECONDS,
+)
+
+# Per-request work dirs: minday-<request id>, minday-batch-*, minday-library-*
+TMP_DIR_PREFIX = "minday-"
+# Under quota pressure, dirs idle this long are fair game even if not abandoned
+QUOTA_MIN_IDLE_SECONDS = 60
+# Written into each work dir by claim(): the process that uses it
+OWNER_FILENAME = ".owner"
+
+
+def claim(tmp_root: str) -> str:
+    """
+    Mark tmp_root as owned by this process, so janitors in other processes
+    leave it alone while the process lives. Returns tmp_root.
+    """
+    with open(os.path.join(tmp_root, OWNER_FILENAME), "w") as f:
+        json.dump({"pid": os.getpid(), "host": socket.gethostname()}, f)
+    return tmp_root
+
+
+def _owner(path: str):
+    """
+    "self", "alive" or "dead" for a claimed dir; None if it has no owner marker.
+    """
+    try:
+        with open(os.path.join(path, OWNER_FILENAME), "r") as f:
+            owner = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        return "alive"  # being written, or unreadable: assume in use
+    if owner.get("host") != socket.gethostname():
+        return "alive"  # a shared temp dir; we cannot see that process
+    if owner.get("pid") == os.getpid():
+        return "self"
+    try:
+        os.kill(owner["pid"], 0)
+    except ProcessLookupError:
+        return "dead"
+    except (OSError, KeyError, TypeError):
+        pass
+    return "alive"
+
+
+def _usage(path: str) -> tuple:
+    """
+    (bytes, newest mtime) of a directory tree.
+    """
+    total, newest = 0, os.stat(path).st_mtime
+    for root, dirs, files in os.walk(path):
+        for name in dirs + files:
+            try:
+                st = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            newest = max(newest, st.st_mtime)
+            if name in files:
+                total += st.st_size
+    return total, newest
+
+
+class TempJanitor:
+    """
+    Reclaims per-request temp dirs whose request died without cleaning up
+    (crashes, killed workers, abandoned renders). Dirs are claimed by the
+    process that uses them (see claim()); those of other live processes
+    (uvicorn workers, the batch CLI, library builds) and those this process
+    tracks as in use are never touched. The rest go once idle for
+    idle_seconds, or, while the dirs together exceed quota_bytes, longest
+    idle first. Dirs without an owner marker only go after idle_seconds.
+    """
+
+    def __init__(
+        self,
+        root: str = tempfile.gettempdir(),
+        quota_bytes: int = TMP_DISK_QUOTA_BYTES,
+        idle_seconds: int = TMP_IDLE_SECONDS,
+    ):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.idle_seconds = idle_seconds
+        self._active = set()
+        self._lock = threading.Lock()
+
+    def track(self, tmp_root: str):
+        claim(tmp_root)
+        with self._lock:
+            self._active.add(os.path.abspath(tmp_root))
+
+    def release(self, tmp_root: str):
+        with self._lock:
+            self._active.discard(os.path.abspath(tmp_root))
+
+    def sweep(self) -> dict:
+        now = time.time()
+        with self._lock:
+            active = set(self._active)
+        dirs = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not name.startswith(TMP_DIR_PREFIX) or not os.path.isdir(path):
+                continue
+            try:
+                size, newest = _usage(path)
+            except OSError:
+                continue  # removed while we looked
+            dirs.append((now - newest, size, path, _owner(path)))
+
+        total = sum(size for _, size, _, _ in dirs)
+        reclaimed, freed = 0, 0
+        # Longest idle first
+        for idle, size, path, owner in sorted(dirs, reverse=True):
+            if path in active or owner == "alive":
+                continue
+            over_quota = total - freed > self.quota_bytes
+            if idle < self.idle_seconds and not (
+                owner is not None and over_quota and idle >= QUOTA_MIN_IDLE_SECONDS
+            ):
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            reclaimed += 1
+            freed += size
+
+        report = {
+            "dirs": len(dirs),
+            "bytes": total,
+            "reclaimed_dirs": reclaimed,
+            "reclaimed_bytes": freed,
+        }
+        if reclaimed:
+            logger.info(f"Reclaimed abandoned temp dirs: {report}")
+        if total - freed > self.quota_bytes:
+            logger.warning(
+                f"Temp dirs use {total - freed} bytes, over the {self.quota_bytes} "
+                "byte quota; the rest are in use or were written to recently"
+            )
+        return report
+
+
+tmp_janitor = TempJanitor()
@@ -0,0 +1,295 @@
+"""
+Library of pre-generated meditations, one per meditation type, dominant
+emotion and duration bucket, served when a personalized render is too slow
+or upstream services fail.
+
+Build (or top up) the library from backend/:
+    python -m app.library
+    python -m app.library --types sleep morning --durations 5 10 --rebuild
+"""
+
+import os
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import threading
+from typing import Optional
+from app.logger import logger
+from app.cloud_utils import (
+    clean_up_tmp_folder,
+    fetch_from_gcs,
+    list_gcs,
+    split_gcs_uri,
+    upload_to_gcs,
+)
+from app.hls import SIGNED_PLAYLIST_NAME, signed_output_url
+from app.janitor import claim
+from config.emotion_to_audio import EMOTION_TO_AUDIO
+from config.meditation_types import MEDITATION_TYPE_STYLES
+from config.params import (
+    GCP_AUDIO_BUCKET,
+    IS_PROD,
+    LIBRARY_DIR,
+    LIBRARY_DURATIONS,
+)
+
+# Outside the cache sweeper's artifact prefixes (tts/, output/), so library
+# entries are never collected as orphans
+LIBRARY_PREFIX = "library"
+INDEX_NAME = "index.json"
+FALLBACK_EMOTION = "neutral"
+
+MEDITATION_TYPES = [t for t in MEDITATION_TYPE_STYLES if t != "default"]
+EMOTIONS = list(EMOTION_TO_AUDIO)
+
+# Journal entries the library is generated from, by dominant emotion
+SEED_ENTRIES = {
+    "joy": "Today felt light and bright. I want to savour this good feeling.",
+    "sadness": "I have been feeling low and heavy lately, and a little alone.",
+    "fear": "I keep worrying about what is coming and can't settle my mind.",
+    "anger": "I am frustrated and tense; small things have been setting me off.",
+    "disgust": "I feel put off by everything around me and want to reset.",
+    "surprise": "A lot changed unexpectedly today and I am still taking it in.",
+    "neutral": "An ordinary day. I would like a quiet moment to check in with myself.",
+}
+
+
+def library_key(meditation_type: str, emotion: str, bucket: int) -> str:
+    return f"{meditation_type}|{emotion}|{bucket}"
+
+
+def _index_location() -> str:
+    if IS_PROD:
+        return f"gs://{GCP_AUDIO_BUCKET}/{LIBRARY_PREFIX}/{INDEX_NAME}"
+    return os.path.join(LIBRARY_DIR, INDEX_NAME)
+
+
+class MeditationLibrary:
+    """
+    Index of library entries keyed by library_key(). A lookup probes the
+    requested key, then nearby duration buckets and the request's next most
+    likely emotions: a fixed number of dict lookups, however large the
+    library grows.
+    """
+
+    def __init__(self, durations: tuple = LIBRARY_DURATIONS):
+        self.durations = tuple(sorted(durations))
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load(self) -> int:
+        location = _index_location()
+        try:
+            if IS_PROD:
+                local_path = fetch_from_gcs(location)
+                try:
+                    with open(local_path, "r") as f:
+                        entries = json.load(f)
+                finally:
+                    os.remove(local_path)
+            else:
+                with open(location, "r") as f:
+                    entries = json.load(f)
+        except FileNotFoundError:
+            entries = {}
+        except Exception as e:
+            logger.warning(f"Could not read meditation library index: {e}")
+            return len(self)
+        with self._lock:
+            self._entries = entries
+        logger.info(f"Loaded meditation library with {len(entries)} entries")
+        return len(entries)
+
+    def save(self):
+        with self._lock:
+            data = json.dumps(self._entries, indent=2)
+        fd, part = tempfile.mkstemp(suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            f.write(data)
+        location = _index_location()
+        if IS_PROD:
+            upload_to_gcs(part, dest_path=split_gcs_uri(location)[1])
+            os.remove(part)
+        else:
+            os.makedirs(os.path.dirname(location), exist_ok=True)
+            shutil.move(part, location)
+
+    def get(self, key: str) -> Optional[dict]:
+        return self._entries.get(key)
+
+    def closest(
+        self,
+        meditation_type: str,
+        duration_minutes: int,
+        emotion_summary: Optional[dict] = None,
+    ) -> Optional[dict]:
+        """
+        Best entry for the request, as a response dict (with a fresh signed
+        URL and the entry's library_key), or None if the type has none.
+        """
+        summary = emotion_summary or {}
+        ranked = sorted(summary, key=summary.get, reverse=True)
+        emotions = ranked[:3] + [FALLBACK_EMOTION] + EMOTIONS
+        buckets = sorted(self.durations, key=lambda b: (abs(b - duration_minutes), b))
+        entries = self._entries
+        for emotion in dict.fromkeys(emotions):
+            for bucket in buckets:
+                key = library_key(meditation_type, emotion, bucket)
+                entry = entries.get(key)
+                if entry is not None:
+                    return self._response(key, entry)
+        return None
+
+    def _response(self, key: str, entry: dict) -> dict:
+        final_path = entry["final_audio_path"]
+        return {
+            "final_signed_url": (
+                signed_output_url(final_path)
+                if final_path.startswith("gs://")
+                else "Development mode"
+            ),
+            "final_audio_path": final_path,
+            "emotion_summary": entry["emotion_summary"],
+            "script_path": entry["script_path"],
+            "tts_path": entry["tts_path"],
+            "alignment_path": entry["alignment_path"],
+            "fallback": True,
+            "library_key": key,
+        }
+
+    def add(self, key: str, result: dict, tmp_root: str):
+        """
+        Copy a finished pipeline result into the library under key and index it.
+        """
+        folder = key.replace("|", "_").replace(" ", "-")
+        entry = {"created_at": time.time()}
+        for field in ("script_path", "tts_path", "alignment_path"):
+            entry[field] = _store(result[field], folder, tmp_root)
+        entry["final_audio_path"] = _store_output(
+            result["final_audio_path"], folder, tmp_root
+        )
+        entry["emotion_summary"] = result["emotion_summary"]
+        with self._lock:
+            self._entries[key] = entry
+        self.save()
+
+
+def _store(path: str, folder: str, tmp_root: str) -> str:
+    """
+    Copy one artifact (a local path or gs:// URI) to the library folder.
+    """
+    name = os.path.basename(path)
+    if not IS_PROD:
+        dest = os.path.join(LIBRARY_DIR, folder, name)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.copyfile(path, dest)
+        return dest
+    local_path = path
+    if path.startswith("gs://"):
+        local_path = _local_copy_path(tmp_root, path)
+        if not os.path.exists(local_path):
+            fetch_from_gcs(path, local_path)
+    return upload_to_gcs(local_path, dest_path=f"{LIBRARY_PREFIX}/{folder}/{name}")
+
+
+def _store_output(path: str, folder: str, tmp_root: str) -> str:
+    """
+    Copy the final mix; an HLS playlist brings its segments along.
+    """
+    if not path.endswith(".m3u8"):
+        return _store(path, folder, tmp_root)
+    if not IS_PROD:
+        dest = os.path.join(
+            LIBRARY_DIR, folder, os.path.basename(os.path.dirname(path))
+        )
+        shutil.copytree(os.path.dirname(path), dest, dirs_exist_ok=True)
+        return os.path.join(dest, os.path.basename(path))
+    bucket_name, blob_path = split_gcs_uri(path)
+    prefix = blob_path.rsplit("/", 1)[0]
+    for name in list_gcs(f"{prefix}/", bucket_name):
+        if not name.endswith(f"/{SIGNED_PLAYLIST_NAME}"):
+            _store(f"gs://{bucket_name}/{name}", folder, tmp_root)
+    return f"gs://{GCP_AUDIO_BUCKET}/{LIBRARY_PREFIX}/{folder}/{os.path.basename(path)}"
+
+
+def _local_copy_path(tmp_root: str, gcs_uri: str) -> str:
+    return os.path.join(tmp_root, os.path.basename(split_gcs_uri(gcs_uri)[1]))
+
+
+meditation_library = MeditationLibrary()
+
+
+async def build_library(
+    types: list, emotions: list, durations: list, rebuild: bool = False
+) -> int:
+    """
+    Generate the missing (or, with rebuild, all) entries with the regular
+    pipeline, saving the index after each so an interrupted build resumes.
+    """
+    # Imported here: the pipeline loads models the API lookup never needs
+    from api.engine import meditation_engine
+    from app.hls import wait_for_render
+    from app.upload_manager import upload_manager
+
+    meditation_library.load()
+    built = 0
+    for meditation_type in types:
+        for emotion in emotions:
+            for minutes in durations:
+                key = library_key(meditation_type, emotion, minutes)
+                if meditation_library.get(key) and not rebuild:
+                    continue
+                tmp_root = claim(tempfile.mkdtemp(prefix="minday-library-"))
+                try:
+                    logger.info(f"Building library entry {key}")
+                    result = await meditation_engine(
+                        journal_entry=SEED_ENTRIES.get(
+                            emotion, SEED_ENTRIES[FALLBACK_EMOTION]
+                        ),
+                        duration_minutes=minutes,
+                        meditation_type=meditation_type,
+                        tmp_root=tmp_root,
+                        emotion_summary={emotion: 1.0},
+                    )
+                    if not wait_for_render(result["final_audio_path"]):
+                        raise RuntimeError("render failed")
+                    if not upload_manager.wait_for_dir(tmp_root):
+                        raise RuntimeError("artifact uploads failed")
+                    meditation_library.add(key, result, tmp_root)
+                    built += 1
+                except Exception as e:
+                    logger.error(f"Library entry {key} failed: {e}", exc_info=True)
+                finally:
+                    clean_up_tmp_folder(tmp_root)
+    return built
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--types", nargs="+", default=MEDITATION_TYPES)
+    parser.add_argument("--emotions", nargs="+", default=EMOTIONS)
+    parser.add_argument(
+        "--durations",
+        type=int,
+        nargs="+",
+        choices=LIBRARY_DURATIONS,
+        default=list(LIBRARY_DURATIONS),
+    )
+    parser.add_argument(
+        "--rebuild", action="store_true", help="regenerate existing entries too"
+    )
+    args = parser.parse_args()
+    built = asyncio.run(
+        build_library(args.types, args.emotions, args.durations, args.rebuild)
+    )
+    print(f"Built {built} library entries ({len(meditation_library)} total)")
+
+
+if __name__ == "__main__":
+    main()
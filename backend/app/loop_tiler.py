@@ -0,0 +1,91 @@
+import numpy as np
+from typing import Iterator, Optional
+from app.envelopes import crossfade
+from app.mixer import silence
+
+
+class LoopTile:
+    """
+    A base loop repeated end to end with a crossfade between repeats,
+    precomputed as three pieces:
+
+        head  base[:P]                                  (P = len(base) - crossfade)
+        cell  crossfade(base[P:], base[:c]) + base[c:P] (one steady-state period)
+        tail  base[P:]
+
+    `repeats` loops are head + cell * (repeats - 1) + tail, so any stretch of the
+    output is a few slice copies and nothing grows with the session length.
+    """
+
+    def __init__(self, base: np.ndarray, crossfade_frames: int, shape: str = "linear"):
+        c = max(0, min(crossfade_frames, len(base) // 2))
+        self.frames = len(base)
+        self.crossfade_frames = c
+        self.period = len(base) - c
+        self.head = base[: self.period].copy()
+        self.tail = base[self.period :].copy()
+        self.cell = np.empty_like(self.head)
+        self.cell[:c] = crossfade(base[self.period :], base[:c], shape)
+        self.cell[c:] = base[c : self.period]
+
+    @classmethod
+    def from_parts(
+        cls, head: np.ndarray, cell: np.ndarray, tail: np.ndarray
+    ) -> "LoopTile":
+        """
+        Rebuild a tile from stored pieces, e.g. memory-mapped from the bed cache.
+        """
+        tile = cls.__new__(cls)
+        tile.head, tile.cell, tile.tail = head, cell, tail
+        tile.period = len(head)
+        tile.crossfade_frames = len(tail)
+        tile.frames = len(head) + len(tail)
+        return tile
+
+    def length(self, repeats: int) -> int:
+        return repeats * self.period + self.crossfade_frames if repeats > 0 else 0
+
+    def _locate(self, pos: int, repeats: Optional[int]) -> tuple:
+        if pos < self.period:
+            return self.head, pos
+        if repeats is not None and pos >= repeats * self.period:
+            return self.tail, pos - repeats * self.period
+        return self.cell, (pos - self.period) % self.period
+
+    def read(
+        self,
+        start: int,
+        frames: int,
+        repeats: Optional[int] = None,
+        out: np.ndarray = None,
+    ) -> np.ndarray:
+        """
+        Frames [start, start + frames) of the tiled loop, written into `out` when
+        given. With repeats=None the loop never ends; otherwise frames past
+        length(repeats) are left untouched.
+        """
+        if out is None:
+            out = silence(frames)
+        end = start + frames
+        if repeats is not None:
+            end = min(end, self.length(repeats))
+        pos = start
+        while pos < end:
+            src, offset = self._locate(pos, repeats)
+            n = min(len(src) - offset, end - pos)
+            out[pos - start : pos - start + n] = src[offset : offset + n]
+            pos += n
+        return out
+
+    def blocks(
+        self, repeats: Optional[int], block_frames: int, start: int = 0
+    ) -> Iterator[np.ndarray]:
+        """
+        Lazily yield the tiled loop in blocks of block_frames, from `start`.
+        """
+        end = self.length(repeats) if repeats is not None else None
+        pos = start
+        while end is None or pos < end:
+            n = block_frames if end is None else min(block_frames, end - pos)
+            yield self.read(pos, n, repeats)
+            pos += n
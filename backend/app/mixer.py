@@ -0,0 +1,128 @@
+import os
+import numpy as np
+from pydub import AudioSegment
+from config.params import PCM_SAMPLE_RATE, PCM_CHANNELS, PCM_SAMPLE_WIDTH
+
+# Mixing happens on float32 (frames, channels) arrays kept in int16 scale, so
+# gains and sums match pydub's and the final conversion is a clip + cast.
+INT16_MIN = -32768
+INT16_MAX = 32767
+
+
+def ms_to_frames(ms: float) -> int:
+    # Truncates like pydub's millisecond slicing, so positions land on the same frame
+    return int(ms * PCM_SAMPLE_RATE / 1000)
+
+
+def frames_to_ms(frames: int) -> int:
+    return int(round(frames * 1000.0 / PCM_SAMPLE_RATE))
+
+
+def db_to_gain(db: float) -> float:
+    return 10 ** (db / 20.0)
+
+
+def dbfs(buf: np.ndarray) -> float:
+    """
+    RMS loudness relative to int16 full scale, as AudioSegment.dBFS measures it.
+    """
+    if buf.size == 0:
+        return -float("inf")
+    rms = float(np.sqrt(np.mean(np.square(buf, dtype=np.float64))))
+    if rms == 0:
+        return -float("inf")
+    return 20 * np.log10(rms / 32768.0)
+
+
+def silence(frames: int) -> np.ndarray:
+    return np.zeros((max(0, frames), PCM_CHANNELS), dtype=np.float32)
+
+
+def is_canonical(audio: AudioSegment) -> bool:
+    return (
+        audio.frame_rate == PCM_SAMPLE_RATE
+        and audio.channels == PCM_CHANNELS
+        and audio.sample_width == PCM_SAMPLE_WIDTH
+    )
+
+
+def to_canonical(audio: AudioSegment) -> AudioSegment:
+    if not is_canonical(audio):
+        audio = (
+            audio.set_frame_rate(PCM_SAMPLE_RATE)
+            .set_channels(PCM_CHANNELS)
+            .set_sample_width(PCM_SAMPLE_WIDTH)
+        )
+    return audio
+
+
+def canonicalize_wav(path: str) -> bool:
+    """
+    Rewrite an audio file in place as a canonical WAV, unless it already is one.
+    Returns True if it had to be converted.
+    """
+    audio = AudioSegment.from_file(path)
+    if is_canonical(audio) and path.lower().endswith(".wav"):
+        return False
+    tmp_path = f"{path}.part"
+    to_canonical(audio).export(tmp_path, format="wav")
+    os.replace(tmp_path, path)
+    return True
+
+
+def to_array(audio: AudioSegment) -> np.ndarray:
+    """
+    Convert an AudioSegment to a float32 (frames, channels) array in the canonical format.
+    """
+    samples = np.frombuffer(to_canonical(audio).raw_data, dtype=np.int16)
+    return samples.reshape(-1, PCM_CHANNELS).astype(np.float32)
+
+
+def to_pcm16(mix: np.ndarray) -> np.ndarray:
+    """
+    Clip and convert a float mix to interleaved int16 samples.
+    """
+    return np.clip(np.rint(mix), INT16_MIN, INT16_MAX).astype(np.int16)
+
+
+def from_array(mix: np.ndarray) -> AudioSegment:
+    return AudioSegment(
+        data=to_pcm16(mix).tobytes(),
+        sample_width=PCM_SAMPLE_WIDTH,
+        frame_rate=PCM_SAMPLE_RATE,
+        channels=PCM_CHANNELS,
+    )
+
+
+def apply_gain(buf: np.ndarray, db: float) -> np.ndarray:
+    """
+    Scale a buffer in place by a gain in dB.
+    """
+    buf *= np.float32(db_to_gain(db))
+    return buf
+
+
+def add_at(dst: np.ndarray, src: np.ndarray, offset: int, gain: float = 1.0) -> None:
+    """
+    Mix src into dst in place starting at frame `offset`; anything past the
+    end of dst is dropped, like AudioSegment.overlay.
+    """
+    if offset >= len(dst) or offset + len(src) <= 0:
+        return
+    start = max(offset, 0)
+    end = min(offset + len(src), len(dst))
+    chunk = src[start - offset : end - offset]
+    if gain == 1.0:
+        dst[start:end] += chunk
+    else:
+        dst[start:end] += chunk * np.float32(gain)
+
+
+def tile(src: np.ndarray, frames: int) -> np.ndarray:
+    """
+    Repeat src end to end until it is exactly `frames` long.
+    """
+    if frames <= len(src):
+        return src[:frames].copy()
+    reps = -(-frames // len(src))
+    return np.tile(src, (reps, 1))[:frames]
@@ -0,0 +1,225 @@
+import io
+import mmap
+import pickle
+import threading
+import numpy as np
+from collections import deque
+from typing import Callable, Optional
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+from app.logger import logger
+from app.mixer import to_pcm16
+from app.timeline import Timeline
+from config.params import (
+    PCM_SAMPLE_RATE,
+    RENDER_WORKERS,
+    RENDER_PARALLEL_MIN_SECONDS,
+)
+
+# Arrays smaller than this travel inside the pickled timeline
+SHARE_MIN_BYTES = 64 * 1024
+# Segments per worker, so a slow segment does not hold up the others for long
+SEGMENTS_PER_WORKER = 4
+
+
+def _file_backing(array: np.ndarray) -> Optional[tuple]:
+    """
+    (filename, byte offset) of the file region a C-contiguous array maps
+    (np.memmap or a view of one), or None for arrays only held in memory.
+    """
+    mapped = array
+    while isinstance(mapped, np.ndarray) and not isinstance(mapped, np.memmap):
+        mapped = mapped.base
+    if (
+        not isinstance(mapped, np.memmap)
+        or getattr(mapped, "_mmap", None) is None
+        or not mapped.filename
+        or mapped.mode == "c"  # copy-on-write pages are private to this process
+        or not array.flags.c_contiguous
+    ):
+        return None
+    try:
+        region = np.frombuffer(mapped._mmap, dtype=np.uint8)
+    except (TypeError, ValueError):
+        return None  # mapping already closed
+    # Views share the parent's mapping, which starts at the aligned offset
+    region_start = region.__array_interface__["data"][0]
+    start = array.__array_interface__["data"][0] - region_start
+    if start < 0 or start + array.nbytes > len(region):
+        return None
+    offset = mapped.offset - mapped.offset % mmap.ALLOCATIONGRANULARITY
+    return mapped.filename, offset + start
+
+
+class _SharingPickler(pickle.Pickler):
+    """
+    Pickles a timeline without copying its large source arrays into the
+    payload. File-backed arrays (the softened voice, stored beds, the PCM
+    store) are sent as file regions that workers map read-only, so they stay
+    in the page cache. Other arrays are copied once per render into shared
+    memory blocks.
+    """
+
+    def __init__(self, file, blocks: list):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.blocks = blocks
+        self._shared = {}  # id(array) -> persistent id
+        self._arrays = []  # keeps ids unique while pickling
+
+    def persistent_id(self, obj):
+        if not isinstance(obj, np.ndarray) or obj.nbytes < SHARE_MIN_BYTES:
+            return None
+        pid = self._shared.get(id(obj))
+        if pid is None:
+            backing = _file_backing(obj)
+            if backing is not None:
+                pid = ("file", *backing, obj.shape, obj.dtype.str)
+            else:
+                block = shared_memory.SharedMemory(create=True, size=obj.nbytes)
+                np.ndarray(obj.shape, obj.dtype, buffer=block.buf)[...] = obj
+                self.blocks.append(block)
+                pid = ("shm", block.name, obj.shape, obj.dtype.str)
+            self._arrays.append(obj)
+            self._shared[id(obj)] = pid
+        return pid
+
+
+class _AttachingUnpickler(pickle.Unpickler):
+    def __init__(self, file, blocks: list):
+        super().__init__(file)
+        self.blocks = blocks
+
+    def persistent_load(self, pid):
+        if pid[0] == "file":
+            _, filename, offset, shape, dtype = pid
+            return np.memmap(
+                filename, dtype=np.dtype(dtype), mode="r", offset=offset, shape=shape
+            )
+        _, name, shape, dtype = pid
+        # Pool workers share the parent's resource tracker, which unlinks the
+        # block once the parent is done with it
+        block = shared_memory.SharedMemory(name=name)
+        self.blocks.append(block)
+        array = np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+        array.flags.writeable = False
+        return array
+
+
+def _render_segment(payload: bytes, start: int, frames: int) -> np.ndarray:
+    """
+    Worker side: attach the shared sources and render one segment as int16.
+    """
+    blocks = []
+    timeline = _AttachingUnpickler(io.BytesIO(payload), blocks).load()
+    try:
+        step = timeline.block_frames
+        return np.concatenate(
+            [
+                to_pcm16(timeline.render_block(pos, min(step, start + frames - pos)))
+                for pos in range(start, start + frames, step)
+            ]
+        )
+    finally:
+        # Views into the blocks must be gone before they can be closed
+        del timeline
+        for block in blocks:
+            block.close()
+
+
+class ParallelRenderer:
+    """
+    Renders long timelines in time segments on a process pool.
+
+    Every read a timeline does is addressed by absolute position (sources,
+    loop tiles, envelopes), so a segment renders exactly the samples the
+    serial render produces there and segments are simply joined in order.
+    File-backed sources are mapped by the workers; other source arrays are
+    placed in shared memory once per render.
+    """
+
+    def __init__(self, max_workers: int = RENDER_WORKERS):
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def should_parallelize(self, timeline: Timeline) -> bool:
+        return (
+            self.max_workers > 1
+            and timeline.frames >= RENDER_PARALLEL_MIN_SECONDS * PCM_SAMPLE_RATE
+        )
+
+    def render(
+        self,
+        timeline: Timeline,
+        sink,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+    ):
+        """
+        Same contract as Timeline.render: blocks go to the sink in order, and
+        the sink is aborted if anything fails. on_progress is called as each
+        segment reaches the sink.
+        """
+        blocks = []
+        window = deque()
+        try:
+            buf = io.BytesIO()
+            _SharingPickler(buf, blocks).dump(timeline)
+            payload = buf.getvalue()
+
+            step = timeline.block_frames
+            segments = self.max_workers * SEGMENTS_PER_WORKER
+            seg_frames = -(-timeline.frames // segments)
+            seg_frames = max(step, -(-seg_frames // step) * step)
+            starts = list(range(0, timeline.frames, seg_frames))
+            pool, queued = self._pool(), iter(starts)
+
+            def submit():
+                start = next(queued, None)
+                if start is not None:
+                    frames = min(seg_frames, timeline.frames - start)
+                    window.append(pool.submit(_render_segment, payload, start, frames))
+
+            # Only max_workers segments in flight: finished segments wait for
+            # the sink in memory, so a slow sink must hold back the workers
+            for _ in range(self.max_workers):
+                submit()
+            done = 0
+            while window:
+                segment = window.popleft().result()
+                submit()
+                sink.write(segment)
+                done += len(segment)
+                if on_progress is not None:
+                    on_progress(done, timeline.frames)
+        except BaseException:
+            for future in window:
+                future.cancel()
+            sink.abort()
+            raise
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+        sink.close()
+        logger.debug(
+            f"Rendered {timeline.frames} frames in {len(starts)} segments "
+            f"on {self.max_workers} workers"
+        )
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: the server process runs upload and encoder threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=get_context("spawn")
+                )
+            return self._executor
+
+
+parallel_renderer = ParallelRenderer()
@@ -0,0 +1,113 @@
+import os
+import json
+import threading
+import numpy as np
+from typing import Optional
+from pydub import AudioSegment
+from app.logger import logger
+from config.params import (
+    PCM_STORE_DIR,
+    PCM_STORE_ENABLED,
+    PCM_SAMPLE_RATE,
+    PCM_CHANNELS,
+    PCM_SAMPLE_WIDTH,
+)
+
+PCM_DATA_FILENAME = "assets.pcm"
+PCM_INDEX_FILENAME = "index.json"
+
+
+class PCMStore:
+    """
+    Read-only view over the compiled asset store (see app/asset_compiler.py).
+
+    The data file is one flat run of interleaved int16 samples in the canonical
+    format; index.json maps each asset's relative path to its frame offset and
+    length, and records the source version (GCS generation or mtime) each
+    asset and chime manifest was compiled from. The file is memory-mapped, so every uvicorn worker reads the same
+    page-cache pages and slices are returned without copying.
+    """
+
+    def __init__(self, store_dir: str = PCM_STORE_DIR):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, PCM_INDEX_FILENAME), "r") as f:
+            index = json.load(f)
+
+        fmt = index["format"]
+        expected = {
+            "sample_rate": PCM_SAMPLE_RATE,
+            "channels": PCM_CHANNELS,
+            "sample_width": PCM_SAMPLE_WIDTH,
+        }
+        if fmt != expected:
+            raise ValueError(f"PCM store format {fmt} does not match {expected}")
+
+        self.data_file = index["data_file"]
+        self.assets = index["assets"]
+        self.manifests = index.get("manifests", {})
+        # Stores compiled before versions were recorded never match a source
+        self.versions = index.get("versions", {})
+        self.manifest_versions = index.get("manifest_versions", {})
+        self._data = np.memmap(
+            os.path.join(store_dir, index["data_file"]), dtype=np.int16, mode="r"
+        ).reshape(-1, PCM_CHANNELS)
+
+    def __contains__(self, rel_path: str) -> bool:
+        return rel_path in self.assets
+
+    def get_array(self, rel_path: str) -> np.ndarray:
+        """
+        Zero-copy (frames, channels) int16 view of an asset.
+        """
+        entry = self.assets[rel_path]
+        start = entry["offset"]
+        return self._data[start : start + entry["frames"]]
+
+    def get_segment(self, rel_path: str) -> AudioSegment:
+        """
+        AudioSegment copy of an asset, for code paths that still work on pydub.
+        """
+        return AudioSegment(
+            data=self.get_array(rel_path).tobytes(),
+            sample_width=PCM_SAMPLE_WIDTH,
+            frame_rate=PCM_SAMPLE_RATE,
+            channels=PCM_CHANNELS,
+        )
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_pcm_store() -> Optional[PCMStore]:
+    """
+    Return the process-wide PCMStore, or None if it is disabled or not compiled.
+    """
+    global _store
+    if not PCM_STORE_ENABLED:
+        return None
+    if _store is not None:
+        return _store
+    with _store_lock:
+        if _store is None:
+            index_path = os.path.join(PCM_STORE_DIR, PCM_INDEX_FILENAME)
+            if not os.path.exists(index_path):
+                return None
+            try:
+                _store = PCMStore(PCM_STORE_DIR)
+                logger.info(
+                    f"Mapped PCM asset store with {len(_store.assets)} assets from {PCM_STORE_DIR}"
+                )
+            except Exception as e:
+                logger.warning(f"Could not open PCM asset store: {e}")
+                return None
+    return _store
+
+
+def reset_pcm_store():
+    """
+    Drop the mapping so the next get_pcm_store() call reopens a recompiled store.
+    """
+    global _store
+    with _store_lock:
+        _store = None
@@ -0,0 +1,181 @@
+import json
+import time
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import AsyncIterator, Optional
+from config.params import (
+    PROGRESS_HEARTBEAT_SECONDS,
+    PROGRESS_HISTORY_EVENTS,
+    PROGRESS_RETENTION_SECONDS,
+)
+
+# Job whose progress the current request (or a thread it started) reports
+_current_job = contextvars.ContextVar("progress_job", default=None)
+
+TERMINAL_STAGES = ("done", "error")
+
+
+class _Job:
+    def __init__(self):
+        self.events = []
+        self.subscribers = set()  # (loop, queue)
+        self.touched_at = time.time()
+        self.finished = False
+
+
+class ProgressBus:
+    """
+    In-process progress events per job, fanned out to any number of
+    server-sent-event subscribers. Publishing is a dict lookup and a list
+    append when nobody listens, so every request can report. Subscribers get
+    the job's history first, so they can connect before or after it starts.
+
+    The bus lives in one process: a subscriber only sees jobs run by the
+    worker it is connected to, so with several uvicorn workers the events
+    endpoint needs sticky routing by job id (or a single worker).
+    """
+
+    def __init__(
+        self,
+        history: int = PROGRESS_HISTORY_EVENTS,
+        retention_seconds: int = PROGRESS_RETENTION_SECONDS,
+    ):
+        self.history = history
+        self.retention_seconds = retention_seconds
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def job_scope(self, job_id: str):
+        """
+        Report emit() calls made in this context (and threads that copy it)
+        under job_id. Job ids come from clients, so reusing the id of a
+        finished job starts a new run; its waiting subscribers carry over.
+        """
+        with self._lock:
+            job = self._job_locked(job_id)
+            if job.finished:
+                fresh = self._jobs[job_id] = _Job()
+                fresh.subscribers = job.subscribers
+        token = _current_job.set(job_id)
+        try:
+            yield job_id
+        finally:
+            _current_job.reset(token)
+
+    def current_job(self) -> Optional[str]:
+        return _current_job.get()
+
+    def emit(self, stage: str, job_id: Optional[str] = None, **data):
+        job_id = job_id or _current_job.get()
+        if job_id is None:
+            return
+        event = {"stage": stage, "time": round(time.time(), 3), **data}
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return
+            job.events.append(event)
+            if len(job.events) > self.history:
+                # Keep the first events (emotion summary) and the most recent ones
+                del job.events[1 : len(job.events) - self.history + 1]
+            job.touched_at = time.time()
+            if stage in TERMINAL_STAGES:
+                job.finished = True
+            subscribers = list(job.subscribers)
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    def finish(self, job_id: str, error: Optional[str] = None, **data):
+        if error is not None:
+            self.emit("error", job_id, message=error, **data)
+        else:
+            self.emit("done", job_id, **data)
+
+    async def subscribe(self, job_id: str) -> AsyncIterator[dict]:
+        """
+        Yield the job's events, history first, until it finishes.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        with self._lock:
+            job = self._job_locked(job_id)
+            backlog = list(job.events)
+            job.subscribers.add((loop, queue))
+        try:
+            for event in backlog:
+                yield event
+            if backlog and backlog[-1]["stage"] in TERMINAL_STAGES:
+                return
+            while True:
+                event = await queue.get()
+                yield event
+                if event["stage"] in TERMINAL_STAGES:
+                    return
+        finally:
+            with self._lock:
+                job.subscribers.discard((loop, queue))
+
+    async def sse(self, job_id: str) -> AsyncIterator[str]:
+        """
+        subscribe() as a text/event-stream, with comment heartbeats so idle
+        connections survive proxies.
+        """
+        events = self.subscribe(job_id).__aiter__()
+        next_event = asyncio.ensure_future(events.__anext__())
+        try:
+            while True:
+                done, _ = await asyncio.wait(
+                    {next_event}, timeout=PROGRESS_HEARTBEAT_SECONDS
+                )
+                if not done:
+                    yield ": keep-alive\n\n"
+                    continue
+                try:
+                    event = next_event.result()
+                except StopAsyncIteration:
+                    return
+                yield f"event: {event['stage']}\ndata: {json.dumps(event)}\n\n"
+                next_event = asyncio.ensure_future(events.__anext__())
+        finally:
+            next_event.cancel()
+            await events.aclose()
+
+    def reporter(self, stage: str, step: int = 1):
+        """
+        Callback (done, total) that emits `stage` with a percent, only when it
+        has moved by at least `step` points.
+        """
+        job_id = _current_job.get()
+        last = [-step]
+
+        def report(done: int, total: int):
+            percent = int(100 * done / total) if total else 100
+            if percent - last[0] >= step or (percent == 100 and last[0] < 100):
+                last[0] = percent
+                self.emit(stage, job_id, percent=percent)
+
+        return report
+
+    def _job(self, job_id: str) -> _Job:
+        with self._lock:
+            return self._job_locked(job_id)
+
+    def _job_locked(self, job_id: str) -> _Job:
+        now = time.time()
+        job = self._jobs.get(job_id)
+        if job is None:
+            for stale_id in [
+                k
+                for k, j in self._jobs.items()
+                if not j.subscribers and now - j.touched_at > self.retention_seconds
+            ]:
+                del self._jobs[stale_id]
+            job = self._jobs[job_id] = _Job()
+        job.touched_at = now
+        return job
+
+
+progress = ProgressBus()
@@ -6,7 +6,8 @@ from app.logger import logger
 from config.params import GEMINI_API_KEY, IS_PROD
 from google.genai.errors import ServerError, ClientError
 from config.meditation_types import MEDITATION_TYPE_STYLES
-from app.cloud_utils import upload_to_gcs
+from app.upload_manager import upload_manager
+from app.progress import progress
 from config.emotion_techniques import (
     EMOTION_TO_TECHNIQUES,
     MEDITATION_TECHNIQUES,
@@ -123,7 +124,7 @@ async def generate_meditation_script(
 ) -> str:
     """
     Generates a meditation script via Gemini. Writes the script as a .txt file under tmp_root.
-    In production, uploads to GCS and deletes the local file. Returns either:
+    In production, queues a background upload to GCS. Returns either:
       - in dev (IS_PROD=False): the local path under tmp_root
       - in prod: the GCS URI of the uploaded script
     """
@@ -191,7 +192,16 @@ async def generate_meditation_script(
         loops = 0
         while loops < max_loops:
             word_count = len(script.split())
-            if length_threshold(time, word_count):
+            passed = length_threshold(time, word_count)
+            progress.emit(
+                "script",
+                attempt=attempt + 1,
+                refinement=loops,
+                word_count=word_count,
+                target_words=time * 135,
+                passed=passed,
+            )
+            if passed:
                 logger.info(
                     f"Script passed with {word_count} words after {loops}/{max_loops} refinement loops."
                 )
@@ -232,19 +242,12 @@ async def generate_meditation_script(
         f"Script generated successfully after attempt {attempt + 1} using {model_used}"
     )
 
-    # 5) If in prod, upload & delete; otherwise return local path
+    # 5) If in prod, queue the upload; the local file is served until it completes
     if IS_PROD:
-        gcs_uri = upload_to_gcs(
-            local_path=script_output_path, dest_path=f"tts/{script_filename}"
+        gcs_uri = upload_manager.enqueue(
+            script_output_path, dest_path=f"tts/{script_filename}"
         )
-        logger.info(f"Script uploaded to GCS: {gcs_uri}")
-        try:
-            os.remove(script_output_path)
-            logger.debug(f"Deleted local script: {script_output_path}")
-        except Exception as e:
-            logger.warning(
-                f"Could not delete local script file {script_output_path}: {e}"
-            )
+        logger.info(f"Script queued for upload to GCS: {gcs_uri}")
         return gcs_uri
 
     return script_output_path
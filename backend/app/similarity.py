@@ -0,0 +1,282 @@
+import os
+import re
+import json
+import time
+import fcntl
+import hashlib
+import threading
+import unicodedata
+import numpy as np
+from typing import Optional
+from app.logger import logger
+from config.params import (
+    SIMILARITY_INDEX_PATH,
+    CACHE_SIMILARITY_THRESHOLD,
+)
+
+NUM_PERM = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS
+SHINGLE_SIZE = 5
+
+# Universal hashing (a * x + b) mod p over 32-bit shingle hashes; fits in uint64
+_PRIME = np.uint64(4294967311)
+_rng = np.random.default_rng(20240501)
+_A = _rng.integers(1, 2**32 - 1, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, 2**32 - 1, size=NUM_PERM, dtype=np.uint64)
+
+
+def canonicalize_journal(text: str) -> str:
+    """
+    Fold case, unicode forms, punctuation, emoji and whitespace, so trivially
+    different resubmissions of the same entry compare equal.
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = "".join(
+        c if unicodedata.category(c)[0] in ("L", "N") else " " for c in text
+    )
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def minhash_signature(text: str) -> np.ndarray:
+    """
+    MinHash signature over character shingles of the canonical text.
+    """
+    canonical = canonicalize_journal(text)
+    if len(canonical) <= SHINGLE_SIZE:
+        shingles = {canonical}
+    else:
+        shingles = {
+            canonical[i : i + SHINGLE_SIZE]
+            for i in range(len(canonical) - SHINGLE_SIZE + 1)
+        }
+    hashes = np.fromiter(
+        (
+            int.from_bytes(
+                hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little"
+            )
+            for s in shingles
+        ),
+        dtype=np.uint64,
+        count=len(shingles),
+    )
+    permuted = (hashes[:, None] * _A[None, :] + _B[None, :]) % _PRIME
+    return permuted.min(axis=0)
+
+
+def estimated_jaccard(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+    return float(np.mean(sig_a == sig_b))
+
+
+def _band_keys(signature: np.ndarray) -> list:
+    return [
+        (band, signature[band * LSH_ROWS : (band + 1) * LSH_ROWS].tobytes())
+        for band in range(LSH_BANDS)
+    ]
+
+
+class SimilarityIndex:
+    """
+    MinHash/LSH index over cached journal entries. A lookup only matches
+    entries with the same meditation type, duration and dominant emotion,
+    whose estimated Jaccard similarity reaches the configured threshold.
+
+    Changes are kept in memory and written by flush(), which the API calls
+    periodically. Every uvicorn worker shares the file, so a flush merges
+    the entries other workers wrote before replacing it.
+    """
+
+    def __init__(
+        self,
+        path: str = SIMILARITY_INDEX_PATH,
+        threshold: float = CACHE_SIMILARITY_THRESHOLD,
+        ttl_seconds: Optional[float] = None,
+    ):
+        self.path = path
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self._entries = {}  # cache_key -> entry dict
+        self._buckets = {}  # (band, band_bytes) -> set of cache keys
+        self._removed = set()  # keys dropped here, not to be merged back from disk
+        self._dirty = False
+        self._lock = threading.Lock()
+        self.stats = {
+            "lookups": 0,
+            "hits": 0,
+            "candidates": 0,
+            "rejected_candidates": 0,
+        }
+
+    def _insert(self, cache_key: str, entry: dict):
+        self._entries[cache_key] = entry
+        for band_key in _band_keys(entry["signature"]):
+            self._buckets.setdefault(band_key, set()).add(cache_key)
+
+    def remove(self, cache_key: str):
+        with self._lock:
+            self._removed.add(cache_key)
+            self._dirty = True
+            entry = self._entries.pop(cache_key, None)
+            if entry is None:
+                return
+            for band_key in _band_keys(entry["signature"]):
+                bucket = self._buckets.get(band_key)
+                if bucket is not None:
+                    bucket.discard(cache_key)
+                    if not bucket:
+                        del self._buckets[band_key]
+
+    def add(
+        self,
+        cache_key: str,
+        journal_entry: str,
+        duration: int,
+        meditation_type: str,
+        dominant_emotion: str,
+    ):
+        entry = {
+            "signature": minhash_signature(journal_entry),
+            "duration": duration,
+            "meditation_type": meditation_type,
+            "dominant_emotion": dominant_emotion,
+            "created_at": time.time(),
+        }
+        with self._lock:
+            self._insert(cache_key, entry)
+            self._removed.discard(cache_key)
+            self._dirty = True
+
+    def find(
+        self,
+        journal_entry: str,
+        duration: int,
+        meditation_type: str,
+        dominant_emotion: str,
+    ) -> Optional[str]:
+        """
+        Return the cache key of the most similar compatible entry, or None.
+        """
+        signature = minhash_signature(journal_entry)
+        now = time.time()
+        best_key, best_score = None, 0.0
+        with self._lock:
+            self.stats["lookups"] += 1
+            candidates = set()
+            for band_key in _band_keys(signature):
+                candidates |= self._buckets.get(band_key, set())
+
+            for key in candidates:
+                entry = self._entries[key]
+                if (
+                    entry["duration"] != duration
+                    or entry["meditation_type"] != meditation_type
+                    or entry["dominant_emotion"] != dominant_emotion
+                ):
+                    continue
+                if self.ttl_seconds and now - entry["created_at"] > self.ttl_seconds:
+                    continue
+                self.stats["candidates"] += 1
+                score = estimated_jaccard(signature, entry["signature"])
+                if score < self.threshold:
+                    self.stats["rejected_candidates"] += 1
+                    continue
+                if score > best_score:
+                    best_key, best_score = key, score
+
+            if best_key is not None:
+                self.stats["hits"] += 1
+        if best_key is not None:
+            logger.info(
+                f"Near-duplicate journal matched cache entry {best_key} (similarity {best_score:.2f})"
+            )
+        return best_key
+
+    def report(self) -> dict:
+        """
+        Hit rate over lookups, and the share of LSH candidates (same type,
+        duration and emotion) that the similarity threshold rejected.
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["lookups"] or 1
+        candidates = stats["candidates"] or 1
+        stats["hit_rate"] = stats["hits"] / lookups
+        stats["threshold_rejection_rate"] = stats["rejected_candidates"] / candidates
+        stats["threshold"] = self.threshold
+        return stats
+
+    def flush(self) -> bool:
+        """
+        Write the index if it changed since the last flush. Returns True if it wrote.
+        """
+        with self._lock:
+            if not self._dirty:
+                return False
+            self._dirty = False
+        try:
+            self.save()
+        except OSError as e:
+            with self._lock:
+                self._dirty = True
+            logger.warning(f"Could not persist similarity index: {e}")
+            return False
+        return True
+
+    def save(self):
+        """
+        Merge the on-disk copy into this index and write the result, holding a
+        file lock so concurrent workers do not overwrite each other's entries.
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(f"{self.path}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._merge(self._read())
+                with self._lock:
+                    data = {
+                        key: {**entry, "signature": entry["signature"].tolist()}
+                        for key, entry in self._entries.items()
+                    }
+                    written = set(self._removed)
+                part = f"{self.path}.{os.getpid()}.part"
+                with open(part, "w") as f:
+                    json.dump(data, f)
+                os.replace(part, self.path)
+                with self._lock:
+                    # Removals are on disk now; the file no longer has them
+                    self._removed -= written
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def load(self) -> int:
+        self._merge(self._read())
+        with self._lock:
+            count = len(self._entries)
+        logger.info(f"Loaded similarity index with {count} entries")
+        return count
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"Could not read similarity index: {e}")
+            return {}
+
+    def _merge(self, data: dict):
+        """
+        Add entries from a saved copy that this index does not have (and did
+        not remove), skipping expired ones.
+        """
+        now = time.time()
+        with self._lock:
+            for key, entry in data.items():
+                if key in self._entries or key in self._removed:
+                    continue
+                if self.ttl_seconds and now - entry["created_at"] > self.ttl_seconds:
+                    continue
+                entry["signature"] = np.array(entry["signature"], dtype=np.uint64)
+                self._insert(key, entry)
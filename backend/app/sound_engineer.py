@@ -1,156 +1,200 @@
 import os
 import json
 import math
-import numpy as np
 from pydub import AudioSegment
 from app.decision_maker import choose_assets
-from app.cloud_utils import upload_to_gcs
+from app.logger import logger
+from app.cloud_utils import open_gcs_writer
+from app.encoder import EncoderSink, output_spec
+from app.hls import HLSSink, render_in_background
+from app.storage import atomic_file_writer
 from config.trigger_words import TRIGGER_WORDS
+from app.bed_cache import bed_cache
+from app.chime_bank import chime_bank
+from app.mixer import ms_to_frames
+from app.parallel_render import parallel_renderer
+from app.progress import progress
+from app.timeline import ArraySource, BedSource, Envelope, Event, Timeline
 from app.audio_utils import (
     soften_voice,
-    build_seamless_loop,
-    build_intro_layer,
-    normalize_volume,
-    detect_chime_tail,
-    next_bar_chime,
     extract_word_timings_from_fragments,
-    build_outro_segment,
-    load_and_clean_audio_asset,
 )
-from config.params import IS_PROD, OUTPUT_DIR
+from config.params import (
+    IS_PROD,
+    GCP_AUDIO_BUCKET,
+    OUTPUT_DIR,
+    OUTPUT_MODE,
+    RENDER_MODE,
+)
 
 
-def sound_engineer_pipeline(
+def plan_session(
     tts_path: str,
     alignment_json_path: str,
     emotion_summary: dict,
-    output_filename: str = "final_mix.wav",
     tmp_root: str = "/tmp",
-) -> str:
+) -> Timeline:
     """
-    Simpler pipeline: build one long background, fade its tail, then overlay TTS and chime.
+    Describe the session as a timeline: the background bed (intro + loop, tail
+    faded), the voice, trigger chimes and the outro. Nothing session-length is
+    mixed here; the timeline is rendered block by block afterwards.
     """
-
-    # Ensure tmp_root exists
-    os.makedirs(tmp_root, exist_ok=True)
-    # 1) Choose assets & load files
+    # 1) Choose assets; the voice-independent bed comes pre-rendered per profile
     chosen = choose_assets(emotion_summary)
-    amb = normalize_volume(
-        load_and_clean_audio_asset(
-            os.path.join("soundscapes", chosen["ambient"]), tmp_root
-        ),
-        target_dBFS=chosen.get("ambient_volume_dBFS", -32.0),
-    )
-    tone = normalize_volume(
-        load_and_clean_audio_asset(os.path.join("tones", chosen["tone"]), tmp_root),
-        target_dBFS=chosen.get("tone_volume_dBFS", -36.0),
-    )
-    start_chime = load_and_clean_audio_asset(
-        os.path.join(
-            "chimes", chosen.get("start_chime", "start_chime_paiste_gong.wav")
-        ),
-        tmp_root,
-    )
-    end_chime = load_and_clean_audio_asset(
-        os.path.join("chimes", chosen.get("end_chime", "end_chime_singing_bowl.wav")),
-        tmp_root,
-    )
-
-    # 2) Build intro
-    fade_ms = len(start_chime)
-    amb_intro = build_intro_layer(amb, fade_ms).fade_in(fade_ms)
-    tone_intro = build_intro_layer(tone, fade_ms).fade_in(fade_ms)
-    intro_mix = start_chime.overlay(amb_intro).overlay(tone_intro)
+    bed = bed_cache.get(chosen)
+    intro_mix, bg_loop, end_chime = bed.intro, bed.loop, bed.end_chime
+    fade_len = len(intro_mix)
 
-    # 3) Make one seamless loop for the rest
-    amb_rest = amb[fade_ms:] or amb
-    tone_rest = tone[fade_ms:] or tone
-    bg_loop = amb_rest.overlay(tone_rest, loop=True)
-
-    # 4) Load & soften TTS
+    # 2) Load & soften TTS, then page it from disk rather than holding it in memory
     raw_tts = AudioSegment.from_file(tts_path)
-    softened = soften_voice(raw_tts)
+    voice = soften_voice(raw_tts, os.path.join(tmp_root, "voice.pcm"))
+    del raw_tts
     alignment_local = alignment_json_path
     with open(alignment_local) as f:
         fragments = json.load(f)["fragments"]
 
-    # detect TTS offset under start_chime
-    tts_offset = detect_chime_tail(start_chime)
-    tts_full = AudioSegment.silent(tts_offset) + softened
-    tts_len = len(tts_full)
+    # TTS starts once the start chime has rung out
+    tts_offset = bed.tts_offset_ms
+    tts_start = ms_to_frames(tts_offset)
+    tts_len = tts_start + len(voice)
     delay_ms = 3000
-    start_ms = tts_len + delay_ms
+    start = tts_len + ms_to_frames(delay_ms)
 
-    # 5) Decide how long our final background needs to be:
+    # 3) Decide how long our final background needs to be:
     outro_len = len(end_chime)
-    total_bg_len = len(intro_mix) + math.ceil(
-        (tts_len - len(intro_mix)) / len(bg_loop)
-    ) * len(bg_loop)
+    total_bg_len = (
+        len(intro_mix)
+        + math.ceil((tts_len - len(intro_mix)) / bg_loop.frames) * bg_loop.frames
+    )
     total_bg_len = max(total_bg_len, tts_len + outro_len)
 
-    # 6) Build that one full background track:
-    reps = math.ceil((total_bg_len - len(intro_mix)) / len(bg_loop))
-    looped_bg = build_seamless_loop(bg_loop, reps)
-    full_bg = intro_mix + looped_bg[: (total_bg_len - len(intro_mix))]
-
-    # 7) Build a curved fade manually
-    tail = full_bg[-fade_ms:]
-    n_frames = len(tail) // 100  # every 100ms
-    curve = np.linspace(0, 1, n_frames) ** 2.5  # Quadratic/exponential fade (curvy)
-
-    faded_tail = AudioSegment.silent(duration=0)
-    for i in range(n_frames):
-        start = i * 100
-        end = min((i + 1) * 100, len(tail))
-        slice_ = tail[start:end]
-        gain = -curve[i] * 60  # fade from 0 dB to -60 dB
-        faded_tail += slice_.apply_gain(gain)
+    # 4) The background bed: intro, then the tiled loop. The crossfades make the
+    # loop shorter than reps * bg_loop.frames, which shortens the bed to match.
+    reps = math.ceil((total_bg_len - len(intro_mix)) / bg_loop.frames)
+    intro_len = min(len(intro_mix), total_bg_len)
+    bg_len = intro_len + min(total_bg_len - intro_len, bg_loop.length(reps))
+
+    # 5) Curved fade over the tail: 0 dB to -60 dB along -(t ** 2.5) * 60 dB
+    tail_len = min(fade_len, bg_len)
+    bed = BedSource(
+        intro_mix,
+        bg_loop,
+        reps,
+        bg_len,
+        tail_fade=Envelope(
+            bg_len - tail_len,
+            tail_len,
+            shape="exponential",
+            fade_out=True,
+            floor_db=-60.0,
+            power=2.5,
+        ),
+    )
 
-    bg_faded = full_bg[:-fade_ms] + faded_tail
+    # Everything after the delay is replaced by the outro
+    core_len = min(start, bg_len)
+    timeline = Timeline(core_len + outro_len)
+    timeline.add(Event("bed", 0, bed), until=core_len)
 
-    # 8) Mix TTS and trigger chimes:
-    base_mix = bg_faded.overlay(tts_full, position=0)
+    # 6) TTS and trigger chimes over the bed; chimes come from the shared bank
+    # in this session's own shuffled order
+    timeline.add(Event("voice", tts_start, ArraySource(voice)), until=core_len)
+    chimes = chime_bank.rotation(chosen["interchimes"])
     for word, ms in extract_word_timings_from_fragments(
         fragments, offset_ms=tts_offset
     ):
         if word.lower().strip(".,!?") in TRIGGER_WORDS:
-            base_mix = base_mix.overlay(
-                normalize_volume(
-                    next_bar_chime(chosen["interchimes"], tmp_root), -40.0
-                ),
-                position=ms,
+            timeline.add(
+                Event("trigger_chime", ms_to_frames(ms), ArraySource(next(chimes))),
+                until=core_len,
             )
 
-    # 9) Build and append outro segment:
-    # ensure bg_faded is long enough to cover delay
-    if len(bg_faded) < start_ms:
-        bg_faded += AudioSegment.silent(duration=start_ms - len(bg_faded))
+    # 7) Outro: the voice-free bed from the delayed start, faded out under the
+    # end chime, and the whole outro faded out again
+    outro_fade = Envelope(0, outro_len, fade_out=True)
+    timeline.add(
+        Event(
+            "outro_bed",
+            core_len,
+            bed,
+            frames=outro_len,
+            source_start=start,
+            envelopes=[outro_fade, outro_fade],
+        )
+    )
+    timeline.add(
+        Event("end_chime", core_len, ArraySource(end_chime), envelopes=[outro_fade])
+    )
+    return timeline
 
-    # build the outro segment using the delayed start
-    final_chime = build_outro_segment(end_chime, background=bg_faded, start_ms=start_ms)
 
-    # trim off everything after the delay so no extra background remains
-    base_core = base_mix[:start_ms]
+def sound_engineer_pipeline(
+    tts_path: str,
+    alignment_json_path: str,
+    emotion_summary: dict,
+    output_filename: str = "final_mix.wav",
+    tmp_root: str = "/tmp",
+) -> str:
+    """
+    Simpler pipeline: build one long background, fade its tail, then overlay TTS and chime.
+    """
 
-    # Ensure base_mix long enough for clean append
-    if len(base_mix) < tts_len:
-        base_mix += AudioSegment.silent(duration=tts_len - len(base_mix))
+    # Ensure tmp_root exists
+    os.makedirs(tmp_root, exist_ok=True)
+    timeline = plan_session(tts_path, alignment_json_path, emotion_summary, tmp_root)
 
-    final_mix = (base_core + final_chime).fade_out(len(end_chime))
+    if OUTPUT_MODE == "hls":
+        return _render_hls(timeline, output_filename, tmp_root)
 
-    # 10) Export
+    # 8) Render straight into the encoder, which streams to storage
+    spec = output_spec()
+    output_filename = os.path.splitext(output_filename)[0] + spec["extension"]
     if IS_PROD:
-        out_path = os.path.join(tmp_root, output_filename)
+        out_path, writer = open_gcs_writer(
+            f"output/{output_filename}", content_type=spec["content_type"]
+        )
     else:
-        os.makedirs(OUTPUT_DIR, exist_ok=True)
         out_path = os.path.join(OUTPUT_DIR, output_filename)
+        writer = atomic_file_writer(out_path)
+
+    sink = EncoderSink(writer)
+    if RENDER_MODE == "stream":
+        _render(timeline, sink)
+    else:
+        # "buffer" mixes the whole session in one block before encoding
+        timeline.render(sink, timeline.frames, progress.reporter("mix"))
+    logger.info(
+        f"Encoded {output_filename} ({spec['content_type']}, {sink.bytes_out} bytes)"
+    )
+    progress.emit("upload", percent=100, bytes=sink.bytes_out)
+    return out_path
 
-    final_mix.export(out_path, format="mp3")
 
+def _render(timeline: Timeline, sink):
+    on_progress = progress.reporter("mix")
+    if parallel_renderer.should_parallelize(timeline):
+        # Long sessions render in time segments across the worker pool
+        parallel_renderer.render(timeline, sink, on_progress=on_progress)
+    else:
+        timeline.render(sink, on_progress=on_progress)
+
+
+def _render_hls(timeline: Timeline, output_filename: str, tmp_root: str) -> str:
+    """
+    Render into HLS segments in the background and return the playlist path
+    as soon as its first segments are published; the rest keeps streaming in.
+    Use hls.wait_for_render(path) to find out how the render ended.
+    """
+    name = os.path.splitext(output_filename)[0]
     if IS_PROD:
-        gcs_out = upload_to_gcs(
-            local_path=out_path, dest_path=f"output/{output_filename}"
+        sink = HLSSink(
+            os.path.join(tmp_root, "hls"),
+            prefix_uri=f"gs://{GCP_AUDIO_BUCKET}/output/{name}",
         )
-        if gcs_out:
-            out_path = gcs_out
+    else:
+        sink = HLSSink(os.path.join(OUTPUT_DIR, name))
+    out_path = sink.playlist_uri
+    render_in_background(out_path, lambda: _render(timeline, sink))
+    sink.wait_ready()
+    logger.info(f"First HLS segments of {name} published at {out_path}")
     return out_path
@@ -0,0 +1,411 @@
+import os
+import json
+import shutil
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, Optional
+from app.logger import logger
+from config.params import (
+    IS_PROD,
+    IS_LOCAL_TEST,
+    STORAGE_BACKEND,
+    LOCAL_STORAGE_ROOT,
+    GCS_HTTP_POOL_SIZE,
+    GCS_HTTP_MAX_RETRIES,
+    UPLOAD_CHUNK_SIZE_BYTES,
+)
+
+
+class ObjectWriter:
+    """
+    Write handle for a streaming upload. The object only becomes visible on
+    close(); abort() discards whatever was written.
+    """
+
+    def __init__(
+        self,
+        fileobj,
+        on_close: Optional[Callable[[], None]] = None,
+        on_abort: Optional[Callable[[], None]] = None,
+    ):
+        self._file = fileobj
+        self._on_close = on_close
+        self._on_abort = on_abort
+
+    def write(self, data: bytes) -> int:
+        return self._file.write(data)
+
+    def close(self) -> None:
+        self._file.close()
+        if self._on_close is not None:
+            self._on_close()
+
+    def abort(self) -> None:
+        if self._on_abort is not None:
+            self._on_abort()
+
+
+def atomic_file_writer(path: str) -> ObjectWriter:
+    """
+    ObjectWriter for a local file, written beside the target and renamed on close.
+    """
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    part = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+    f = open(part, "wb")
+
+    def discard():
+        f.close()
+        if os.path.exists(part):
+            os.remove(part)
+
+    return ObjectWriter(f, on_close=lambda: os.replace(part, path), on_abort=discard)
+
+
+class StorageBackend(ABC):
+    """
+    Minimal object-store interface used by app/cloud_utils.py.
+    Objects are addressed by (bucket_name, blob_path); callers keep using gs:// URIs.
+    """
+
+    name = "base"
+
+    def warm(self) -> None:
+        """
+        Load credentials and open connections ahead of the first request.
+        """
+
+    @abstractmethod
+    def upload(
+        self,
+        local_path: str,
+        bucket_name: str,
+        blob_path: str,
+        chunk_size: Optional[int] = None,
+    ) -> None:
+        """
+        Upload a file. chunk_size asks for a chunked, resumable transfer.
+        """
+
+    @abstractmethod
+    def open_write(
+        self, bucket_name: str, blob_path: str, content_type: Optional[str] = None
+    ) -> ObjectWriter:
+        """
+        Stream an object up as it is produced, without a local file.
+        """
+
+    @abstractmethod
+    def download(self, bucket_name: str, blob_path: str, dest_path: str) -> None:
+        """
+        Download in one round trip. Raises FileNotFoundError if the object is missing.
+        """
+
+    @abstractmethod
+    def generation(self, bucket_name: str, blob_path: str) -> Optional[int]:
+        """
+        Current generation of an object, or None if it does not exist.
+        """
+
+    @abstractmethod
+    def list(self, bucket_name: str, prefix: str) -> list:
+        """
+        Names of the objects under a prefix.
+        """
+
+    @abstractmethod
+    def list_details(self, bucket_name: str, prefix: str) -> list:
+        """
+        Like list(), but returns dicts with name, size (bytes) and updated (epoch seconds).
+        """
+
+    @abstractmethod
+    def delete(self, bucket_name: str, blob_path: str) -> None:
+        """
+        Delete an object; a missing object is not an error.
+        """
+
+    def delete_many(self, bucket_name: str, blob_paths: list) -> None:
+        for blob_path in blob_paths:
+            self.delete(bucket_name, blob_path)
+
+    @abstractmethod
+    def signed_url(
+        self,
+        bucket_name: str,
+        blob_path: str,
+        expiration_minutes: int,
+        response_disposition: str,
+    ) -> str:
+        """
+        Time-limited GET URL for an object.
+        """
+
+
+class GCSStorage(StorageBackend):
+    """
+    Google Cloud Storage backend. The client is created on first use and shares
+    one pooled, retrying HTTP session across threads.
+    """
+
+    name = "gcs"
+
+    def __init__(self, pool_size: int = GCS_HTTP_POOL_SIZE):
+        self.pool_size = pool_size
+        self._client = None
+        self._credentials = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._build_client()
+        return self._client
+
+    def warm(self) -> None:
+        self.client
+
+    def _build_client(self):
+        import google.auth
+        from google.cloud import storage
+        from google.oauth2 import service_account
+        from google.auth.transport.requests import AuthorizedSession
+        from requests.adapters import HTTPAdapter
+
+        scopes = storage.Client.SCOPE
+        if IS_PROD and not IS_LOCAL_TEST:
+            credentials = service_account.Credentials.from_service_account_info(
+                json.loads(os.getenv("GOOGLE_APPLICATION_CREDENTIALS")), scopes=scopes
+            )
+            project = credentials.project_id
+        elif IS_PROD and IS_LOCAL_TEST:
+            credentials = service_account.Credentials.from_service_account_file(
+                os.getenv("GOOGLE_APPLICATION_CREDENTIALS"), scopes=scopes
+            )
+            project = credentials.project_id
+        else:
+            credentials, project = google.auth.default(scopes=scopes)
+
+        self._credentials = credentials
+        session = AuthorizedSession(credentials)
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            max_retries=GCS_HTTP_MAX_RETRIES,
+        )
+        session.mount("https://", adapter)
+        logger.debug(f"GCS client created with HTTP pool size {self.pool_size}")
+        return storage.Client(project=project, credentials=credentials, _http=session)
+
+    def upload(
+        self,
+        local_path: str,
+        bucket_name: str,
+        blob_path: str,
+        chunk_size: Optional[int] = None,
+    ) -> None:
+        # A blob chunk_size switches the client to a resumable, chunked upload
+        blob = self.client.bucket(bucket_name).blob(blob_path, chunk_size=chunk_size)
+        blob.upload_from_filename(local_path)
+
+    def open_write(
+        self, bucket_name: str, blob_path: str, content_type: Optional[str] = None
+    ) -> ObjectWriter:
+        # Resumable upload, one chunk at a time; an unfinished session never
+        # materializes an object, but its chunks are kept until it expires
+        blob = self.client.bucket(bucket_name).blob(
+            blob_path, chunk_size=UPLOAD_CHUNK_SIZE_BYTES
+        )
+        writer = blob.open("wb", content_type=content_type, ignore_flush=True)
+
+        def cancel():
+            # The session starts with the first chunk; BlobWriter exposes no
+            # cancel, so DELETE the session URI as the JSON API documents
+            started = getattr(writer, "_upload_and_transport", None)
+            if started is None:
+                return
+            upload, transport = started
+            try:
+                transport.delete(upload.resumable_url)
+            except Exception as e:
+                logger.warning(
+                    f"Could not cancel upload to gs://{bucket_name}/{blob_path}: {e}"
+                )
+
+        return ObjectWriter(writer, on_abort=cancel)
+
+    def download(self, bucket_name: str, blob_path: str, dest_path: str) -> None:
+        from google.api_core.exceptions import NotFound
+
+        blob = self.client.bucket(bucket_name).blob(blob_path)
+        try:
+            blob.download_to_filename(dest_path)
+        except NotFound:
+            if os.path.exists(dest_path):
+                os.remove(dest_path)
+            raise FileNotFoundError(f"GCS blob does not exist: gs://{bucket_name}/{blob_path}")
+
+    def generation(self, bucket_name: str, blob_path: str) -> Optional[int]:
+        blob = self.client.bucket(bucket_name).get_blob(blob_path)
+        return blob.generation if blob is not None else None
+
+    def list(self, bucket_name: str, prefix: str) -> list:
+        return [b.name for b in self.client.list_blobs(bucket_name, prefix=prefix)]
+
+    def list_details(self, bucket_name: str, prefix: str) -> list:
+        return [
+            {
+                "name": b.name,
+                "size": b.size or 0,
+                "updated": b.updated.timestamp() if b.updated else 0.0,
+            }
+            for b in self.client.list_blobs(bucket_name, prefix=prefix)
+        ]
+
+    def delete(self, bucket_name: str, blob_path: str) -> None:
+        from google.api_core.exceptions import NotFound
+
+        try:
+            self.client.bucket(bucket_name).blob(blob_path).delete()
+        except NotFound:
+            pass
+
+    def delete_many(self, bucket_name: str, blob_paths: list) -> None:
+        # One batched HTTP request per 100 deletes (the JSON API batch limit)
+        bucket = self.client.bucket(bucket_name)
+        for start in range(0, len(blob_paths), 100):
+            chunk = blob_paths[start : start + 100]
+            with self.client.batch(raise_exception=False):
+                for blob_path in chunk:
+                    bucket.delete_blob(blob_path)
+
+    def signed_url(
+        self,
+        bucket_name: str,
+        blob_path: str,
+        expiration_minutes: int,
+        response_disposition: str,
+    ) -> str:
+        """
+        V4-sign a GET URL with the client's cached credentials. Signing is
+        local; the bucket and blob handles make no requests.
+        """
+        from datetime import timedelta
+
+        blob = self.client.bucket(bucket_name).blob(blob_path)
+        return blob.generate_signed_url(
+            version="v4",
+            expiration=timedelta(minutes=expiration_minutes),
+            method="GET",
+            response_disposition=response_disposition,
+            credentials=self._credentials,
+        )
+
+
+class LocalStorage(StorageBackend):
+    """
+    Filesystem backend: gs://<bucket>/<path> lives at <root>/<bucket>/<path>.
+    Lets the full pipeline run and be benchmarked offline.
+    """
+
+    name = "local"
+
+    def __init__(self, root: str = LOCAL_STORAGE_ROOT):
+        self.root = root
+
+    def _path(self, bucket_name: str, blob_path: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, bucket_name, blob_path))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f"Object path escapes storage root: {blob_path}")
+        return path
+
+    def upload(
+        self,
+        local_path: str,
+        bucket_name: str,
+        blob_path: str,
+        chunk_size: Optional[int] = None,
+    ) -> None:
+        dest = self._path(bucket_name, blob_path)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp_dest = f"{dest}.{os.getpid()}.{threading.get_ident()}.part"
+        shutil.copyfile(local_path, tmp_dest)
+        os.replace(tmp_dest, dest)
+
+    def open_write(
+        self, bucket_name: str, blob_path: str, content_type: Optional[str] = None
+    ) -> ObjectWriter:
+        return atomic_file_writer(self._path(bucket_name, blob_path))
+
+    def download(self, bucket_name: str, blob_path: str, dest_path: str) -> None:
+        src = self._path(bucket_name, blob_path)
+        if not os.path.isfile(src):
+            raise FileNotFoundError(f"Object does not exist: gs://{bucket_name}/{blob_path}")
+        if os.path.dirname(dest_path):
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        shutil.copyfile(src, dest_path)
+
+    def generation(self, bucket_name: str, blob_path: str) -> Optional[int]:
+        try:
+            return os.stat(self._path(bucket_name, blob_path)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def list(self, bucket_name: str, prefix: str) -> list:
+        bucket_root = os.path.join(self.root, bucket_name)
+        names = []
+        for dirpath, _, filenames in os.walk(bucket_root):
+            for filename in filenames:
+                if filename.endswith(".part"):
+                    continue
+                rel = os.path.relpath(os.path.join(dirpath, filename), bucket_root)
+                name = rel.replace(os.sep, "/")
+                if name.startswith(prefix):
+                    names.append(name)
+        return sorted(names)
+
+    def list_details(self, bucket_name: str, prefix: str) -> list:
+        details = []
+        for name in self.list(bucket_name, prefix):
+            st = os.stat(self._path(bucket_name, name))
+            details.append({"name": name, "size": st.st_size, "updated": st.st_mtime})
+        return details
+
+    def delete(self, bucket_name: str, blob_path: str) -> None:
+        try:
+            os.remove(self._path(bucket_name, blob_path))
+        except FileNotFoundError:
+            pass
+
+    def signed_url(
+        self,
+        bucket_name: str,
+        blob_path: str,
+        expiration_minutes: int,
+        response_disposition: str,
+    ) -> str:
+        return self._path(bucket_name, blob_path)
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> StorageBackend:
+    """
+    Return the process-wide storage backend selected by STORAGE_BACKEND.
+    """
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                if STORAGE_BACKEND == "local":
+                    _storage = LocalStorage()
+                elif STORAGE_BACKEND == "gcs":
+                    _storage = GCSStorage()
+                else:
+                    raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+                logger.info(f"Using {_storage.name} storage backend")
+    return _storage
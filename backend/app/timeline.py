@@ -0,0 +1,196 @@
+import numpy as np
+from typing import Callable, Iterator, Optional
+from app.envelopes import fade_curve
+from app.loop_tiler import LoopTile
+from app.mixer import silence, to_pcm16
+from config.params import RENDER_BLOCK_FRAMES
+
+
+class ArraySource:
+    """
+    Source over a (frames, channels) array, float or int16 (e.g. a memmap).
+    """
+
+    def __init__(self, array: np.ndarray):
+        self.array = array
+
+    def __len__(self) -> int:
+        return len(self.array)
+
+    def read(self, pos: int, frames: int) -> np.ndarray:
+        out = silence(frames)
+        chunk = self.array[max(pos, 0) : max(pos + frames, 0)]
+        out[max(-pos, 0) : max(-pos, 0) + len(chunk)] = chunk
+        return out
+
+
+class BedSource:
+    """
+    The background bed: intro mix, then the tiled loop, up to `frames`, with an
+    optional fade over its last tail_fade frames. Silent past the end.
+    """
+
+    def __init__(
+        self,
+        intro: np.ndarray,
+        loop: LoopTile,
+        repeats: int,
+        frames: int,
+        tail_fade=None,
+    ):
+        self.intro = intro[:frames]
+        self.loop = loop
+        self.repeats = repeats
+        self.frames = frames
+        self.tail_fade = tail_fade
+
+    def __len__(self) -> int:
+        return self.frames
+
+    def read(self, pos: int, frames: int) -> np.ndarray:
+        out = silence(frames)
+        end = min(pos + frames, self.frames)
+        intro_len = len(self.intro)
+        if pos < intro_len and end > pos:
+            hi = min(end, intro_len)
+            out[: hi - pos] = self.intro[pos:hi]
+        lo = max(pos, intro_len)
+        if lo < end:
+            self.loop.read(
+                lo - intro_len, end - lo, self.repeats, out=out[lo - pos : end - pos]
+            )
+        if self.tail_fade is not None:
+            self.tail_fade.apply(out, pos)
+        return out
+
+
+class Envelope:
+    """
+    Fade applied to the stretch [start, start + frames) of whatever it is
+    attached to; positions outside that stretch are left untouched.
+    """
+
+    def __init__(
+        self,
+        start: int,
+        frames: int,
+        shape: str = "linear",
+        fade_out: bool = False,
+        **curve_kwargs,
+    ):
+        self.start = start
+        self.frames = frames
+        self.shape = shape
+        self.fade_out = fade_out
+        self.curve_kwargs = curve_kwargs
+
+    def apply(self, block: np.ndarray, pos: int):
+        """
+        Scale `block`, which covers positions [pos, pos + len(block)), in place.
+        """
+        lo = max(pos, self.start)
+        hi = min(pos + len(block), self.start + self.frames)
+        if lo >= hi:
+            return
+        block[lo - pos : hi - pos] *= fade_curve(
+            self.frames,
+            self.shape,
+            self.fade_out,
+            start=lo - self.start,
+            count=hi - lo,
+            **self.curve_kwargs,
+        )[:, None]
+
+
+class Event:
+    """
+    One source placed on the timeline at `start`, playing `frames` frames of
+    it from source_start, with envelopes relative to the event.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        start: int,
+        source,
+        frames: Optional[int] = None,
+        source_start: int = 0,
+        envelopes: Optional[list] = None,
+    ):
+        self.name = name
+        self.start = start
+        self.source = source
+        self.frames = len(source) - source_start if frames is None else frames
+        self.source_start = source_start
+        self.envelopes = envelopes or []
+
+    @property
+    def end(self) -> int:
+        return self.start + self.frames
+
+
+class Timeline:
+    """
+    A session described as a schedule of events, mixed on demand one block at
+    a time. Memory is bounded by the block size and the sources themselves,
+    not by the session length.
+    """
+
+    def __init__(self, frames: int, block_frames: int = RENDER_BLOCK_FRAMES):
+        self.frames = frames
+        self.block_frames = block_frames
+        self.events = []
+
+    def add(self, event: Event, until: Optional[int] = None) -> Event:
+        """
+        Schedule an event, cut off at `until` (default: the end of the timeline).
+        """
+        until = self.frames if until is None else min(until, self.frames)
+        event.frames = max(0, min(event.frames, until - event.start))
+        if event.frames > 0:
+            self.events.append(event)
+        return event
+
+    def render_block(self, start: int, frames: int) -> np.ndarray:
+        frames = max(0, min(frames, self.frames - start))
+        block = silence(frames)
+        end = start + frames
+        for event in self.events:
+            if event.start >= end or event.end <= start:
+                continue
+            lo = max(start, event.start)
+            hi = min(end, event.end)
+            chunk = event.source.read(event.source_start + lo - event.start, hi - lo)
+            for envelope in event.envelopes:
+                envelope.apply(chunk, lo - event.start)
+            block[lo - start : hi - start] += chunk
+        return block
+
+    def blocks(self) -> Iterator[np.ndarray]:
+        for start in range(0, self.frames, self.block_frames):
+            yield self.render_block(start, self.block_frames)
+
+    def render_array(self) -> np.ndarray:
+        return self.render_block(0, self.frames)
+
+    def render(
+        self,
+        sink,
+        block_frames: Optional[int] = None,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+    ):
+        """
+        Stream the session into a sink (write(int16 block), close() and abort()).
+        The sink is aborted if rendering fails part way. on_progress, if given,
+        is called with (frames rendered, total frames) after each block.
+        """
+        block_frames = block_frames or self.block_frames
+        try:
+            for start in range(0, self.frames, block_frames):
+                sink.write(to_pcm16(self.render_block(start, block_frames)))
+                if on_progress is not None:
+                    on_progress(min(start + block_frames, self.frames), self.frames)
+        except BaseException:
+            sink.abort()
+            raise
+        sink.close()
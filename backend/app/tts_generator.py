@@ -2,7 +2,9 @@ import os
 from datetime import datetime
 from openai import OpenAI
 from app.logger import logger
-from app.cloud_utils import upload_to_gcs
+from app.mixer import canonicalize_wav
+from app.upload_manager import upload_manager
+from app.progress import progress
 from config.params import OPENAI_API_KEY, IS_PROD
 
 # Optional aeneas import for local dev convenience
@@ -15,6 +17,12 @@ except Exception:
 
 openai_client = OpenAI(api_key=OPENAI_API_KEY)
 
+# TTS progress is estimated from bytes streamed against the expected length:
+# scripts are written for ~135 words a minute and the API returns 24 kHz mono
+# 16-bit WAV
+TTS_WORDS_PER_MINUTE = 135
+TTS_WAV_BYTES_PER_SECOND = 24000 * 2
+
 
 def generate_tts(
     script_path: str,
@@ -24,7 +32,7 @@ def generate_tts(
 ) -> str:
     """
     Generate TTS audio from a local script file. Writes the .wav into tmp_root with a unique filename.
-    In production (IS_PROD=True), uploads to GCS, deletes the local copy, and returns the GCS URI.
+    In production (IS_PROD=True), queues a background upload to GCS and returns the GCS URI.
     In dev mode, simply returns the local path under tmp_root.
     """
     # --- Read the script from disk (script_path is already a local file) ---
@@ -58,19 +66,35 @@ def generate_tts(
         response_format="wav",
     ) as response:
         # Stream the resulting WAV into our tmp_root file
-        response.stream_to_file(audio_output_path)
+        expected_bytes = (
+            len(script_text.split())
+            / TTS_WORDS_PER_MINUTE
+            * 60
+            / 0.96
+            * TTS_WAV_BYTES_PER_SECOND
+        )
+        report = progress.reporter("tts", step=5)
+        received = 0
+        with open(audio_output_path, "wb") as f:
+            for chunk in response.iter_bytes():
+                f.write(chunk)
+                received += len(chunk)
+                # The estimate can run short; hold at 99 until the stream ends
+                report(min(received, 0.99 * expected_bytes), expected_bytes)
+        report(1, 1)
+
+    # Resample once here, so the mix never converts the voice
+    if canonicalize_wav(audio_output_path):
+        logger.debug(
+            f"Converted TTS audio to the canonical format: {audio_output_path}"
+        )
 
     if IS_PROD:
-        # Upload the local .wav to GCS, then delete the local copy
-        gcs_uri = upload_to_gcs(
-            local_path=audio_output_path, dest_path=f"tts/{audio_filename}"
+        # Queue the .wav for background upload; the local copy is used until it lands
+        gcs_uri = upload_manager.enqueue(
+            audio_output_path, dest_path=f"tts/{audio_filename}"
         )
-        logger.info(f"TTS audio uploaded to GCS: {gcs_uri}")
-        try:
-            os.remove(audio_output_path)
-            logger.debug(f"Deleted local TTS file: {audio_output_path}")
-        except Exception as e:
-            logger.warning(f"Could not delete local TTS file {audio_output_path}: {e}")
+        logger.info(f"TTS audio queued for upload to GCS: {gcs_uri}")
         return gcs_uri
 
     # In dev mode, return the local tmp_root path
@@ -84,7 +108,7 @@ def align_audio_text(
 ) -> str:
     """
     Run Aeneas alignment between a local audio file and a local text file.
-    Creates a JSON alignment in tmp_root. In production, uploads to GCS & deletes local.
+    Creates a JSON alignment in tmp_root. In production, queues a background upload to GCS.
     Returns either the local JSON path (dev) or the GCS URI (prod).
     If aeneas is not available locally, raise a clear error recommending Docker.
     """
@@ -110,21 +134,17 @@ def align_audio_text(
     task.text_file_path_absolute = text_path
     task.sync_map_file_path_absolute = alignment_output_path
 
+    progress.emit("alignment", status="started")
     ExecuteTask(task).execute()
     task.output_sync_map_file()
+    progress.emit("alignment", status="done")
 
     if IS_PROD:
-        # Upload the JSON to GCS, delete local copy
-        gcs_uri = upload_to_gcs(
-            local_path=alignment_output_path, dest_path=f"tts/{alignment_filename}"
+        # Queue the JSON for background upload
+        gcs_uri = upload_manager.enqueue(
+            alignment_output_path, dest_path=f"tts/{alignment_filename}"
         )
-        logger.info(f"Alignment JSON uploaded to GCS: {gcs_uri}")
-        try:
-            os.remove(alignment_output_path)
-        except Exception as e:
-            logger.warning(
-                f"Could not delete local alignment JSON {alignment_output_path}: {e}"
-            )
+        logger.info(f"Alignment JSON queued for upload to GCS: {gcs_uri}")
         return gcs_uri
 
     # In dev, just return the local tmp_root path
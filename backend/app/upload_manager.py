@@ -0,0 +1,144 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Optional
+from app.logger import logger
+from app.cloud_utils import upload_to_gcs, blob_path_for
+from config.params import GCP_AUDIO_BUCKET, UPLOAD_WORKERS, UPLOAD_MAX_RETRIES
+
+
+class UploadManager:
+    """
+    Uploads pipeline artifacts off the request path.
+
+    enqueue() returns the destination gs:// URI immediately and uploads on a
+    thread pool with retries and exponential backoff. Until the upload is done,
+    the local file stands in for the object (see resolve_asset). Uploads that
+    still fail after the retries are remembered until wait_for_dir() reports
+    them, so callers do not publish results pointing at missing objects.
+    """
+
+    def __init__(
+        self, max_workers: int = UPLOAD_WORKERS, max_retries: int = UPLOAD_MAX_RETRIES
+    ):
+        self.max_retries = max_retries
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="upload"
+        )
+        self._pending = {}  # gs uri -> (local_path, future)
+        self._failed = {}  # local_path -> gs uri, until a wait_for_dir() reports it
+        self._lock = threading.Lock()
+
+    def enqueue(
+        self,
+        local_path: str,
+        dest_path: str = None,
+        bucket_name: str = GCP_AUDIO_BUCKET,
+        delete_after: bool = False,
+    ) -> str:
+        if not os.path.exists(local_path):
+            raise FileNotFoundError(f"Local file not found: {local_path}")
+
+        gcs_uri = f"gs://{bucket_name}/{blob_path_for(local_path, dest_path)}"
+        future = self._executor.submit(
+            self._upload, local_path, bucket_name, dest_path, gcs_uri, delete_after
+        )
+        with self._lock:
+            self._pending[gcs_uri] = (local_path, future)
+        future.add_done_callback(lambda _: self._forget(gcs_uri, future))
+        logger.debug(f"Queued upload of {local_path} to {gcs_uri}")
+        return gcs_uri
+
+    def local_copy(self, gcs_uri: str) -> Optional[str]:
+        """
+        Local file behind a queued or in-flight upload, if it still exists.
+        """
+        with self._lock:
+            entry = self._pending.get(gcs_uri)
+        if entry is not None and os.path.exists(entry[0]):
+            return entry[0]
+        return None
+
+    def wait_for_dir(self, local_dir: str, timeout: float = None) -> bool:
+        """
+        Block until every pending upload of a file under local_dir has finished.
+        Returns True only if all of them (and any that finished earlier)
+        succeeded; False if one failed for good or the timeout expired first.
+        """
+        prefix = os.path.join(os.path.abspath(local_dir), "")
+        with self._lock:
+            futures = [
+                future
+                for local_path, future in self._pending.values()
+                if os.path.abspath(local_path).startswith(prefix)
+            ]
+        not_done = wait(futures, timeout=timeout)[1] if futures else set()
+        with self._lock:
+            failed = [
+                self._failed.pop(local_path)
+                for local_path in list(self._failed)
+                if os.path.abspath(local_path).startswith(prefix)
+            ]
+        if failed:
+            logger.error(f"{len(failed)} uploads from {local_dir} failed: {failed}")
+        return not not_done and not failed
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def shutdown(self, wait_for_uploads: bool = True):
+        self._executor.shutdown(wait=wait_for_uploads)
+
+    def _forget(self, gcs_uri: str, future):
+        with self._lock:
+            entry = self._pending.get(gcs_uri)
+            if entry is not None and entry[1] is future:
+                del self._pending[gcs_uri]
+
+    def _upload(
+        self,
+        local_path: str,
+        bucket_name: str,
+        dest_path: str,
+        gcs_uri: str,
+        delete_after: bool,
+    ) -> str:
+        for attempt in range(self.max_retries):
+            try:
+                upload_to_gcs(local_path, bucket_name=bucket_name, dest_path=dest_path)
+                break
+            except FileNotFoundError:
+                logger.error(f"Upload source vanished before upload: {local_path}")
+                self._record_failure(local_path, gcs_uri)
+                raise
+            except Exception as e:
+                if attempt + 1 == self.max_retries:
+                    logger.error(
+                        f"Upload of {local_path} to {gcs_uri} failed after {self.max_retries} attempts: {e}"
+                    )
+                    self._record_failure(local_path, gcs_uri)
+                    raise
+                delay = 2**attempt
+                logger.warning(
+                    f"Upload of {local_path} failed ({e}); retrying in {delay}s..."
+                )
+                time.sleep(delay)
+
+        with self._lock:
+            self._failed.pop(local_path, None)  # a re-upload that succeeded
+        if delete_after:
+            try:
+                os.remove(local_path)
+            except OSError:
+                pass
+        return gcs_uri
+
+    def _record_failure(self, local_path: str, gcs_uri: str):
+        # Before the future completes, so a waiter always sees it
+        with self._lock:
+            self._failed[local_path] = gcs_uri
+
+
+upload_manager = UploadManager()
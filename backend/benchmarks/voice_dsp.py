@@ -0,0 +1,74 @@
+"""
+Voice softening (-2 dB, 4 kHz low-pass, normalize): pydub effects vs app.dsp.
+
+Run from backend/:
+    python -m benchmarks.voice_dsp                 # 10, 30 and 60 minute tracks
+    python -m benchmarks.voice_dsp --minutes 10 --skip-pydub
+"""
+
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+from pydub import AudioSegment
+from pydub.effects import low_pass_filter, normalize
+from app.audio_utils import soften_voice
+from app.mixer import to_array
+from config.params import PCM_SAMPLE_RATE, PCM_CHANNELS, PCM_SAMPLE_WIDTH
+
+
+def synthetic_voice(minutes: float) -> AudioSegment:
+    """
+    Noise shaped into syllable-like bursts, in the canonical format.
+    """
+    rng = np.random.default_rng(0)
+    frames = int(minutes * 60 * PCM_SAMPLE_RATE)
+    t = np.arange(frames, dtype=np.float32) / np.float32(PCM_SAMPLE_RATE)
+    mono = rng.standard_normal(frames, dtype=np.float32) * np.float32(3000)
+    mono *= 0.5 + 0.5 * np.sin(np.float32(2 * np.pi * 4) * t) ** 2
+    del t
+    samples = np.empty((frames, PCM_CHANNELS), dtype=np.int16)
+    samples[:] = np.clip(mono, -32768, 32767).astype(np.int16)[:, None]
+    return AudioSegment(
+        data=samples.tobytes(),
+        sample_width=PCM_SAMPLE_WIDTH,
+        frame_rate=PCM_SAMPLE_RATE,
+        channels=PCM_CHANNELS,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--minutes", type=float, nargs="+", default=[10, 30, 60])
+    parser.add_argument(
+        "--skip-pydub", action="store_true", help="only time the NumPy chain"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for minutes in args.minutes:
+            voice = synthetic_voice(minutes)
+            path = os.path.join(tmp, "voice.pcm")
+
+            start = time.perf_counter()
+            out = soften_voice(voice, path)
+            numpy_s = time.perf_counter() - start
+            line = f"{minutes:>5g} min  numpy {numpy_s:7.2f}s"
+
+            if not args.skip_pydub:
+                start = time.perf_counter()
+                ref = normalize(low_pass_filter(voice - 2, cutoff=4000))
+                pydub_s = time.perf_counter() - start
+                diff = np.abs(to_array(ref) - out)
+                line += (
+                    f"  pydub {pydub_s:8.2f}s  speedup {pydub_s / numpy_s:6.1f}x"
+                    f"  max diff {diff.max():.0f} LSB  mean {diff.mean():.2f}"
+                )
+                del ref, diff
+            print(line, flush=True)
+            del out, voice
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,34 @@ BASE_ROOT = os.path.dirname(os.path.dirname(__file__))
 ASSET_ROOT = os.path.join(BASE_ROOT, "assets")
 AUDIO_ROOT = os.path.join(ASSET_ROOT, "audio")
 CACHE_DIR = "/tmp/meditation_cache" if IS_PROD else os.path.join(ASSET_ROOT, "cache")
+RESULT_CACHE_MEMORY_ENTRIES = int(os.getenv("RESULT_CACHE_MEMORY_ENTRIES", "1024"))
+# Bloom filter over remote cache keys, so misses skip the GCS round trip
+CACHE_FILTER_ENABLED = os.getenv("CACHE_FILTER_ENABLED", "true").lower() == "true"
+CACHE_FILTER_ERROR_RATE = float(os.getenv("CACHE_FILTER_ERROR_RATE", "0.01"))
+CACHE_FILTER_REFRESH_SECONDS = int(os.getenv("CACHE_FILTER_REFRESH_SECONDS", "300"))
+# Opt-in: canonicalized cache keys plus MinHash/LSH near-duplicate reuse
+CACHE_SIMILARITY_ENABLED = (
+    os.getenv("CACHE_SIMILARITY_ENABLED", "false").lower() == "true"
+)
+CACHE_SIMILARITY_THRESHOLD = float(os.getenv("CACHE_SIMILARITY_THRESHOLD", "0.9"))
+SIMILARITY_INDEX_PATH = os.path.join(CACHE_DIR, "similarity_index.json")
+# New entries are written to disk in batches, off the request path
+SIMILARITY_FLUSH_SECONDS = int(os.getenv("SIMILARITY_FLUSH_SECONDS", "30"))
+# Cache lifecycle: total size budget for cache/ plus the tts/ and output/ artifacts
+CACHE_MAX_TOTAL_BYTES = int(os.getenv("CACHE_MAX_TOTAL_GB", "20")) * 1024**3
+CACHE_SWEEP_INTERVAL_SECONDS = int(os.getenv("CACHE_SWEEP_INTERVAL_SECONDS", "3600"))
+# Unreferenced artifacts younger than this may belong to a render in flight
+CACHE_ORPHAN_GRACE_SECONDS = int(os.getenv("CACHE_ORPHAN_GRACE_SECONDS", "7200"))
+# Stage checkpoints let a retried request resume; they must expire before
+# the sweeper's orphan grace, while the artifacts they point to still exist
+CHECKPOINT_DIR = os.path.join(CACHE_DIR, "checkpoints")
+CHECKPOINT_TTL_SECONDS = min(
+    int(os.getenv("CHECKPOINT_TTL_SECONDS", "3600")), CACHE_ORPHAN_GRACE_SECONDS
+)
+# Janitor for abandoned per-request temp dirs (minday-*)
+TMP_DISK_QUOTA_BYTES = int(os.getenv("TMP_DISK_QUOTA_MB", "2048")) * 1024 * 1024
+TMP_IDLE_SECONDS = int(os.getenv("TMP_IDLE_SECONDS", "1800"))
+TMP_JANITOR_INTERVAL_SECONDS = int(os.getenv("TMP_JANITOR_INTERVAL_SECONDS", "600"))
 # Audio Directories
 SOUNDSCAPES_DIR = os.path.join(AUDIO_ROOT, "soundscapes")
 CHIMES_DIR = os.path.join(AUDIO_ROOT, "chimes")
@@ -24,6 +52,77 @@ if IS_PROD:
 else:
     OUTPUT_DIR = os.path.join(AUDIO_ROOT, "output")
 
+# Asset cache (decoded audio assets kept across requests)
+ASSET_CACHE_DIR = (
+    "/tmp/minday_assets" if IS_PROD else os.path.join(ASSET_ROOT, "asset_cache")
+)
+ASSET_CACHE_MAX_BYTES = int(os.getenv("ASSET_CACHE_MAX_MB", "512")) * 1024 * 1024
+ASSET_REVALIDATE_SECONDS = int(os.getenv("ASSET_REVALIDATE_SECONDS", "300"))
+ASSET_PRELOAD = os.getenv("ASSET_PRELOAD", "true").lower() == "true"
+
+# Canonical PCM format (compiled asset store and mixing)
+PCM_SAMPLE_RATE = 44100
+PCM_CHANNELS = 2
+PCM_SAMPLE_WIDTH = 2  # bytes per sample (int16)
+PCM_STORE_DIR = os.getenv(
+    "PCM_STORE_DIR",
+    "/tmp/minday_pcm" if IS_PROD else os.path.join(ASSET_ROOT, "pcm_store"),
+)
+PCM_STORE_ENABLED = os.getenv("PCM_STORE_ENABLED", "true").lower() == "true"
+
+# Precomputed asset metadata (loudness, peak, chime tails, gains)
+ASSET_INDEX_FILENAME = "asset_index.json"
+ASSET_INDEX_PATH = os.path.join(AUDIO_ROOT, ASSET_INDEX_FILENAME)
+INTERCHIME_VOLUME_DBFS = -40.0
+
+# Background loop tiling
+LOOP_CROSSFADE_MS = 300
+
+# Pre-rendered background beds (intro mix + loop cell) per emotion profile
+BED_CACHE_DIR = os.getenv(
+    "BED_CACHE_DIR",
+    "/tmp/minday_beds" if IS_PROD else os.path.join(ASSET_ROOT, "bed_cache"),
+)
+BED_PRELOAD = os.getenv("BED_PRELOAD", "true").lower() == "true"
+
+# Rendering: "stream" renders the timeline block by block into the encoder,
+# "buffer" renders the whole session into one array first
+RENDER_MODE = os.getenv("RENDER_MODE", "stream").lower()
+RENDER_BLOCK_FRAMES = int(os.getenv("RENDER_BLOCK_FRAMES", "65536"))
+# Sessions at least RENDER_PARALLEL_MIN_SECONDS long are rendered in time
+# segments across RENDER_WORKERS processes per server process (1 = serial).
+# Unset (0), the CPUs are split between the WEB_CONCURRENCY uvicorn workers
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "0")) or max(
+    1, (os.cpu_count() or 1) // WEB_CONCURRENCY
+)
+RENDER_PARALLEL_MIN_SECONDS = int(os.getenv("RENDER_PARALLEL_MIN_SECONDS", "300"))
+
+# Encoded output: mp3, opus or aac; empty bitrate uses the format's default
+OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT", "mp3").lower()
+OUTPUT_BITRATE = os.getenv("OUTPUT_BITRATE", "")
+# "file" writes one encoded file; "hls" writes AAC segments plus a playlist,
+# published as they are encoded, and returns once HLS_READY_SEGMENTS exist
+OUTPUT_MODE = os.getenv("OUTPUT_MODE", "file").lower()
+HLS_SEGMENT_SECONDS = int(os.getenv("HLS_SEGMENT_SECONDS", "6"))
+HLS_READY_SEGMENTS = int(os.getenv("HLS_READY_SEGMENTS", "2"))
+
+# Progress events (GET /meditate/{job_id}/events): events kept per job for
+# late subscribers, and how long an idle job's events are kept
+PROGRESS_HISTORY_EVENTS = int(os.getenv("PROGRESS_HISTORY_EVENTS", "256"))
+PROGRESS_RETENTION_SECONDS = int(os.getenv("PROGRESS_RETENTION_SECONDS", "600"))
+PROGRESS_HEARTBEAT_SECONDS = int(os.getenv("PROGRESS_HEARTBEAT_SECONDS", "15"))
+
+# Pre-generated meditation library (python -m app.library builds it): served
+# when the personalized render exceeds the latency budget (0 = no budget) or
+# fails upstream
+LIBRARY_ENABLED = os.getenv("LIBRARY_ENABLED", "false").lower() == "true"
+LIBRARY_DIR = os.path.join(AUDIO_ROOT, "library")
+LIBRARY_DURATIONS = tuple(
+    int(m) for m in os.getenv("LIBRARY_DURATIONS", "5,10,15,20,30").split(",")
+)
+LIBRARY_LATENCY_BUDGET_SECONDS = float(os.getenv("LIBRARY_LATENCY_BUDGET_SECONDS", "0"))
+
 # Logging
 LOGS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "logs")
 
@@ -44,6 +143,27 @@ GCP_PROJECT_ID = os.getenv("PROJECT_ID", "minday-project")
 GCP_AUDIO_BUCKET = os.getenv("AUDIO_BUCKET", "minday-audio")
 GCP_AUDIO_BUCKET_REGION = os.getenv("AUDIO_BUCKET_REGION", "northamerica-south1")
 
+## Object storage
+# "gcs" for Google Cloud Storage, "local" to mirror buckets under LOCAL_STORAGE_ROOT
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "gcs")
+LOCAL_STORAGE_ROOT = os.getenv(
+    "LOCAL_STORAGE_ROOT", os.path.join(ASSET_ROOT, "storage")
+)
+GCS_HTTP_POOL_SIZE = int(os.getenv("GCS_HTTP_POOL_SIZE", "32"))
+GCS_HTTP_MAX_RETRIES = int(os.getenv("GCS_HTTP_MAX_RETRIES", "3"))
+
+# Signed URLs are reused until less than this much lifetime remains
+SIGNED_URL_MIN_REMAINING_SECONDS = int(
+    os.getenv("SIGNED_URL_MIN_REMAINING_SECONDS", "900")
+)
+SIGNED_URL_CACHE_ENTRIES = int(os.getenv("SIGNED_URL_CACHE_ENTRIES", "4096"))
+
+# Background uploads of pipeline artifacts
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "8"))
+UPLOAD_MAX_RETRIES = int(os.getenv("UPLOAD_MAX_RETRIES", "5"))
+UPLOAD_CHUNK_SIZE_BYTES = 8 * 1024 * 1024  # multiple of 256 KB, as GCS requires
+UPLOAD_RESUMABLE_THRESHOLD_BYTES = 8 * 1024 * 1024
+
 ## Amazon Web Services
 AWS_ACCESS_KEY_ID = get_secret("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = get_secret("AWS_SECRET_ACCESS_KEY")
@@ -1,75 +1,351 @@
+"""
+Batch renderer: run the full meditation pipeline over a JSONL file of requests.
+
+One request per line, with the /meditate fields plus optional "id",
+"emotion_summary" (skips scoring) and "library_key" (publishes the result to
+the fallback library). Run from backend/:
+    python main.py requests.jsonl
+    python main.py requests.jsonl --cache --workers 4 --script-concurrency 2
+
+Results (status, paths and per-stage timings) are appended to the manifest as
+each item finishes; rerunning with the same manifest skips finished items.
+"""
+
+import os
+import re
+import sys
+import json
+import time
 import asyncio
-from app.emotion_scoring import emotion_classification
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pydantic import ValidationError
+from api.schemas import MeditationRequest
+from app.logger import logger
+from app.cache_utils import (
+    cacheable,
+    generate_cache_key,
+    index_for_similarity,
+    save_to_cache,
+    similarity_index,
+)
+from app.cloud_utils import clean_up_tmp_folder, resolve_asset
+from app.hls import wait_for_render
+from app.janitor import claim
+from app.library import meditation_library
+from app.parallel_render import parallel_renderer
 from app.script_generator import generate_prompt, generate_meditation_script
-from app.tts_generator import generate_tts, align_audio_text
 from app.sound_engineer import sound_engineer_pipeline
+from app.tts_generator import generate_tts, align_audio_text
+from app.upload_manager import upload_manager
+from config.params import RENDER_WORKERS
 
+# Requests in flight against each upstream service
+SCRIPT_CONCURRENCY = 4  # Gemini
+TTS_CONCURRENCY = 4  # OpenAI
 
-async def main():
-    # --- Step 0: User inputs (mocked for now) ---
-    journal_entry = (
-        "Today I felt overwhelmed by meetings but also hopeful for the future."
-    )
-    meditation_type = "self-love"
-    spiritual_path = "Buddhist"
-    duration_minutes = 3
-
-    print("✅ Starting full meditation generation...")
-
-    # --- Step 1: Analyze emotions ---
-    print("🔍 Scoring emotions...")
-    emotion_summary = emotion_classification(journal_entry)
-    print(f"Emotion scores: {emotion_summary}")
-
-    # --- Step 2: Generate meditation prompt ---
-    print("📝 Building meditation prompt...")
-    prompt = generate_prompt(
-        journal_entry=journal_entry,
-        emotion_scores=emotion_summary,
-        duration_minutes=duration_minutes,
-        spiritual_path=spiritual_path,
-        meditation_type=meditation_type,
-        mode="tts",
-    )
 
-    # --- Step 3: Generate meditation script and save it ---
-    print("🎙️ Generating meditation script...")
-    script_path = await generate_meditation_script(
-        prompt=prompt,
-        time=duration_minutes,
-    )
+def read_requests(path: str) -> list:
+    items = []
+    with open(path, "r") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                raw = json.loads(line)
+                request = MeditationRequest(**raw)
+            except (json.JSONDecodeError, ValidationError) as e:
+                raise ValueError(f"{path}:{line_no}: invalid request: {e}")
+            cache_key = generate_cache_key(
+                request.journal_entry, request.duration_minutes, request.meditation_type
+            )
+            items.append(
+                {
+                    "id": str(raw.get("id") or cache_key),
+                    "request": request,
+                    "cache_key": cache_key,
+                    "emotion_summary": raw.get("emotion_summary"),
+                    "library_key": raw.get("library_key"),
+                }
+            )
+    return items
 
-    # --- Step 4: Load the saved script ---
-    with open(script_path, "r") as f:
-        script_text = f.read()
-
-    # --- Step 5: Generate TTS from script ---
-    print("🔊 Generating TTS audio...")
-    tts_path = generate_tts(script_text)
-
-    # --- Step 6: Align TTS audio with script text ---
-    print("🧭 Aligning audio and text...")
-    alignment_path = tts_path.replace(".wav", ".json")
-    align_audio_text(
-        audio_path=tts_path,
-        text_path=script_path,
-        output_json_path=alignment_path,
-    )
 
-    # --- Step 7: Sound Engineer final meditation mix ---
-    print("🎼 Sound engineering final meditation...")
-    output_filename = "final_meditation_mix.wav"
+def finished_ids(manifest_path: str) -> set:
+    """
+    Ids the manifest records as rendered; failed items are retried.
+    """
+    done = set()
+    try:
+        with open(manifest_path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn last line of an interrupted run
+                if record.get("status") == "ok":
+                    done.add(record["id"])
+    except FileNotFoundError:
+        pass
+    return done
+
 
-    final_mix_path = sound_engineer_pipeline(
-        tts_path=tts_path,
-        alignment_json_path=alignment_path,
+def _init_worker():
+    # Batch parallelism is across items; don't nest a render pool per worker
+    parallel_renderer.max_workers = 1
+
+
+def align_and_mix(
+    tts_local: str,
+    script_local: str,
+    emotion_summary: dict,
+    output_filename: str,
+    tmp_root: str,
+) -> dict:
+    """
+    Worker side: align the voice to the script and render the final mix.
+    """
+    timings = {}
+    start = time.perf_counter()
+    alignment_path = align_audio_text(tts_local, script_local, tmp_root=tmp_root)
+    timings["align"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    final_audio_path = sound_engineer_pipeline(
+        tts_path=tts_local,
+        alignment_json_path=resolve_asset(alignment_path),
         emotion_summary=emotion_summary,
         output_filename=output_filename,
+        tmp_root=tmp_root,
+    )
+    if not wait_for_render(final_audio_path):
+        raise RuntimeError(f"Render of {final_audio_path} failed")
+    timings["mix"] = time.perf_counter() - start
+
+    # This process queued the alignment upload; it must land before we exit
+    if not upload_manager.wait_for_dir(tmp_root):
+        raise RuntimeError("Alignment upload failed")
+    return {
+        "alignment_path": alignment_path,
+        "final_audio_path": final_audio_path,
+        "timings": timings,
+    }
+
+
+class BatchRenderer:
+    """
+    Runs items through the pipeline concurrently: scripts and TTS are bounded
+    per upstream service, alignment and mixing run on a process pool.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        script_concurrency: int,
+        tts_concurrency: int,
+        cache: bool = False,
+    ):
+        self.workers = workers
+        self.cache = cache
+        self._script_slots = asyncio.Semaphore(script_concurrency)
+        self._tts_slots = asyncio.Semaphore(tts_concurrency)
+        # The emotion model is shared; score one entry at a time
+        self._emotion_slot = asyncio.Semaphore(1)
+        # Items started at once, so temp dirs do not pile up ahead of the pool
+        self._in_flight = asyncio.Semaphore(
+            script_concurrency + tts_concurrency + workers
+        )
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=get_context("spawn"),
+            initializer=_init_worker,
+        )
+
+    async def run(self, items: list, manifest_path: str) -> dict:
+        done = finished_ids(manifest_path)
+        pending, seen = [], set(done)
+        for item in items:
+            if item["id"] not in seen:
+                seen.add(item["id"])
+                pending.append(item)
+        logger.info(
+            f"{len(items)} requests, {len(items) - len(pending)} already rendered, "
+            f"{len(pending)} to go"
+        )
+
+        counts = {"ok": 0, "error": 0, "skipped": len(items) - len(pending)}
+        with open(manifest_path, "a") as manifest:
+
+            async def run_one(item: dict):
+                record = await self.render(item)
+                counts[record["status"]] += 1
+                manifest.write(json.dumps(record) + "\n")
+                manifest.flush()
+                os.fsync(manifest.fileno())
+                logger.info(
+                    f"[{sum(counts.values())}/{len(items)}] {item['id']}: "
+                    f"{record['status']} in {record['timings'].get('total', 0):.1f}s"
+                )
+
+            try:
+                await asyncio.gather(*(run_one(item) for item in pending))
+            finally:
+                self._pool.shutdown(cancel_futures=True)
+        return counts
+
+    async def render(self, item: dict) -> dict:
+        record = {"id": item["id"], "cache_key": item["cache_key"], "timings": {}}
+        async with self._in_flight:
+            tmp_root = claim(tempfile.mkdtemp(prefix="minday-batch-"))
+            start = time.perf_counter()
+            try:
+                record["result"] = await self._pipeline(item, tmp_root, record)
+                record["status"] = "ok"
+            except Exception as e:
+                logger.error(f"Batch item {item['id']} failed: {e}", exc_info=True)
+                record["status"] = "error"
+                record["error"] = str(e)
+            finally:
+                await asyncio.to_thread(upload_manager.wait_for_dir, tmp_root)
+                clean_up_tmp_folder(tmp_root)
+                record["timings"]["total"] = time.perf_counter() - start
+        record["timings"] = {k: round(v, 3) for k, v in record["timings"].items()}
+        record["finished_at"] = time.time()
+        return record
+
+    async def _pipeline(self, item: dict, tmp_root: str, record: dict) -> dict:
+        # Imported here: loading the model in every pool worker is wasted
+        from app.emotion_scoring import emotion_classification
+
+        request = item["request"]
+        timings = record["timings"]
+
+        emotion_summary = item["emotion_summary"]
+        if emotion_summary is None:
+            start = time.perf_counter()
+            async with self._emotion_slot:
+                emotion_summary = await asyncio.to_thread(
+                    emotion_classification, request.journal_entry
+                )
+            timings["emotion"] = time.perf_counter() - start
+
+        prompt = generate_prompt(
+            journal_entry=request.journal_entry,
+            emotion_scores=emotion_summary,
+            duration_minutes=request.duration_minutes,
+            spiritual_path="Buddhist",
+            meditation_type=request.meditation_type,
+            mode=request.mode,
+        )
+        async with self._script_slots:
+            start = time.perf_counter()
+            script_path = await generate_meditation_script(
+                prompt=prompt, time=request.duration_minutes, tmp_root=tmp_root
+            )
+            timings["script"] = time.perf_counter() - start
+        script_local = resolve_asset(script_path, tmp_root)
+
+        async with self._tts_slots:
+            start = time.perf_counter()
+            tts_path = await asyncio.to_thread(
+                generate_tts, script_local, tmp_root=tmp_root
+            )
+            timings["tts"] = time.perf_counter() - start
+        tts_local = resolve_asset(tts_path, tmp_root)
+
+        rendered = await asyncio.get_running_loop().run_in_executor(
+            self._pool,
+            align_and_mix,
+            tts_local,
+            script_local,
+            emotion_summary,
+            f"final_{re.sub(r'[^\w.-]', '_', item['id'])}.mp3",
+            tmp_root,
+        )
+        timings.update(rendered["timings"])
+
+        result = {
+            "final_audio_path": rendered["final_audio_path"],
+            "emotion_summary": emotion_summary,
+            "script_path": script_path,
+            "tts_path": tts_path,
+            "alignment_path": rendered["alignment_path"],
+        }
+        # Published results must not reference artifacts that never landed
+        if not await asyncio.to_thread(upload_manager.wait_for_dir, tmp_root):
+            raise RuntimeError("Artifact uploads failed")
+        await asyncio.to_thread(self._publish, item, result, tmp_root)
+        return result
+
+    def _publish(self, item: dict, result: dict, tmp_root: str):
+        if self.cache:
+            request = item["request"]
+            save_to_cache(item["cache_key"], cacheable(result))
+            index_for_similarity(
+                item["cache_key"],
+                request.journal_entry,
+                request.duration_minutes,
+                request.meditation_type,
+                result["emotion_summary"],
+            )
+        if item["library_key"]:
+            meditation_library.add(item["library_key"], result, tmp_root)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("requests", help="JSONL file, one request per line")
+    parser.add_argument(
+        "--manifest",
+        help="results manifest (JSONL), also the resume checkpoint "
+        "(default: <requests>.results.jsonl)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=RENDER_WORKERS,
+        help="processes for alignment and mixing",
+    )
+    parser.add_argument("--script-concurrency", type=int, default=SCRIPT_CONCURRENCY)
+    parser.add_argument("--tts-concurrency", type=int, default=TTS_CONCURRENCY)
+    parser.add_argument(
+        "--cache", action="store_true", help="save results to the result cache"
     )
+    args = parser.parse_args()
 
-    print("✅ Meditation generation complete!")
-    print(f"Final meditation saved at: {final_mix_path}")
+    try:
+        items = read_requests(args.requests)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    manifest_path = (
+        args.manifest or f"{os.path.splitext(args.requests)[0]}.results.jsonl"
+    )
+
+    async def run() -> dict:
+        renderer = BatchRenderer(
+            workers=args.workers,
+            script_concurrency=args.script_concurrency,
+            tts_concurrency=args.tts_concurrency,
+            cache=args.cache,
+        )
+        if any(item["library_key"] for item in items):
+            await asyncio.to_thread(meditation_library.load)
+        return await renderer.run(items, manifest_path)
+
+    start = time.perf_counter()
+    counts = asyncio.run(run())
+
+    # Flush queued uploads (artifacts, cache entries) before exiting
+    upload_manager.shutdown()
+    similarity_index.flush()
+    print(
+        f"{counts['ok']} rendered, {counts['error']} failed, {counts['skipped']} "
+        f"already done in {time.perf_counter() - start:.1f}s; manifest: {manifest_path}"
+    )
+    sys.exit(1 if counts["error"] else 0)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
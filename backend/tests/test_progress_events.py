@@ -0,0 +1,44 @@
+import asyncio
+import pytest
+
+# The API module pulls in the model and upstream clients
+main = pytest.importorskip("api.main", reason="needs the backend dependencies")
+from api.schemas import MeditationRequest
+from app.progress import progress
+
+
+def test_upgrade_reaches_subscribers_after_library_fallback(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "render_pending", lambda path: False)
+    monkeypatch.setattr(main, "cache_after_uploads", lambda *args: None)
+    body = MeditationRequest(
+        journal_entry="A long day.", duration_minutes=5, meditation_type="evening"
+    )
+    result = {
+        "final_signed_url": "https://example.com/final.mp3",
+        "final_audio_path": "gs://bucket/output/final.mp3",
+        "emotion_summary": {"neutral": 1.0},
+        "script_path": "gs://bucket/script.txt",
+        "tts_path": "gs://bucket/tts/voice.wav",
+        "alignment_path": "gs://bucket/alignment.json",
+    }
+
+    async def scenario() -> list:
+        job_id = "fallback-then-upgrade"
+        # meditate() serves the fallback inside the job scope, then returns
+        with progress.job_scope(job_id):
+            progress.emit("fallback", fallback=True)
+        stages = []
+
+        async def listen():
+            async for event in progress.subscribe(job_id):
+                stages.append(event["stage"])
+
+        listener = asyncio.create_task(listen())
+        engine = asyncio.get_running_loop().create_future()
+        engine.set_result(result)
+        # The background task that outlives the request
+        await main.upgrade_when_rendered(engine, "key", body, job_id, str(tmp_path))
+        await asyncio.wait_for(listener, timeout=5)
+        return stages
+
+    assert asyncio.run(scenario()) == ["fallback", "upgrade", "done"]
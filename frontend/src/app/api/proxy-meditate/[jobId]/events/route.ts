@@ -0,0 +1,38 @@
+import type { NextRequest } from "next/server";
+import { NextResponse } from "next/server";
+
+// Progress events are streamed, never cached
+export const dynamic = "force-dynamic";
+
+export async function GET(
+  request: NextRequest,
+  { params }: { params: Promise<{ jobId: string }> }
+) {
+  const { jobId } = await params;
+
+  // Open the FastAPI event stream, injecting the real API key
+  const fastApiRes = await fetch(
+    `${process.env.NEXT_PUBLIC_API_BASE_URL}/meditate/${encodeURIComponent(jobId)}/events`,
+    {
+      headers: { "x-api-key": process.env.BACKEND_API_KEY! },
+      signal: request.signal,
+      cache: "no-store",
+    }
+  );
+
+  if (!fastApiRes.ok || !fastApiRes.body) {
+    return new NextResponse(await fastApiRes.text(), {
+      status: fastApiRes.status,
+    });
+  }
+
+  // Pass the stream through as it arrives, so EventSource sees each event
+  return new NextResponse(fastApiRes.body, {
+    status: 200,
+    headers: {
+      "Content-Type": "text/event-stream",
+      "Cache-Control": "no-cache, no-transform",
+      Connection: "keep-alive",
+    },
+  });
+}